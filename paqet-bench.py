@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Paqet - Benchmark harness for the web dashboard and the decoy site
+Starts each server on localhost with stub systemctl / journalctl / iptables-save executables
+(realistic output for N fake tunnels) first on PATH, drives concurrent load at each endpoint
+and reports requests/s, p50/p95/p99 latency, stub calls, RSS and open fds as JSON.
+Python 3 stdlib only, no root needed.
+  python3 paqet-bench.py [--target all|dashboard|decoy] [--tunnels 30] [--concurrency 16]
+    [--duration 5] [--endpoints /api/status,/api/state] [--output result.json]
+    [--baseline old.json] [--threshold 20]
+With --baseline, exits 1 if any endpoint's requests/s dropped or p95 / RSS grew by more than
+--threshold percent.
+"""
+import asyncio
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TUNNELS = 30
+DEFAULT_CONCURRENCY = 16
+DEFAULT_DURATION = 5.0
+DEFAULT_THRESHOLD = 20.0
+DASHBOARD_PORT = 18980
+DECOY_PORT = 18981
+JOURNAL_LINES = 2000
+
+DASHBOARD_ENDPOINTS = (
+    "/login", "/dashboard", "/api/status", "/api/state", "/api/logs?service=paqet-t1&lines=100",
+    "/api/logs?service=paqet-t1&lines=100&format=json&priority=warning", "/api/metrics",
+    "/metrics", "/api/history", "/api/probes",
+)
+DECOY_ENDPOINTS = ("/", "/login", "/index.html", "/no/such/page")
+
+STUB_SYSTEMCTL = """#!/bin/sh
+echo systemctl >> "{dir}/calls.log"
+case "$1" in
+  show) cat "{dir}/show.txt" ;;
+  list-units|list-unit-files) cat "{dir}/list.txt" ;;
+  is-active) echo active ;;
+  is-enabled) echo enabled ;;
+  start|stop|restart|reload) sleep 0.2 ;;
+esac
+exit 0
+"""
+
+STUB_JOURNALCTL = """#!/bin/sh
+echo journalctl >> "{dir}/calls.log"
+json=0; follow=0
+for a in "$@"; do
+  case "$a" in
+    json) json=1 ;;
+    -f|--follow) follow=1 ;;
+  esac
+done
+if [ $json = 1 ]; then cat "{dir}/journal.json"; else cat "{dir}/journal.txt"; fi
+if [ $follow = 1 ]; then
+  while sleep 1; do tail -n 1 "{dir}/journal.json"; done
+fi
+exit 0
+"""
+
+STUB_IPTABLES_SAVE = """#!/bin/sh
+echo iptables-save >> "{dir}/calls.log"
+cat "{dir}/iptables.txt"
+"""
+
+
+def write_stubs(root, tunnels):
+    """Stub executables plus the canned output they print, and N tunnel configs."""
+    bin_dir = os.path.join(root, "bin")
+    cfg_dir = os.path.join(root, "etc")
+    os.makedirs(bin_dir)
+    os.makedirs(cfg_dir)
+    show, listing, rules = [], [], ["*raw"]
+    for i in range(1, tunnels + 1):
+        failed = i % 10 == 0
+        show.append("\n".join([
+            "Id=paqet-t{}.service".format(i), "LoadState=loaded",
+            "ActiveState={}".format("failed" if failed else "active"),
+            "SubState={}".format("failed" if failed else "running"),
+            "MainPID={}".format(0 if failed else 1000 + i),
+            "MemoryCurrent={}".format(12000000 + i * 40960),
+            "CPUUsageNSec={}".format(i * 1700000000),
+            "NRestarts={}".format(i % 4),
+            "ActiveEnterTimestamp=Sun 2026-10-18 08:00:00 UTC",
+            "ActiveEnterTimestampMonotonic=1000000",
+        ]))
+        listing.append("paqet-t{0}.service loaded {1} {2} Paqet Tunnel (t{0})".format(
+            i, "failed" if failed else "active", "failed" if failed else "running"))
+        port = 20000 + i
+        if i % 2:
+            cfg = ('role: "server"\nlisten:\n  addr: ":{}"\ntransport:\n  protocol: "kcp"\n  conn: 2\n'
+                   '  kcp:\n    mode: "fast"\n    mtu: 1350\n'.format(port))
+        else:
+            cfg = ('role: "client"\nserver:\n  addr: "203.0.113.{}:{}"\nforward:\n'
+                   '  - listen: "0.0.0.0:{}"\n    target: "127.0.0.1:{}"\n    protocol: "tcp"\n'
+                   'transport:\n  protocol: "kcp"\n  conn: 2\n  kcp:\n    mode: "fast"\n    mtu: 1350\n'
+                   .format(i % 250 + 1, port - 1, 30000 + i, 30000 + i))
+        with open(os.path.join(cfg_dir, "t{}.yaml".format(i)), "w") as f:
+            f.write(cfg)
+        rules.append("[{}:{}] -A PREROUTING -p tcp -m tcp --dport {} -j NOTRACK".format(i * 100, i * 150000, port))
+        rules.append("[{}:{}] -A OUTPUT -p tcp -m tcp --sport {} -j NOTRACK".format(i * 90, i * 120000, port))
+    rules.append("COMMIT")
+
+    journal_json, journal_txt = [], []
+    for n in range(1, JOURNAL_LINES + 1):
+        msg = "stream {} closed: i/o timeout".format(n) if n % 25 == 0 else "kcp session {} ok rtt={}ms".format(n, 40 + n % 30)
+        journal_json.append(json.dumps({
+            "__CURSOR": "s=bench;i={:x}".format(n), "__REALTIME_TIMESTAMP": str(1792300000000000 + n * 1000000),
+            "PRIORITY": "3" if n % 25 == 0 else "6", "SYSLOG_IDENTIFIER": "paqet", "_PID": "1001",
+            "_SYSTEMD_UNIT": "paqet-t1.service", "MESSAGE": msg,
+        }))
+        journal_txt.append("2026-10-18T08:{:02d}:{:02d}+0000 host paqet[1001]: {}".format(n // 60 % 60, n % 60, msg))
+
+    files = {
+        "show.txt": "\n\n".join(show) + "\n",
+        "list.txt": "\n".join(listing) + "\n",
+        "iptables.txt": "\n".join(rules) + "\n",
+        "journal.json": "\n".join(journal_json) + "\n",
+        "journal.txt": "\n".join(journal_txt) + "\n",
+        "calls.log": "",
+    }
+    for name, content in files.items():
+        with open(os.path.join(root, name), "w") as f:
+            f.write(content)
+    for name, template in (("systemctl", STUB_SYSTEMCTL), ("journalctl", STUB_JOURNALCTL),
+                           ("iptables-save", STUB_IPTABLES_SAVE)):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(template.format(dir=root))
+        os.chmod(path, 0o755)
+    return bin_dir, cfg_dir
+
+
+def stub_calls(root):
+    try:
+        with open(os.path.join(root, "calls.log")) as f:
+            return sum(1 for _ in f)
+    except OSError:
+        return 0
+
+
+def wait_for_port(port, proc, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+class ProcessSampler:
+    """Samples RSS and open fds of a server process from /proc while the load runs."""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.rss_peak = self.fds_peak = 0
+        self.rss_last = self.fds_last = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        try:
+            with open("/proc/{}/status".format(self.pid)) as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        self.rss_last = int(line.split()[1])
+            self.fds_last = len(os.listdir("/proc/{}/fd".format(self.pid)))
+        except (OSError, ValueError):
+            return
+        self.rss_peak = max(self.rss_peak, self.rss_last)
+        self.fds_peak = max(self.fds_peak, self.fds_last)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        return {"rss_kb_peak": self.rss_peak, "rss_kb_end": self.rss_last,
+                "fds_peak": self.fds_peak, "fds_end": self.fds_last}
+
+
+async def fetch(port, path, headers, conn):
+    """One GET over a reused connection (conn = [reader, writer] or [None, None]).
+    Returns the status code; reconnects when the server closed the previous connection."""
+    if conn[0] is None:
+        conn[0], conn[1] = await asyncio.open_connection("127.0.0.1", port)
+    reader, writer = conn
+    writer.write("GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\n{}\r\n".format(path, headers).encode("latin-1"))
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    fields = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        fields[name.strip().lower()] = value.strip()
+    close = lines[0].startswith("HTTP/1.0") or fields.get("connection", "").lower() == "close"
+    if "content-length" in fields:
+        await reader.readexactly(int(fields["content-length"]))
+    elif status not in (204, 304):
+        await reader.read()  # body ends at EOF
+        close = True
+    if close:
+        writer.close()
+        conn[0] = conn[1] = None
+    return status
+
+
+async def drive(port, path, headers, concurrency, duration):
+    latencies, errors, statuses = [], 0, {}
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal errors
+        conn = [None, None]
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(fetch(port, path, headers, conn), 30)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+                errors += 1
+                if conn[1] is not None:
+                    conn[1].close()
+                conn[0] = conn[1] = None
+                await asyncio.sleep(0.01)
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+        if conn[1] is not None:
+            conn[1].close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, statuses, time.monotonic() - started
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[idx] * 1000, 3)
+
+
+def bench_endpoint(port, path, headers, concurrency, duration, root):
+    calls_before = stub_calls(root)
+    latencies, errors, statuses, elapsed = asyncio.run(drive(port, path, headers, concurrency, duration))
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": percentile(latencies, 1.0),
+        "stub_calls": stub_calls(root) - calls_before,
+    }
+
+
+def login_cookie(port):
+    """Session cookie for /dashboard (any user, default password)."""
+    body = "username=bench&password=paqet"
+    with socket.create_connection(("127.0.0.1", port), 5) as s:
+        s.sendall("POST /login HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/x-www-form-urlencoded\r\n"
+                  "Content-Length: {}\r\nConnection: close\r\n\r\n{}".format(len(body), body).encode("ascii"))
+        data = b""
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    for line in data.split(b"\r\n\r\n", 1)[0].decode("latin-1").split("\r\n"):
+        if line.lower().startswith("set-cookie:"):
+            return line.split(":", 1)[1].split(";", 1)[0].strip()
+    return ""
+
+
+def run_target(target, opts, root, bin_dir, cfg_dir):
+    script = os.path.join(HERE, "paqet-{}.py".format(target))
+    port = DASHBOARD_PORT if target == "dashboard" else DECOY_PORT
+    env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""),
+               PAQET_CONFIG_DIR=cfg_dir, PAQET_HISTORY_DIR=os.path.join(root, "history"),
+               PAQET_PROBE_INTERVAL="0", PAQET_DECOY_RATE="0",
+               PAQET_DECOY_STATS=os.path.join(root, "decoy.json"))
+    proc = subprocess.Popen([sys.executable, script, "--port", str(port), "--bind", "127.0.0.1"],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        if not wait_for_port(port, proc):
+            err = proc.stderr.read().decode("utf-8", "replace") if proc.poll() is not None else "timeout"
+            return {"error": "server did not start: " + err.strip()[-500:]}
+        time.sleep(0.5)  # let background refreshers take their first sample
+        endpoints = opts["endpoints"] or (DASHBOARD_ENDPOINTS if target == "dashboard" else DECOY_ENDPOINTS)
+        headers = ""
+        if target == "dashboard":
+            headers = "Cookie: {}\r\n".format(login_cookie(port))
+        else:
+            headers = "Accept-Encoding: gzip\r\n"
+        sampler = ProcessSampler(proc.pid)
+        sampler.start()
+        results = {}
+        for path in endpoints:
+            print("  {} {} ...".format(target, path), file=sys.stderr, flush=True)
+            results[path] = bench_endpoint(port, path, headers, opts["concurrency"], opts["duration"], root)
+        results["_process"] = sampler.stop()
+        return results
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def compare(current, baseline, threshold):
+    """Regressions of current vs baseline, as printable strings."""
+    problems = []
+    limit = threshold / 100.0
+    for target, endpoints in current.get("results", {}).items():
+        old_target = baseline.get("results", {}).get(target, {})
+        for path, now in endpoints.items():
+            old = old_target.get(path)
+            if not old or "error" in now:
+                continue
+            if path == "_process":
+                if old.get("rss_kb_peak") and now["rss_kb_peak"] > old["rss_kb_peak"] * (1 + limit):
+                    problems.append("{} RSS peak {} KB -> {} KB".format(target, old["rss_kb_peak"], now["rss_kb_peak"]))
+                continue
+            if old.get("rps") and now["rps"] < old["rps"] * (1 - limit):
+                problems.append("{} {} rps {} -> {}".format(target, path, old["rps"], now["rps"]))
+            if old.get("p95_ms") and now["p95_ms"] is not None and now["p95_ms"] > old["p95_ms"] * (1 + limit):
+                problems.append("{} {} p95 {} ms -> {} ms".format(target, path, old["p95_ms"], now["p95_ms"]))
+    return problems
+
+
+def print_table(report, baseline=None):
+    for target, endpoints in report["results"].items():
+        print("\n{}".format(target), file=sys.stderr)
+        if "error" in endpoints:
+            print("  " + endpoints["error"], file=sys.stderr)
+            continue
+        old_target = (baseline or {}).get("results", {}).get(target, {})
+        print("  {:<62} {:>9} {:>9} {:>9} {:>9} {:>6} {:>6}".format(
+            "endpoint", "rps", "p50 ms", "p95 ms", "p99 ms", "errors", "forks"), file=sys.stderr)
+        for path, r in endpoints.items():
+            if path == "_process":
+                continue
+            rps = str(r["rps"])
+            old = old_target.get(path)
+            if old and old.get("rps"):
+                rps += " ({:+.0f}%)".format((r["rps"] / old["rps"] - 1) * 100)
+            print("  {:<62} {:>9} {:>9} {:>9} {:>9} {:>6} {:>6}".format(
+                path[:62], rps, r["p50_ms"], r["p95_ms"], r["p99_ms"], r["errors"], r["stub_calls"]), file=sys.stderr)
+        p = endpoints.get("_process", {})
+        print("  RSS peak {} KB, end {} KB; fds peak {}, end {}".format(
+            p.get("rss_kb_peak"), p.get("rss_kb_end"), p.get("fds_peak"), p.get("fds_end")), file=sys.stderr)
+
+
+def main():
+    opts = {"target": "all", "tunnels": DEFAULT_TUNNELS, "concurrency": DEFAULT_CONCURRENCY,
+            "duration": DEFAULT_DURATION, "endpoints": None, "output": None, "baseline": None,
+            "threshold": DEFAULT_THRESHOLD}
+    for i, arg in enumerate(sys.argv[1:]):
+        value = sys.argv[i + 2] if i + 2 < len(sys.argv) else None
+        if value is None:
+            continue
+        if arg == "--target":
+            opts["target"] = value
+        elif arg == "--tunnels":
+            opts["tunnels"] = max(1, int(value))
+        elif arg == "--concurrency":
+            opts["concurrency"] = max(1, int(value))
+        elif arg == "--duration":
+            opts["duration"] = max(0.5, float(value))
+        elif arg == "--endpoints":
+            opts["endpoints"] = [p.strip() for p in value.split(",") if p.strip()]
+        elif arg == "--output":
+            opts["output"] = value
+        elif arg == "--baseline":
+            opts["baseline"] = value
+        elif arg == "--threshold":
+            opts["threshold"] = float(value)
+
+    targets = ("dashboard", "decoy") if opts["target"] == "all" else (opts["target"],)
+    for target in targets:
+        if target not in ("dashboard", "decoy") or not os.path.isfile(os.path.join(HERE, "paqet-{}.py".format(target))):
+            print("Unknown target or script missing: {}".format(target), file=sys.stderr)
+            sys.exit(2)
+
+    baseline = None
+    if opts["baseline"]:
+        try:
+            with open(opts["baseline"]) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Cannot read baseline {}: {}".format(opts["baseline"], e), file=sys.stderr)
+            sys.exit(2)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "tunnels": opts["tunnels"],
+            "concurrency": opts["concurrency"],
+            "duration_per_endpoint": opts["duration"],
+        },
+        "results": {},
+    }
+    root = tempfile.mkdtemp(prefix="paqet-bench-")
+    try:
+        bin_dir, cfg_dir = write_stubs(root, opts["tunnels"])
+        for target in targets:
+            report["results"][target] = run_target(target, opts, root, bin_dir, cfg_dir)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print_table(report, baseline)
+    out = json.dumps(report, indent=2)
+    if opts["output"]:
+        with open(opts["output"], "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+    if baseline is not None:
+        problems = compare(report, baseline, opts["threshold"])
+        if problems:
+            print("\nRegressions beyond {}%:".format(opts["threshold"]), file=sys.stderr)
+            for p in problems:
+                print("  " + p, file=sys.stderr)
+            sys.exit(1)
+        print("\nNo regressions beyond {}% against {}".format(opts["threshold"], opts["baseline"]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
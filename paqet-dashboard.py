@@ -3,52 +3,360 @@
 Paqet Tunnel Manager - Web Dashboard
 Login at /login (looks like normal site for DPI). Dashboard at /dashboard.
 Python 3 stdlib only. Run as root: python3 paqet-dashboard.py [--port 8880] [--bind 0.0.0.0]
+  [--workers 16] [--timeout 30] [--status-interval 5] [--peers /etc/paqet/fleet.list] [--idle-exit SECONDS]
+Under systemd socket activation (paqet-dashboard.socket) the inherited listening socket is used
+instead of --port/--bind, and --idle-exit stops the process after that long without requests.
+History report: python3 paqet-dashboard.py --history [service]
+UDP/socket buffer check: python3 paqet-dashboard.py --udp-health [seconds]
 """
+import bisect
+import collections
 import hashlib
 import json
 import os
+import re
 import secrets
+import signal
+import socket
 import subprocess
+import struct
 import sys
+import threading
+import time
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import parse_qs, urlparse
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, quote, urlparse
+# asyncio (probes, fleet), gzip, hmac/ipaddress (scrape auth), mmap (history) and fnmatch (bulk
+# selection) are imported where they are used, so a socket-activated start does not load them.
 
 CONFIG_DIR = os.environ.get("PAQET_CONFIG_DIR", "/etc/paqet")
 DEFAULT_PORT = 8880
 DEFAULT_BIND = "0.0.0.0"
+# Max requests handled at once; extra connections wait in the listen backlog.
+DEFAULT_WORKERS = int(os.environ.get("PAQET_DASHBOARD_WORKERS", "16"))
+# Socket read/write timeout per request (seconds).
+DEFAULT_REQUEST_TIMEOUT = float(os.environ.get("PAQET_DASHBOARD_TIMEOUT", "30"))
+# How often the background refresher re-reads systemd and /etc/paqet (seconds).
+DEFAULT_STATUS_INTERVAL = float(os.environ.get("PAQET_STATUS_INTERVAL", "5"))
+# CPU/memory/uptime change on every refresh; /api/state republishes them at most this often
+# (seconds) so an idle dashboard's polls are answered with 304.
+STATE_USAGE_INTERVAL = float(os.environ.get("PAQET_STATE_USAGE_INTERVAL", "30"))
+USAGE_FIELDS = ("memory_bytes", "cpu_seconds", "uptime_seconds")
+# Bulk start/stop/restart jobs (/api/bulk): systemctl calls in flight across all jobs,
+# per-call timeout (seconds) and finished jobs kept for /api/jobs.
+BULK_CONCURRENCY = int(os.environ.get("PAQET_BULK_CONCURRENCY", "8"))
+BULK_TIMEOUT = 90
+BULK_JOBS_KEPT = 50
+BULK_ACTIONS = ("start", "stop", "restart")
+# Live log streaming (/api/logs/stream): journal entries kept per unit for late joiners,
+# max concurrent `journalctl -f` processes and max connected SSE clients.
+LOG_RING_SIZE = int(os.environ.get("PAQET_LOG_RING", "500"))
+MAX_LOG_FOLLOWERS = int(os.environ.get("PAQET_LOG_FOLLOWERS", "4"))
+MAX_LOG_STREAMS = int(os.environ.get("PAQET_LOG_STREAMS", "8"))
+# Entries buffered per SSE client before the oldest are dropped (slow client back-pressure).
+LOG_CLIENT_BACKLOG = 1000
+SSE_KEEPALIVE = 15
+# /api/logs queries: max entries returned and max journal entries scanned per request.
+MAX_LOG_LINES = 5000
+# Journal analytics (/api/log-stats): seconds between incremental reads of the paqet-* journals
+# (0 disables), max entries per read, entries taken on the very first run (no saved cursor),
+# error signatures kept per tunnel (bounded top-N) and seconds between state saves.
+LOG_STATS_INTERVAL = float(os.environ.get("PAQET_LOG_STATS_INTERVAL", "15"))
+LOG_STATS_BATCH = int(os.environ.get("PAQET_LOG_STATS_BATCH", "20000"))
+LOG_STATS_BOOTSTRAP = 1000
+LOG_SIGNATURES = 64
+LOG_STATS_SAVE_INTERVAL = 60
+# Journal message -> event type. All patterns are folded into one regex, so a line costs one
+# search; when several match, the leftmost wins. Unmatched lines count as error/warning/info
+# by syslog priority.
+LOG_EVENT_PATTERNS = (
+    ("panic", r"\bpanic\b|\bfatal\b"),
+    ("handshake_failure", r"handshake\S*(?:\s+\S+){0,3}?\s+(?:fail\w*|error|timeout|timed out)"),
+    ("timeout", r"i/o timeout|deadline exceeded|timed out"),
+    ("refused", r"connection refused|no route to host|network is unreachable"),
+    ("reset", r"connection reset|broken pipe|unexpected eof"),
+    ("kcp_error", r"\b(?:kcp|smux)\b.*?\b(?:error|fail\w*)"),
+    ("reconnect", r"\breconnect\w*|\bre-?dial\w*|\bretry\w*"),
+    ("service_start", r"^Started\b"),
+    ("service_exit", r"^Stopped\b|Main process exited|Failed with result"),
+)
+# Types that are tracked as error signatures (plus anything logged at warning or worse).
+LOG_ERROR_TYPES = {"panic", "handshake_failure", "timeout", "refused", "reset", "kcp_error", "error",
+                   "service_exit"}
+# paqet-* units that are tools, not tunnels.
+TOOL_UNITS = {"paqet-dashboard.service", "paqet-decoy.service", "paqet-supervisor.service"}
+# Throughput sampling: seconds between samples and samples kept per tunnel (10 min at 5 s).
+METRICS_INTERVAL = float(os.environ.get("PAQET_METRICS_INTERVAL", "5"))
+METRICS_HISTORY = int(os.environ.get("PAQET_METRICS_HISTORY", "120"))
+# Kernel UDP/socket telemetry (/api/udp-health): sampling interval in seconds (0 disables) and
+# how often the unit PIDs' socket inodes are re-read.
+SOCKET_INTERVAL = float(os.environ.get("PAQET_SOCKET_INTERVAL", "5"))
+SOCKET_MAP_INTERVAL = 30
+BUFFER_SYSCTLS = ("net/core/rmem_default", "net/core/rmem_max", "net/core/wmem_default", "net/core/wmem_max",
+                  "net/core/netdev_max_backlog", "net/ipv4/udp_mem", "net/ipv4/udp_rmem_min")
+# Prometheus /metrics access: bearer token (Authorization header or ?token=) and/or client
+# networks allowed without a token. Anyone else gets a plain 404.
+METRICS_TOKEN = os.environ.get("PAQET_METRICS_TOKEN", "")
+METRICS_ALLOW = os.environ.get("PAQET_METRICS_ALLOW", "127.0.0.1/32,::1/128")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Request paths reported as-is in request metrics; anything else is counted as "other".
+KNOWN_ROUTES = {
+    "/", "/login", "/dashboard", "/metrics", "/api/status", "/api/state", "/api/logs", "/api/logs/stream",
+    "/api/config", "/api/metrics", "/api/history", "/api/probes",
+    "/api/restart", "/api/bulk", "/api/jobs", "/api/debug/perf", "/api/debug/profile", "/api/fleet",
+    "/api/log-stats", "/api/udp-health",
+}
+# Fleet view (/api/fleet): peer dashboards to aggregate, one "URL [name] [tunnel-ip,...]" per line
+# in FLEET_FILE (or comma-separated URLs in PAQET_FLEET_PEERS). Each peer is polled every
+# FLEET_INTERVAL seconds with a FLEET_TIMEOUT per request, and only while someone looked at
+# /api/fleet in the last FLEET_IDLE seconds. PAQET_FLEET_ADDR: this box's public IP(s).
+FLEET_FILE = os.environ.get("PAQET_FLEET_FILE", os.path.join(CONFIG_DIR, "fleet.list"))
+FLEET_PEERS = os.environ.get("PAQET_FLEET_PEERS", "")
+FLEET_INTERVAL = float(os.environ.get("PAQET_FLEET_INTERVAL", "5"))
+FLEET_TIMEOUT = float(os.environ.get("PAQET_FLEET_TIMEOUT", "3"))
+FLEET_IDLE = 120
+FLEET_ADDR = os.environ.get("PAQET_FLEET_ADDR", "")
+FLEET_MAX_BODY = 8 * 1024 * 1024
+# One stderr line per request (method, path, status, ms, forks) when set to 1.
+ACCESS_LOG = os.environ.get("PAQET_DASHBOARD_ACCESS_LOG", "") == "1"
+# Service state transition log (fixed-size binary records, rotated at HISTORY_MAX_BYTES
+# into one ".1" generation, so disk and memory use are bounded).
+HISTORY_DIR = os.environ.get("PAQET_HISTORY_DIR", "/var/lib/paqet")
+HISTORY_MAX_BYTES = int(os.environ.get("PAQET_HISTORY_MAX_BYTES", str(1024 * 1024)))
+HISTORY_WINDOWS = (("1h", 3600), ("24h", 86400), ("7d", 7 * 86400))
+# Forward prober: seconds between rounds (0 disables), per-probe timeout, max probes in flight,
+# address the client forwards are reached on, and how long results stay in the percentiles.
+PROBE_INTERVAL = float(os.environ.get("PAQET_PROBE_INTERVAL", "30"))
+PROBE_TIMEOUT = float(os.environ.get("PAQET_PROBE_TIMEOUT", "3"))
+PROBE_CONCURRENCY = int(os.environ.get("PAQET_PROBE_CONCURRENCY", "200"))
+PROBE_HOST = os.environ.get("PAQET_PROBE_HOST", "127.0.0.1")
+PROBE_WINDOW = 300
+# After connecting, wait this long to see whether the tunnel drops the connection.
+PROBE_HOLD = 0.5
+# Latency histogram bucket upper bounds in ms (log scale, 0.1 ms .. ~13 s).
+PROBE_BUCKETS = tuple(round(0.1 * 1.5 ** i, 3) for i in range(30))
+LOG_SCAN_LIMIT = int(os.environ.get("PAQET_LOG_SCAN_LIMIT", "50000"))
+LOG_QUERY_PARAMS = ("after", "before", "since", "until", "priority", "grep", "format")
+PRIORITY_RE = re.compile(r"^(emerg|alert|crit|err|warning|notice|info|debug|[0-7])(\.\.(emerg|alert|crit|err|warning|notice|info|debug|[0-7]))?$")
 COOKIE_NAME = "psid"
 # Simple auth: any non-empty user + password "paqet" or "admin" works. Change if you want.
 LOGIN_PASSWORD = os.environ.get("PAQET_DASHBOARD_PASS", "paqet")
 SESSION_SECRET = secrets.token_hex(16)
 SESSION_TOKEN = hashlib.sha256((SESSION_SECRET + "ok").encode()).hexdigest()[:32]
+# With --idle-exit the process restarts on demand, so the session secret is kept here instead
+# (created 0600) and logins survive the restarts.
+SESSION_SECRET_FILE = os.path.join(HISTORY_DIR, "dashboard.secret")
+# Exit after this many seconds without a request (0 = never). Meant for socket activation:
+# systemd keeps listening and starts the dashboard again on the next connection.
+IDLE_EXIT = float(os.environ.get("PAQET_DASHBOARD_IDLE_EXIT", "0"))
+# Opt-in request profiling (POST /api/debug/profile or SIGUSR2): default and max window in
+# seconds, and where the merged cProfile dumps are written (open with `python3 -m pstats`).
+PROFILE_SECONDS = 30
+PROFILE_MAX_SECONDS = 600
+PROFILE_DIR = os.environ.get("PAQET_PROFILE_DIR", HISTORY_DIR)
+
+
+class RequestTiming:
+    """Where one request's time went, sent back as a Server-Timing header."""
+    __slots__ = ("start", "cmd_seconds", "forks", "json_seconds")
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.cmd_seconds = 0.0
+        self.forks = 0
+        self.json_seconds = 0.0
+
+    def header(self):
+        parts = ["total;dur={:.1f}".format((time.monotonic() - self.start) * 1000)]
+        if self.forks:
+            parts.append('cmd;dur={:.1f};desc="{} fork{}"'.format(
+                self.cmd_seconds * 1000, self.forks, "" if self.forks == 1 else "s"))
+        if self.json_seconds:
+            parts.append("json;dur={:.1f}".format(self.json_seconds * 1000))
+        return ", ".join(parts)
+
+
+_TIMING = threading.local()
+
+
+def current_timing():
+    """RequestTiming of the request this thread is handling, or None (background threads)."""
+    return getattr(_TIMING, "request", None)
+
+
+def bucket_quantiles(buckets, h, maximum, quantiles=(0.5, 0.95, 0.99)):
+    """Estimate quantiles (ms) from cumulative histogram counts [per-bucket..., sum, count]:
+    the upper bound of the first bucket holding the quantile, capped at the observed max."""
+    out = {}
+    for q in quantiles:
+        value = maximum
+        if h[-1]:
+            for bound, n in zip(buckets, h):
+                if n >= q * h[-1]:
+                    value = min(bound, maximum)
+                    break
+        out["p{}".format(int(q * 100))] = round(value * 1000, 1)
+    return out
+
+
+class CommandStats:
+    """Every process the dashboard forks, per command ("systemctl show", "journalctl", ...):
+    count, failures, timeouts and wall-time histogram. Also charged to the current request."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stats = {}  # name -> {"hist": [per-bucket counts..., sum, count], "max", "failed", "timeouts"}
+
+    def observe(self, name, seconds, failed=False, timed_out=False):
+        timing = current_timing()
+        if timing is not None:
+            timing.cmd_seconds += seconds
+            timing.forks += 1
+        with self._lock:
+            st = self._stats.get(name)
+            if st is None:
+                st = self._stats[name] = {"hist": [0] * len(self.buckets) + [0.0, 0],
+                                          "max": 0.0, "failed": 0, "timeouts": 0}
+            h = st["hist"]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+            st["max"] = max(st["max"], seconds)
+            st["failed"] += 1 if failed else 0
+            st["timeouts"] += 1 if timed_out else 0
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(st, hist=list(st["hist"])) for name, st in self._stats.items()}
+
+    def summary(self):
+        out = {}
+        for name, st in sorted(self.snapshot().items()):
+            h = st["hist"]
+            out[name] = dict({
+                "count": h[-1],
+                "failed": st["failed"],
+                "timeouts": st["timeouts"],
+                "total_ms": round(h[-2] * 1000, 1),
+                "avg_ms": round(h[-2] / h[-1] * 1000, 1) if h[-1] else 0,
+                "max_ms": round(st["max"] * 1000, 1),
+            }, **bucket_quantiles(self.buckets, h, st["max"]))
+        return out
+
+
+COMMAND_STATS = CommandStats()
+
+
+def command_name(cmd):
+    """Metric label for a command line: the program plus its verb, e.g. "systemctl show"."""
+    name = os.path.basename(cmd[0])
+    if len(cmd) > 1 and not cmd[1].startswith("-"):
+        name += " " + cmd[1]
+    return name
 
 
 def run_cmd(cmd, timeout=10):
+    start = time.monotonic()
+    code, timed_out = -1, False
     try:
         r = subprocess.run(
             cmd, capture_output=True, text=True, timeout=timeout,
             env={**os.environ, "LANG": "C"}
         )
+        code = r.returncode
         return r.stdout or "", r.stderr or "", r.returncode
+    except subprocess.TimeoutExpired as e:
+        timed_out = True
+        return "", str(e), -1
     except Exception as e:
         return "", str(e), -1
+    finally:
+        COMMAND_STATS.observe(command_name(cmd), time.monotonic() - start, code != 0, timed_out)
+
+
+# Properties read for every paqet unit in one `systemctl show` call.
+SERVICE_PROPERTIES = (
+    "Id", "LoadState", "ActiveState", "SubState", "MainPID", "MemoryCurrent",
+    "CPUUsageNSec", "NRestarts", "ActiveEnterTimestamp", "ActiveEnterTimestampMonotonic",
+)
+# systemd reports "not available" counters as UINT64_MAX.
+UINT64_MAX = 2 ** 64 - 1
+
+
+def _int_prop(value):
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return None
+    return None if n >= UINT64_MAX else n
+
+
+def parse_systemctl_show(out):
+    """Split `systemctl show` output (blank-line separated KEY=VALUE blocks) into dicts."""
+    blocks, cur = [], {}
+    for line in out.splitlines():
+        if not line.strip():
+            if cur:
+                blocks.append(cur)
+                cur = {}
+            continue
+        key, _, value = line.partition("=")
+        cur[key] = value
+    if cur:
+        blocks.append(cur)
+    return blocks
+
+
+def boot_uptime():
+    try:
+        with open("/proc/uptime", "r") as f:
+            return float(f.read().split()[0])
+    except Exception:
+        return None
 
 
 def get_services():
+    """State and resource usage of every paqet-*.service from a single systemctl fork."""
     out, _, _ = run_cmd(
-        ["systemctl", "list-units", "--type=service", "--no-legend", "--no-pager",
+        ["systemctl", "show", "--no-pager", "--property=" + ",".join(SERVICE_PROPERTIES),
          "paqet-*.service"]
     )
+    now = boot_uptime()
     services = []
-    for line in out.strip().splitlines():
-        parts = line.split()
-        if len(parts) < 1:
+    for props in parse_systemctl_show(out):
+        unit = props.get("Id", "")
+        if not unit.startswith("paqet-") or props.get("LoadState") == "not-found":
             continue
-        unit = parts[0]
-        name = unit.replace("paqet-", "").replace(".service", "")
-        active = "active" if len(parts) >= 3 and parts[2] == "active" else "inactive"
-        services.append({"unit": unit, "name": name, "status": active})
-    return services
+        state = props.get("ActiveState", "unknown")
+        cpu_ns = _int_prop(props.get("CPUUsageNSec"))
+        entered = _int_prop(props.get("ActiveEnterTimestampMonotonic"))
+        uptime = None
+        if state == "active" and entered and now is not None:
+            uptime = max(0, int(now - entered / 1e6))
+        services.append({
+            "unit": unit,
+            "name": unit.replace("paqet-", "").replace(".service", ""),
+            "status": "active" if state == "active" else "inactive",
+            "state": state,
+            "sub": props.get("SubState", ""),
+            "pid": _int_prop(props.get("MainPID")) or None,
+            "memory_bytes": _int_prop(props.get("MemoryCurrent")),
+            "cpu_seconds": round(cpu_ns / 1e9, 3) if cpu_ns is not None else None,
+            "restarts": _int_prop(props.get("NRestarts")) or 0,
+            "since": props.get("ActiveEnterTimestamp", ""),
+            "uptime_seconds": uptime,
+        })
+    return sorted(services, key=lambda s: s["unit"])
+
+
+def unit_name(value):
+    """Normalize "foo", "paqet-foo" or "paqet-foo.service" to "paqet-foo.service"."""
+    if value.endswith(".service"):
+        return value
+    return "paqet-" + value.replace("paqet-", "") + ".service"
 
 
 def get_logs(unit, lines=100):
@@ -58,25 +366,2316 @@ def get_logs(unit, lines=100):
     return (out + err).strip() if (out or err) else "(no logs)"
 
 
-def get_config(name):
-    path = os.path.join(CONFIG_DIR, name + ".yaml")
-    if not os.path.isfile(path):
-        return None
+def _unquote(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def _addr_port(addr):
     try:
-        with open(path, "r", encoding="utf-8", errors="replace") as f:
-            return f.read()
-    except Exception:
+        return int((addr or "").rsplit(":", 1)[1])
+    except (IndexError, ValueError):
         return None
 
 
+def parse_config(text):
+    """Tunnel metadata from a paqet YAML config. Only understands the block-style subset
+    the manager writes (nested mappings and the `forward:` list), which is all we need."""
+    values, forwards = {}, []
+    stack = []   # (indent, key) of the enclosing mappings
+    item = None  # (indent, dict) of the current `- ` list item
+    for raw in text.splitlines():
+        stripped = raw.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        indent = len(raw) - len(raw.lstrip())
+        if item is not None and indent > item[0] and not stripped.startswith("- "):
+            key, _, value = stripped.partition(":")
+            item[1][key.strip()] = _unquote(value)
+            continue
+        item = None
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        path = ".".join(k for _, k in stack)
+        if stripped.startswith("- "):
+            entry = {}
+            key, _, value = stripped[2:].partition(":")
+            entry[key.strip()] = _unquote(value)
+            if path == "forward":
+                forwards.append(entry)
+            item = (indent, entry)
+            continue
+        key, _, value = stripped.partition(":")
+        key = key.strip()
+        if value.strip():
+            values[(path + "." if path else "") + key] = _unquote(value)
+        else:
+            stack.append((indent, key))
+
+    def as_int(key):
+        try:
+            return int(values.get(key, ""))
+        except ValueError:
+            return None
+
+    listen = values.get("listen.addr")
+    return {
+        "role": values.get("role"),
+        "interface": values.get("network.interface"),
+        "listen": listen,
+        "listen_port": _addr_port(listen),
+        "server": values.get("server.addr"),
+        "mode": values.get("transport.kcp.mode"),
+        "mtu": as_int("transport.kcp.mtu"),
+        "conn": as_int("transport.conn"),
+        "forward_tcp": [p for p in (_addr_port(f.get("listen")) for f in forwards
+                                    if f.get("protocol", "tcp") == "tcp") if p],
+        "forward_udp": [p for p in (_addr_port(f.get("listen")) for f in forwards
+                                    if f.get("protocol") == "udp") if p],
+    }
+
+
+class ConfigIndex:
+    """Parsed /etc/paqet/*.yaml, keyed by config name. refresh() only stats the directory;
+    a file is re-read and re-parsed when its mtime or size changes."""
+
+    def __init__(self, config_dir=CONFIG_DIR):
+        self.config_dir = config_dir
+        self._lock = threading.Lock()
+        self._entries = {}  # name -> (mtime_ns, size, text, record)
+
+    def _load(self, name, path, st):
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            return None
+        record = dict(parse_config(text), name=name)
+        return (st.st_mtime_ns, st.st_size, text, record)
+
+    def refresh(self):
+        seen = {}
+        try:
+            with os.scandir(self.config_dir) as it:
+                for de in it:
+                    if de.name.endswith(".yaml") and de.is_file():
+                        seen[de.name[:-len(".yaml")]] = de
+        except OSError:
+            pass
+        with self._lock:
+            old = self._entries
+        entries = {}
+        for name, de in seen.items():
+            try:
+                st = de.stat()
+            except OSError:
+                continue
+            cached = old.get(name)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                entries[name] = cached
+            else:
+                loaded = self._load(name, de.path, st)
+                if loaded:
+                    entries[name] = loaded
+        with self._lock:
+            self._entries = entries
+        return entries
+
+    def names(self):
+        with self._lock:
+            return sorted(self._entries)
+
+    def records(self):
+        with self._lock:
+            return {name: e[3] for name, e in self._entries.items()}
+
+    def text(self, name):
+        """Raw YAML of a known config; re-validated against the file's current mtime/size."""
+        with self._lock:
+            cached = self._entries.get(name)
+        if cached is None:
+            return None
+        path = os.path.join(self.config_dir, name + ".yaml")
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (st.st_mtime_ns, st.st_size) != cached[:2]:
+            cached = self._load(name, path, st)
+            if cached is None:
+                return None
+            with self._lock:
+                self._entries[name] = cached
+        return cached[2]
+
+
+CONFIG_INDEX = ConfigIndex()
+
+
+def get_config(name):
+    content = CONFIG_INDEX.text(name)
+    if content is None:
+        CONFIG_INDEX.refresh()  # maybe created since the last status refresh
+        content = CONFIG_INDEX.text(name)
+    return content
+
+
 def get_all_configs():
-    configs = []
-    if not os.path.isdir(CONFIG_DIR):
-        return configs
-    for f in os.listdir(CONFIG_DIR):
-        if f.endswith(".yaml"):
-            configs.append(f.replace(".yaml", ""))
-    return sorted(configs)
+    CONFIG_INDEX.refresh()
+    return CONFIG_INDEX.names()
+
+
+class StatusCache:
+    """Shared /api/status snapshot kept fresh by a background thread.
+    Concurrent callers that find it stale share one in-flight refresh instead of each forking systemctl."""
+
+    def __init__(self, interval=DEFAULT_STATUS_INTERVAL):
+        self.interval = max(0.5, interval)
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._snapshot = None
+        self._stamp = 0.0          # monotonic time the current snapshot's refresh started
+        self._invalid_after = 0.0  # snapshots started before this are stale
+        self._refreshing = False
+        self._thread = None
+        self.listeners = []  # called with each new snapshot, on the refreshing thread
+
+    def _collect(self):
+        configs = get_all_configs()
+        return {"services": get_services(), "configs": configs, "config_info": CONFIG_INDEX.records()}
+
+    def _is_fresh(self):
+        if self._snapshot is None or self._stamp < self._invalid_after:
+            return False
+        # Safety net in case the background thread is stuck: never serve data older than 3 intervals.
+        return time.monotonic() - self._stamp < self.interval * 3
+
+    def get(self):
+        with self._cond:
+            if self._is_fresh():
+                return self._snapshot
+        return self.refresh()
+
+    def peek(self):
+        """Current snapshot without ever refreshing on the caller's thread (may be None at startup)."""
+        with self._cond:
+            return self._snapshot
+
+    def refresh(self):
+        with self._cond:
+            if self._refreshing:
+                # Join the refresh already running rather than starting another one.
+                while self._refreshing:
+                    self._cond.wait()
+                if self._is_fresh():
+                    return self._snapshot
+            self._refreshing = True
+        started = time.monotonic()
+        snapshot = None
+        try:
+            snapshot = self._collect()
+        finally:
+            with self._cond:
+                self._refreshing = False
+                if snapshot is not None:
+                    self._snapshot = snapshot
+                    self._stamp = started
+                self._cond.notify_all()
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                pass
+        return snapshot
+
+    def invalidate(self):
+        """Mark the snapshot stale (e.g. after a restart) and refresh it right away."""
+        with self._cond:
+            self._invalid_after = time.monotonic()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                pass
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="status-refresh", daemon=True)
+            self._thread.start()
+
+
+STATUS_CACHE = StatusCache()
+
+
+class StateTracker:
+    """Versioned view of the status snapshot for /api/state.
+    Each change bumps one counter and every service / config item remembers the version it last
+    changed in, so a client sending since=<version> gets only what changed, and an unchanged poll
+    is a 304. Versions carry a per-process prefix so a restarted dashboard forces a full reload."""
+
+    def __init__(self, usage_interval=STATE_USAGE_INTERVAL):
+        self.usage_interval = usage_interval
+        self.instance = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._items = {}    # key -> [stable_json, usage_json, value, version]
+        self._removed = {}  # key -> version it disappeared in
+        self._evicted = 0   # newest removal version dropped from _removed; older `since` needs a full reload
+        self._usage_published = 0.0
+
+    def _version(self):
+        return "{}.{}".format(self.instance, self._counter)
+
+    def observe(self, snapshot):
+        """STATUS_CACHE listener."""
+        if snapshot is None:
+            return
+        current = {}
+        for svc in snapshot.get("services", []):
+            stable = json.dumps({k: v for k, v in svc.items() if k not in USAGE_FIELDS}, sort_keys=True)
+            usage = json.dumps([svc.get(k) for k in USAGE_FIELDS])
+            current["svc:" + svc["unit"]] = (stable, usage, svc)
+        for key in ("configs", "config_info"):
+            value = snapshot.get(key)
+            current[key] = (json.dumps(value, sort_keys=True), "", value)
+        now = time.monotonic()
+        with self._lock:
+            publish_usage = now - self._usage_published >= self.usage_interval
+            changed = [key for key, (stable, usage, _) in current.items()
+                       if key not in self._items or self._items[key][0] != stable
+                       or (publish_usage and self._items[key][1] != usage)]
+            removed = [key for key in self._items if key not in current]
+            if not changed and not removed:
+                return
+            self._counter += 1
+            for key in changed:
+                stable, usage, value = current[key]
+                self._items[key] = [stable, usage, value, self._counter]
+                self._removed.pop(key, None)
+            for key in removed:
+                del self._items[key]
+                self._removed[key] = self._counter
+            while len(self._removed) > 1024:
+                oldest = min(self._removed, key=self._removed.get)
+                self._evicted = max(self._evicted, self._removed.pop(oldest))
+            if publish_usage:
+                self._usage_published = now
+
+    def etag(self):
+        with self._lock:
+            return '"{}"'.format(self._version())
+
+    def delta(self, since=None):
+        """Everything (full=True), or only items changed after `since` plus removed units."""
+        with self._lock:
+            base = None
+            if since:
+                instance, _, number = since.strip('"').partition(".")
+                if instance == self.instance and number.isdigit() and self._evicted < int(number) <= self._counter:
+                    base = int(number)
+            fresh = lambda item: base is None or item[3] > base
+            result = {
+                "version": self._version(),
+                "full": base is None,
+                "services": [item[2] for key, item in sorted(self._items.items())
+                             if key.startswith("svc:") and fresh(item)],
+            }
+            if base is not None:
+                result["removed"] = sorted(key[4:] for key, v in self._removed.items()
+                                           if v > base and key.startswith("svc:"))
+            for key in ("configs", "config_info"):
+                item = self._items.get(key)
+                if item is not None and fresh(item):
+                    result[key] = item[2]
+            return result
+
+
+STATE = StateTracker()
+
+UNIT_RE = re.compile(r"^paqet-[\w.@-]+\.service$")
+
+
+def select_units(role=None, pattern=None):
+    """Tunnel units (those with a config in CONFIG_DIR) matching a role and/or a name glob."""
+    import fnmatch
+    snapshot = STATUS_CACHE.get()
+    info = snapshot.get("config_info", {})
+    units = []
+    for svc in snapshot.get("services", []):
+        cfg = info.get(svc["name"])
+        if cfg is None:
+            continue  # dashboard, decoy, supervisor...: only tunnels are selectable
+        if role and cfg.get("role") != role:
+            continue
+        if pattern and not (fnmatch.fnmatch(svc["name"], pattern) or fnmatch.fnmatch(svc["unit"], pattern)):
+            continue
+        units.append(svc["unit"])
+    return units
+
+
+class BulkJob:
+    def __init__(self, job_id, action, units):
+        self.id = job_id
+        self.action = action
+        self.created = time.time()
+        self.finished = None
+        self.results = collections.OrderedDict(
+            (u, {"state": "pending", "error": None, "seconds": None}) for u in units)
+
+    def snapshot(self):
+        states = collections.Counter(r["state"] for r in self.results.values())
+        return {
+            "id": self.id,
+            "action": self.action,
+            "state": "done" if self.finished else "running",
+            "created": round(self.created, 3),
+            "finished": round(self.finished, 3) if self.finished else None,
+            "total": len(self.results),
+            "pending": states["pending"],
+            "running": states["running"],
+            "ok": states["ok"],
+            "failed": states["failed"],
+            "units": {u: dict(r) for u, r in self.results.items()},
+        }
+
+
+class JobManager:
+    """Runs bulk systemctl actions in the background. Each job gets its own thread; the
+    systemctl calls of all jobs share BULK_CONCURRENCY slots so a big job cannot fork-bomb."""
+
+    def __init__(self, concurrency=BULK_CONCURRENCY, kept=BULK_JOBS_KEPT):
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self._lock = threading.Lock()
+        self._jobs = collections.OrderedDict()
+        self.kept = kept
+
+    def submit(self, action, units):
+        job = BulkJob(secrets.token_hex(6), action, units)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.finished]
+            while len(self._jobs) > self.kept and finished:
+                self._jobs.pop(finished.pop(0).id)
+        threading.Thread(target=self._run, args=(job,), name="bulk-" + job.id, daemon=True).start()
+        return job
+
+    def _run_unit(self, job, unit):
+        try:
+            with self._lock:
+                job.results[unit]["state"] = "running"
+            start = time.monotonic()
+            _, err, code = run_cmd(["systemctl", job.action, unit], timeout=BULK_TIMEOUT)
+            with self._lock:
+                result = job.results[unit]
+                result["seconds"] = round(time.monotonic() - start, 3)
+                result["state"] = "ok" if code == 0 else "failed"
+                if code != 0:
+                    result["error"] = err.strip() or "exit code {}".format(code)
+        finally:
+            self._slots.release()
+
+    def _run(self, job):
+        workers = []
+        for unit in job.results:
+            self._slots.acquire()
+            t = threading.Thread(target=self._run_unit, args=(job, unit), daemon=True)
+            t.start()
+            workers.append(t)
+        for t in workers:
+            t.join()
+        with self._lock:
+            job.finished = time.time()
+        STATUS_CACHE.invalidate()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job else None
+
+    def list(self):
+        with self._lock:
+            return [{k: v for k, v in job.snapshot().items() if k != "units"}
+                    for job in reversed(self._jobs.values())]
+
+
+JOBS = JobManager()
+
+
+def read_net_dev(path="/proc/net/dev"):
+    """{iface: (rx_bytes, rx_packets, tx_bytes, tx_packets)} from /proc/net/dev."""
+    counters = {}
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()[2:]
+    except OSError:
+        return counters
+    for line in lines:
+        name, _, data = line.partition(":")
+        fields = data.split()
+        if len(fields) >= 10:
+            counters[name.strip()] = (int(fields[0]), int(fields[1]), int(fields[8]), int(fields[9]))
+    return counters
+
+
+# "[pkts:bytes] -A PREROUTING -p tcp -m tcp --dport 8888 -j NOTRACK" as written by configure_iptables()
+NOTRACK_RULE_RE = re.compile(
+    r"^\[(\d+):(\d+)\] -A (PREROUTING|OUTPUT) -p (tcp|udp)\b.*?--([ds]port) (\d+)\b.*-j NOTRACK"
+)
+
+
+def read_notrack_counters():
+    """{(proto, port): [in_bytes, in_pkts, out_bytes, out_pkts]} for the raw-table NOTRACK rules
+    the manager installs per tunnel port. One iptables-save call covers every tunnel."""
+    out, _, code = run_cmd(["iptables-save", "-c", "-t", "raw"])
+    counters = {}
+    if code != 0:
+        return counters
+    for line in out.splitlines():
+        m = NOTRACK_RULE_RE.match(line)
+        if not m:
+            continue
+        pkts, nbytes, chain, proto, direction, port = m.groups()
+        c = counters.setdefault((proto, int(port)), [0, 0, 0, 0])
+        if chain == "PREROUTING" and direction == "dport":
+            c[0] += int(nbytes)
+            c[1] += int(pkts)
+        elif chain == "OUTPUT" and direction == "sport":
+            c[2] += int(nbytes)
+            c[3] += int(pkts)
+    return counters
+
+
+def tunnel_ports(cfg):
+    """(proto, port) keys whose NOTRACK counters belong to a tunnel."""
+    keys = []
+    if cfg.get("listen_port"):
+        keys.append(("tcp", cfg["listen_port"]))
+    keys += [("tcp", p) for p in cfg.get("forward_tcp") or []]
+    keys += [("udp", p) for p in cfg.get("forward_udp") or []]
+    return keys
+
+
+def _rates(cur, prev, dt):
+    # Counters can go backwards when rules are re-created; count that interval as zero.
+    if prev is None or dt <= 0:
+        return (0, 0, 0, 0)
+    return tuple(max(0, c - p) / dt for c, p in zip(cur, prev))
+
+
+class MetricsCollector:
+    """Samples interface and per-port counters on an interval and keeps a fixed-size ring of
+    rates per tunnel and interface. Each sample is one /proc read and one iptables-save fork,
+    however many tunnels there are."""
+
+    def __init__(self, interval=METRICS_INTERVAL, history=METRICS_HISTORY):
+        self.interval = max(1.0, interval)
+        self.history = history
+        self._lock = threading.Lock()
+        self._prev = None      # (monotonic, iface counters, port counters)
+        self._tunnels = {}     # name -> deque of [ts, rx_bps, tx_bps, rx_pps, tx_pps]
+        self._ports = {}       # name -> {"tcp/9090": [rx_bps, tx_bps, rx_pps, tx_pps]}
+        self._ifaces = {}      # iface -> deque of [ts, rx_bps, tx_bps, rx_pps, tx_pps]
+        self._thread = None
+
+    def _point(self, ts, rates):
+        rx_b, rx_p, tx_b, tx_p = rates
+        return [round(ts, 1), int(rx_b), int(tx_b), round(rx_p, 1), round(tx_p, 1)]
+
+    def sample(self):
+        now, wall = time.monotonic(), time.time()
+        ifaces = read_net_dev()
+        ports = read_notrack_counters()
+        configs = CONFIG_INDEX.records()
+        with self._lock:
+            prev, self._prev = self._prev, (now, ifaces, ports)
+            if prev is None:
+                return
+            dt = now - prev[0]
+            for name, cur in ifaces.items():
+                ring = self._ifaces.setdefault(name, collections.deque(maxlen=self.history))
+                ring.append(self._point(wall, _rates(cur, prev[1].get(name), dt)))
+            for name in list(self._ifaces):
+                if name not in ifaces:
+                    del self._ifaces[name]
+            port_rates = {key: _rates(cur, prev[2].get(key), dt) for key, cur in ports.items()}
+            for name, cfg in configs.items():
+                per_port, total = {}, [0, 0, 0, 0]
+                for key in tunnel_ports(cfg):
+                    r = port_rates.get(key, (0, 0, 0, 0))
+                    per_port["{}/{}".format(*key)] = self._point(wall, r)[1:]
+                    total = [a + b for a, b in zip(total, r)]
+                ring = self._tunnels.setdefault(name, collections.deque(maxlen=self.history))
+                ring.append(self._point(wall, total))
+                self._ports[name] = per_port
+            for name in list(self._tunnels):
+                if name not in configs:
+                    del self._tunnels[name]
+                    self._ports.pop(name, None)
+
+    def snapshot(self, tunnel=None):
+        with self._lock:
+            tunnels = {
+                name: {"ports": self._ports.get(name, {}), "history": list(ring)}
+                for name, ring in self._tunnels.items() if tunnel is None or name == tunnel
+            }
+            ifaces = {name: list(ring) for name, ring in self._ifaces.items()} if tunnel is None else {}
+        return {
+            "interval": self.interval,
+            "fields": ["ts", "rx_bps", "tx_bps", "rx_pps", "tx_pps"],
+            "tunnels": tunnels,
+            "interfaces": ifaces,
+        }
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception:
+                pass
+            time.sleep(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+            self._thread.start()
+
+
+METRICS = MetricsCollector()
+
+
+def _read_lines(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+
+def read_snmp_udp(path="/proc/net/snmp"):
+    """{"InDatagrams": n, "RcvbufErrors": n, ...} from the two Udp: lines of /proc/net/snmp."""
+    rows = [line.split()[1:] for line in _read_lines(path) if line.startswith("Udp:")]
+    if len(rows) < 2:
+        return {}
+    return {key: int(value) for key, value in zip(rows[0], rows[1])}
+
+
+def read_udp_sockets(paths=("/proc/net/udp", "/proc/net/udp6")):
+    """{inode: (port, tx_queue, rx_queue, drops)} for every UDP socket; queues in bytes."""
+    socks = {}
+    for path in paths:
+        for line in _read_lines(path)[1:]:
+            f = line.split()
+            if len(f) < 13:
+                continue
+            try:
+                tx_queue, rx_queue = (int(x, 16) for x in f[4].split(":"))
+                socks[int(f[9])] = (int(f[1].rsplit(":", 1)[1], 16), tx_queue, rx_queue, int(f[12]))
+            except ValueError:
+                continue
+    return socks
+
+
+def read_packet_sockets(path="/proc/net/packet"):
+    """{inode: rmem} for AF_PACKET sockets: paqet moves tunnel packets through pcap, so its KCP
+    traffic queues here rather than in a UDP socket."""
+    socks = {}
+    for line in _read_lines(path)[1:]:
+        f = line.split()
+        if len(f) >= 9 and f[6].isdigit() and f[8].isdigit():
+            socks[int(f[8])] = int(f[6])
+    return socks
+
+
+def read_softnet(path="/proc/net/softnet_stat"):
+    """(dropped, time_squeezed) summed over CPUs: packets dropped because the per-CPU input
+    backlog (net.core.netdev_max_backlog) was full, and softirq runs that ran out of budget."""
+    dropped = squeezed = 0
+    for line in _read_lines(path):
+        f = line.split()
+        if len(f) >= 3:
+            dropped += int(f[1], 16)
+            squeezed += int(f[2], 16)
+    return dropped, squeezed
+
+
+def read_nic_drops(path="/proc/net/dev"):
+    """{iface: rx_drop + rx_fifo + tx_drop + tx_fifo} from /proc/net/dev (loopback skipped)."""
+    drops = {}
+    for line in _read_lines(path)[2:]:
+        name, _, data = line.partition(":")
+        fields = data.split()
+        if len(fields) >= 13 and name.strip() != "lo":
+            drops[name.strip()] = int(fields[3]) + int(fields[4]) + int(fields[11]) + int(fields[12])
+    return drops
+
+
+def read_sysctls(names=BUFFER_SYSCTLS):
+    """{"net.core.rmem_max": 212992, "net.ipv4.udp_mem": [pages, ...], ...}"""
+    values = {}
+    for name in names:
+        lines = _read_lines("/proc/sys/" + name)
+        if lines:
+            nums = [int(x) for x in lines[0].split() if x.isdigit()]
+            values[name.replace("/", ".")] = nums[0] if len(nums) == 1 else nums
+    return values
+
+
+def socket_inodes(pid):
+    """Inodes of the sockets open in process `pid` (other users' processes need root)."""
+    inodes = set()
+    fd_dir = "/proc/{}/fd".format(pid)
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return inodes
+    for fd in fds:
+        try:
+            target = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        if target.startswith("socket:["):
+            inodes.add(int(target[8:-1]))
+    return inodes
+
+
+def fmt_size(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return "{:.0f} {}".format(n, unit)
+        n /= 1024.0
+    return "{:.1f} GB".format(n)
+
+
+class SocketTelemetry:
+    """Samples the kernel's UDP, packet-socket, backlog and NIC drop counters and maps sockets to
+    tunnels, by the inodes open in each unit's MainPID or by the tunnel's UDP forward ports.
+    Rates are per second between two samples. Everything is a /proc read; only the PID -> inode
+    map walks /proc/PID/fd, and that every SOCKET_MAP_INTERVAL seconds."""
+
+    SNMP_KEYS = ("InDatagrams", "OutDatagrams", "InErrors", "RcvbufErrors", "SndbufErrors", "NoPorts")
+
+    def __init__(self, interval=SOCKET_INTERVAL, history=METRICS_HISTORY):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._prev = None    # (monotonic, snmp, softnet, nic drops, {tunnel: socket drops})
+        self._inodes = {}    # pid -> set of socket inodes
+        self._mapped = 0.0
+        self._system = {}
+        self._history = collections.deque(maxlen=history)  # [ts, rcvbuf_err/s, sndbuf_err/s, softnet_drop/s, nic_drop/s]
+        self._tunnels = {}
+        self._thread = None
+
+    def _map_inodes(self, pids):
+        if pids != set(self._inodes) or time.monotonic() - self._mapped >= SOCKET_MAP_INTERVAL:
+            self._inodes = {pid: socket_inodes(pid) for pid in pids}
+            self._mapped = time.monotonic()
+        return self._inodes
+
+    def sample(self, services=None):
+        now, wall = time.monotonic(), time.time()
+        if services is None:
+            services = (STATUS_CACHE.peek() or {}).get("services", [])
+        snmp, udp, packet = read_snmp_udp(), read_udp_sockets(), read_packet_sockets()
+        softnet, nic, sysctl = read_softnet(), read_nic_drops(), read_sysctls()
+        configs = CONFIG_INDEX.records()
+        pids = {s["name"]: s["pid"] for s in services if s.get("pid")}
+        inodes = self._map_inodes(set(pids.values()))
+        prev = self._prev
+        dt = now - prev[0] if prev else 0.0
+        rate = lambda cur, old: round(max(0, cur - old) / dt, 2) if prev and dt > 0 else None
+
+        rmem_default = sysctl.get("net.core.rmem_default") or 0
+        tunnels, drops_now = {}, {}
+        for name in sorted(set(configs) | set(pids)):
+            own = inodes.get(pids.get(name), set())
+            ports = set((configs.get(name) or {}).get("forward_udp") or [])
+            socks = [v for inode, v in udp.items() if inode in own or v[0] in ports]
+            pkt = [packet[inode] for inode in own if inode in packet]
+            drops = drops_now[name] = sum(v[3] for v in socks)
+            drop_rate = rate(drops, prev[4].get(name, drops)) if prev else None
+            rx_queue = max([v[2] for v in socks] or [0])
+            # Flagged on what the kernel measured (drops, queue fill), not on a rate estimate.
+            issues = []
+            if drop_rate:
+                issues.append("kernel dropped {} datagrams/s: receive buffer full".format(drop_rate))
+            if rmem_default and rx_queue > rmem_default // 2:
+                issues.append("receive queue {} is over half of net.core.rmem_default ({})".format(
+                    fmt_size(rx_queue), fmt_size(rmem_default)))
+            tunnels[name] = {
+                "pid": pids.get(name),
+                "udp_ports": sorted({v[0] for v in socks}),
+                "udp_sockets": len(socks),
+                "packet_sockets": len(pkt),
+                "drops": drops,
+                "drops_per_s": drop_rate,
+                "rx_queue_bytes": rx_queue,
+                "tx_queue_bytes": max([v[1] for v in socks] or [0]),
+                "packet_rmem_bytes": sum(pkt),
+                "undersized": bool(issues),
+                "issues": issues,
+            }
+
+        rates = {key: rate(snmp.get(key, 0), prev[1].get(key, 0)) if prev else None for key in self.SNMP_KEYS}
+        softnet_rate = rate(softnet[0], prev[2][0]) if prev else None
+        nic_rates = {iface: rate(n, prev[3].get(iface, n)) for iface, n in nic.items()} if prev else {}
+        issues = []
+        if rates["RcvbufErrors"]:
+            issues.append("UDP receive buffer errors {}/s: raise net.core.rmem_max / rmem_default".format(
+                rates["RcvbufErrors"]))
+        if rates["SndbufErrors"]:
+            issues.append("UDP send buffer errors {}/s: raise net.core.wmem_max / wmem_default".format(
+                rates["SndbufErrors"]))
+        if softnet_rate:
+            issues.append("input backlog dropped {} packets/s: raise net.core.netdev_max_backlog ({})".format(
+                softnet_rate, sysctl.get("net.core.netdev_max_backlog")))
+        for iface, r in sorted(nic_rates.items()):
+            if r:
+                issues.append("{} drops {} packets/s in the NIC queues (ring size: ethtool -g {})".format(iface, r, iface))
+        system = {
+            "udp": snmp,
+            "udp_rates": rates,
+            "softnet_dropped": softnet[0],
+            "softnet_squeezed": softnet[1],
+            "softnet_dropped_per_s": softnet_rate,
+            "nic_drops": nic,
+            "nic_drops_per_s": nic_rates,
+            "sysctl": sysctl,
+            "issues": issues,
+        }
+        with self._lock:
+            self._prev = (now, snmp, softnet, nic, drops_now)
+            self._tunnels, self._system = tunnels, system
+            if prev:
+                self._history.append([round(wall, 1), rates["RcvbufErrors"], rates["SndbufErrors"], softnet_rate,
+                                      round(sum(nic_rates.values()), 2)])
+
+    def snapshot(self, tunnel=None):
+        with self._lock:
+            tunnels = {name: t for name, t in self._tunnels.items() if tunnel is None or name == tunnel}
+            return {"interval": self.interval,
+                    "fields": ["ts", "rcvbuf_errors_per_s", "sndbuf_errors_per_s", "softnet_dropped_per_s",
+                               "nic_drops_per_s"],
+                    "history": list(self._history), "system": self._system, "tunnels": tunnels}
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception:
+                pass
+            time.sleep(self.interval)
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="sockets", daemon=True)
+            self._thread.start()
+
+
+SOCKETS = SocketTelemetry()
+
+
+def print_udp_health(seconds=3.0):
+    """CLI view (--udp-health): two samples `seconds` apart, so drop counters become rates."""
+    CONFIG_INDEX.refresh()
+    services = get_services()
+    for i in range(2):
+        SOCKETS.sample(services)
+        if i == 0:
+            time.sleep(max(1.0, seconds))
+    snap = SOCKETS.snapshot()
+    system, sysctl = snap["system"], snap["system"]["sysctl"]
+    print("Buffers: " + "  ".join("{}={}".format(k.split(".")[-1], v) for k, v in sorted(sysctl.items())))
+    rates = system["udp_rates"]
+    print("UDP /s:  in {InDatagrams}  out {OutDatagrams}  errors {InErrors}  rcvbuf errors {RcvbufErrors}"
+          "  sndbuf errors {SndbufErrors}".format(**rates))
+    print("Backlog: dropped {} total ({}/s)".format(system["softnet_dropped"], system["softnet_dropped_per_s"]))
+    print("")
+    print("{:<26} {:>8} {:>11} {:>10}  {}".format("Tunnel", "UDP+pcap", "Drops/s", "RX queue", "Status"))
+    for name, t in sorted(snap["tunnels"].items()):
+        print("{:<26} {:>8} {:>11} {:>10}  {}".format(
+            name[:26], "{}+{}".format(t["udp_sockets"], t["packet_sockets"]), t["drops_per_s"],
+            fmt_size(t["rx_queue_bytes"]), "UNDERSIZED" if t["undersized"] else "ok"))
+        for issue in t["issues"]:
+            print("    - " + issue)
+    for issue in system["issues"]:
+        print("! " + issue)
+    if not system["issues"] and not any(t["undersized"] for t in snap["tunnels"].values()):
+        print("No drops measured in {:.0f}s.".format(max(1.0, seconds)))
+
+
+# ActiveState values stored in history records (one byte each).
+STATE_CODES = {"unknown": 0, "active": 1, "inactive": 2, "failed": 3, "activating": 4,
+               "deactivating": 5, "reloading": 6}
+STATE_NAMES = {v: k for k, v in STATE_CODES.items()}
+# MESSAGE_IDs of the state-change messages systemd (PID 1) logs for a unit, and the state each
+# leaves it in. Replayed from the journal for the time no dashboard was running.
+SYSTEMD_STATE_MESSAGES = {
+    "7d4958e842da4a758f6c1cdc7b36dcc5": "activating",    # Starting ...
+    "39f53479d3a045ac8e11786248231fbf": "active",        # Started ...
+    "de5b426a63be47a7b6ac3eaac82e2f6f": "deactivating",  # Stopping ...
+    "9d1aaa27d60140bd96365438aad20286": "inactive",      # Stopped ...
+    "7ad2d189f7e94e70a38c781354912448": "inactive",      # Deactivated successfully
+    "be02cf6855d2428ba40df7e9d022f03d": "failed",        # Failed to start ...
+    "d9b373ed55a64feb8242e02dbe79a49c": "failed",        # Failed with result ...
+}
+
+
+def parse_state_messages(text, after, units):
+    """(ts, unit, state code) from `journalctl -o json` lines of SYSTEMD_STATE_MESSAGES,
+    for `units` and newer than `after`, oldest first."""
+    events = []
+    for line in text.splitlines():
+        try:
+            entry = json.loads(line)
+            ts = int(entry["__REALTIME_TIMESTAMP"]) / 1e6
+            state = SYSTEMD_STATE_MESSAGES[entry["MESSAGE_ID"]]
+        except (ValueError, KeyError, TypeError):
+            continue
+        if ts > after and entry.get("UNIT") in units:
+            events.append((ts, entry["UNIT"], STATE_CODES[state]))
+    events.sort()
+    return events
+
+
+class HistoryLog:
+    """Append-only log of service state transitions.
+
+    Each record is 64 bytes: float64 timestamp, 48-byte unit name, new state, previous state.
+    When the file exceeds max_bytes it is renamed to <file>.1 (replacing the older one), so at
+    most two files exist. Queries mmap the files and stream over the records, keeping only
+    per-unit accumulators in memory."""
+
+    RECORD = struct.Struct("<d48sBB6x")
+
+    def __init__(self, directory=HISTORY_DIR, max_bytes=HISTORY_MAX_BYTES):
+        self.path = os.path.join(directory, "history.bin")
+        self.max_bytes = max(self.RECORD.size * 16, max_bytes)
+        self._lock = threading.Lock()
+        self._states = None  # unit -> last recorded state code
+
+    def _files(self):
+        return [p for p in (self.path + ".1", self.path) if os.path.exists(p)]
+
+    def records(self):
+        """Yield (ts, unit, state, prev_state) oldest first."""
+        import mmap
+        for path in self._files():
+            try:
+                with open(path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    count = size // self.RECORD.size
+                    if not count:
+                        continue
+                    with mmap.mmap(f.fileno(), count * self.RECORD.size, access=mmap.ACCESS_READ) as mm:
+                        for off in range(0, count * self.RECORD.size, self.RECORD.size):
+                            ts, name, state, prev = self.RECORD.unpack_from(mm, off)
+                            yield ts, name.rstrip(b"\0").decode("utf-8", "replace"), state, prev
+            except (OSError, ValueError):
+                continue
+
+    def observe(self, snapshot):
+        """StatusCache listener: append a record for every unit whose state changed."""
+        if not snapshot:
+            return
+        with self._lock:
+            batch = []
+            if self._states is None:
+                # Resume from the log so a dashboard restart doesn't record fake transitions, then
+                # catch up on what systemd logged while no dashboard ran (e.g. after an idle exit).
+                self._states, last = {}, None
+                for ts, unit, state, _ in self.records():
+                    self._states[unit] = state
+                    last = ts
+                if last is not None:
+                    units = set(self._states) | {svc["unit"] for svc in snapshot["services"]}
+                    for ts, unit, state in self.replay(last, units):
+                        prev = self._states.get(unit, 0)
+                        if state != prev:
+                            batch.append(self.RECORD.pack(ts, unit.encode("utf-8")[:48], state, prev))
+                            self._states[unit] = state
+            now = time.time()
+            for svc in snapshot["services"]:
+                state = STATE_CODES.get(svc.get("state", "unknown"), 0)
+                prev = self._states.get(svc["unit"], 0)
+                if state != prev:
+                    name = svc["unit"].encode("utf-8")[:48]
+                    batch.append(self.RECORD.pack(now, name, state, prev))
+                    self._states[svc["unit"]] = state
+            if batch:
+                self._append(b"".join(batch))
+
+    @staticmethod
+    def replay(after, units):
+        """Unit state changes systemd logged after `after` (epoch seconds), from the journal."""
+        cmd = ["journalctl", "-o", "json", "--no-pager", "--since", "@{}".format(int(after)), "_PID=1"]
+        cmd += ["MESSAGE_ID=" + message_id for message_id in SYSTEMD_STATE_MESSAGES]
+        out, _, code = run_cmd(cmd, timeout=15)
+        return parse_state_messages(out, after, units) if code == 0 else []
+
+    def _append(self, data):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "ab") as f:
+                f.write(data)
+        except OSError:
+            pass
+
+    def report(self, unit=None, now=None, recent=20):
+        """Per-unit uptime %, MTBF and flap count for each window in HISTORY_WINDOWS,
+        plus the last `recent` transitions."""
+        now = now or time.time()
+        starts = [(label, now - secs) for label, secs in HISTORY_WINDOWS]
+        units = {}
+        for ts, name, state, prev in self.records():
+            if unit is not None and name != unit:
+                continue
+            u = units.get(name)
+            if u is None:
+                u = units[name] = {
+                    "state": 0, "since": ts, "recent": collections.deque(maxlen=recent),
+                    "windows": {label: {"up": 0.0, "observed": 0.0, "flaps": 0} for label, _ in starts},
+                }
+            self._accumulate(u, starts, ts)
+            for label, start in starts:
+                if ts > start and u["state"] == STATE_CODES["active"] and state != u["state"]:
+                    u["windows"][label]["flaps"] += 1
+            u["state"], u["since"] = state, ts
+            u["recent"].append({"ts": ts, "state": STATE_NAMES.get(state, "unknown"),
+                                "prev": STATE_NAMES.get(prev, "unknown")})
+        result = {}
+        for name, u in units.items():
+            self._accumulate(u, starts, now)
+            windows = {}
+            for label, w in u["windows"].items():
+                windows[label] = {
+                    "uptime_pct": round(100.0 * w["up"] / w["observed"], 3) if w["observed"] else None,
+                    "mtbf_seconds": int(w["up"] / w["flaps"]) if w["flaps"] else None,
+                    "flaps": w["flaps"],
+                    "observed_seconds": int(w["observed"]),
+                }
+            result[name] = {"state": STATE_NAMES.get(u["state"], "unknown"), "since": u["since"],
+                            "windows": windows, "recent": list(u["recent"])}
+        return result
+
+    @staticmethod
+    def _accumulate(u, starts, until):
+        # Credit the time spent in u["state"] since u["since"] to every window it overlaps.
+        if u["state"] == STATE_CODES["unknown"]:
+            return
+        for label, start in starts:
+            begin = max(u["since"], start)
+            if until > begin:
+                w = u["windows"][label]
+                w["observed"] += until - begin
+                if u["state"] == STATE_CODES["active"]:
+                    w["up"] += until - begin
+
+
+HISTORY = HistoryLog()
+
+
+class LatencyHistogram:
+    """Fixed log-scale buckets: constant memory however many probes are recorded."""
+
+    def __init__(self, bounds=PROBE_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.ok = 0
+        self.failures = 0
+        self.no_reply = 0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.ok += 1
+
+    def merged(self, other):
+        h = LatencyHistogram(self.bounds)
+        h.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        h.ok, h.failures, h.no_reply = self.ok + other.ok, self.failures + other.failures, self.no_reply + other.no_reply
+        return h
+
+    def percentile(self, q):
+        if not self.ok:
+            return None
+        rank, seen = q * self.ok, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.bounds[min(i, len(self.bounds) - 1)]
+        return self.bounds[-1]
+
+    def summary(self):
+        attempts = self.ok + self.failures
+        return {
+            "probes": attempts + self.no_reply,
+            "ok": self.ok,
+            "failures": self.failures,
+            "no_reply": self.no_reply,
+            "failure_rate": round(self.failures / attempts, 4) if attempts else None,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+        }
+
+
+class _UdpProbe:
+    """Datagram protocol for probe_udp (not derived from asyncio.DatagramProtocol, so the module
+    loads without asyncio)."""
+
+    def __init__(self, loop):
+        self.done = loop.create_future()
+
+    def connection_made(self, transport):
+        pass
+
+    def connection_lost(self, exc):
+        pass
+
+    def pause_writing(self):
+        pass
+
+    def resume_writing(self):
+        pass
+
+    def datagram_received(self, data, addr):
+        if not self.done.done():
+            self.done.set_result(None)
+
+    def error_received(self, exc):
+        if not self.done.done():
+            self.done.set_result(exc)
+
+
+async def probe_tcp(host, port, timeout=PROBE_TIMEOUT, hold=PROBE_HOLD):
+    """Returns (connect_ms, error). A connection the tunnel closes within `hold` is a failure."""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except asyncio.TimeoutError:
+        return None, "connect timeout"
+    except OSError as e:
+        return None, e.strerror or str(e)
+    ms = (loop.time() - start) * 1000
+    try:
+        if not await asyncio.wait_for(reader.read(1), hold):
+            return ms, "closed by tunnel"
+    except asyncio.TimeoutError:
+        pass  # still open and silent: normal for most proxied protocols
+    except OSError as e:
+        return ms, e.strerror or str(e)
+    finally:
+        writer.close()
+    return ms, None
+
+
+async def probe_udp(host, port, timeout=PROBE_TIMEOUT):
+    """Returns (rtt_ms, error). No reply is not an error for UDP; reported as error "no reply"."""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        transport, proto = await loop.create_datagram_endpoint(lambda: _UdpProbe(loop), remote_addr=(host, port))
+    except OSError as e:
+        return None, e.strerror or str(e)
+    try:
+        transport.sendto(b"\0")
+        err = await asyncio.wait_for(proto.done, timeout)
+        if err is not None:
+            return None, err.strerror or str(err)
+        return (loop.time() - start) * 1000, None
+    except asyncio.TimeoutError:
+        return None, "no reply"
+    finally:
+        transport.close()
+
+
+def probe_targets(configs, host=PROBE_HOST):
+    """(tunnel, proto, host, port) for every forwarded port of every client config."""
+    targets = []
+    for name, cfg in sorted(configs.items()):
+        if cfg.get("role") != "client":
+            continue
+        targets += [(name, "tcp", host, p) for p in cfg.get("forward_tcp") or []]
+        targets += [(name, "udp", host, p) for p in cfg.get("forward_udp") or []]
+    return targets
+
+
+class Prober:
+    """Probes every client forward concurrently on one asyncio loop (its own thread) and keeps
+    per-forward latency histograms covering the last one to two PROBE_WINDOWs."""
+
+    def __init__(self, interval=PROBE_INTERVAL, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT):
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._current = {}   # (tunnel, "tcp/9090") -> LatencyHistogram
+        self._previous = {}
+        self._rotated = time.monotonic()
+        self._last = {}      # (tunnel, "tcp/9090") -> {"ts", "ms", "error"}
+        self._thread = None
+
+    async def run_round(self, targets):
+        import asyncio
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(target):
+            tunnel, proto, host, port = target
+            async with sem:
+                if proto == "tcp":
+                    ms, err = await probe_tcp(host, port, self.timeout)
+                else:
+                    ms, err = await probe_udp(host, port, self.timeout)
+            self.record(tunnel, "{}/{}".format(proto, port), ms, err)
+
+        await asyncio.gather(*(one(t) for t in targets))
+
+    def record(self, tunnel, forward, ms, err):
+        with self._lock:
+            if time.monotonic() - self._rotated > PROBE_WINDOW:
+                self._previous, self._current = self._current, {}
+                self._rotated = time.monotonic()
+            h = self._current.setdefault((tunnel, forward), LatencyHistogram())
+            if err == "no reply":
+                h.no_reply += 1
+            elif err:
+                h.failures += 1
+            else:
+                h.add(ms)
+            self._last[(tunnel, forward)] = {"ts": time.time(), "ms": None if ms is None else round(ms, 2),
+                                             "error": err}
+
+    def snapshot(self):
+        with self._lock:
+            keys = set(self._current) | set(self._previous)
+            tunnels = {}
+            for key in sorted(keys):
+                tunnel, forward = key
+                empty = LatencyHistogram()
+                h = self._current.get(key, empty).merged(self._previous.get(key, empty))
+                t = tunnels.setdefault(tunnel, {"forwards": {}, "_all": LatencyHistogram()})
+                t["forwards"][forward] = dict(h.summary(), last=self._last.get(key))
+                t["_all"] = t["_all"].merged(h)
+        for t in tunnels.values():
+            t["total"] = t.pop("_all").summary()
+        return {"interval": self.interval, "window_seconds": PROBE_WINDOW, "tunnels": tunnels}
+
+    async def _loop(self):
+        import asyncio
+        while True:
+            started = time.monotonic()
+            targets = probe_targets(CONFIG_INDEX.records())
+            live = {(t[0], "{}/{}".format(t[1], t[3])) for t in targets}
+            with self._lock:
+                for table in (self._current, self._previous, self._last):
+                    for key in [k for k in table if k not in live]:
+                        del table[key]
+            try:
+                await self.run_round(targets)
+            except Exception:
+                pass
+            await asyncio.sleep(max(1.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            import asyncio
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._loop()), name="prober", daemon=True)
+            self._thread.start()
+
+
+PROBER = Prober()
+
+
+def parse_fleet(text):
+    """Peers from a fleet list: "URL [name] [tunnel-ip,...]" per line, # comments.
+    The tunnel IPs default to the URL's host; they are what client configs put in server.addr."""
+    peers = []
+    for line in text.splitlines():
+        parts = line.split("#", 1)[0].split()
+        if not parts:
+            continue
+        url = parts[0] if "://" in parts[0] else "http://" + parts[0]
+        u = urlparse(url)
+        if u.scheme not in ("http", "https") or not u.hostname:
+            print("Ignoring invalid fleet peer: " + parts[0], file=sys.stderr)
+            continue
+        name = parts[1] if len(parts) > 1 else u.netloc
+        addrs = parts[2].split(",") if len(parts) > 2 else [u.hostname]
+        peers.append((url.rstrip("/"), name, addrs))
+    return peers
+
+
+def _host_port(addr):
+    """("1.2.3.4", 9999) from "1.2.3.4:9999" or "[::1]:9999"; port None if missing."""
+    host, _, port = (addr or "").rpartition(":")
+    try:
+        return host.strip("[]"), int(port)
+    except ValueError:
+        return addr, None
+
+
+class FleetPeer:
+    """One peer dashboard: a kept-alive connection to it and a merged copy of its /api/state,
+    refreshed with since=/If-None-Match so an unchanged peer answers with an empty 304."""
+
+    def __init__(self, url, name, addrs, lock):
+        u = urlparse(url)
+        self.url, self.name, self.addrs = url, name, addrs
+        self.host, self.netloc, self.tls = u.hostname, u.netloc, u.scheme == "https"
+        self.port = u.port or (443 if self.tls else 80)
+        self.base = u.path.rstrip("/")
+        self._lock = lock
+        self._reader = self._writer = None
+        self.version = None
+        self.services, self.config_info = {}, {}
+        self.ok, self.error = False, "not polled yet"
+        self.last_ok = self.latency_ms = None
+        self.connects = self.requests = 0
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _request(self, target, headers):
+        import asyncio
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port,
+                                                                       ssl=True if self.tls else None)
+            self.connects += 1
+        lines = ["GET {} HTTP/1.1".format(target), "Host: " + self.netloc, "X-Paqet-Fleet: 1",
+                 "Accept-Encoding: identity"] + ["{}: {}".format(k, v) for k, v in headers.items()]
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await self._writer.drain()
+        parts = (await self._reader.readline()).split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/") or not parts[1].isdigit():
+            raise ConnectionError("connection closed" if not parts else "bad status line")
+        status, hdrs = int(parts[1]), {}
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                raise ConnectionError("connection closed")
+            if line in (b"\r\n", b"\n"):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            hdrs[key.strip().lower()] = value.strip()
+        if "content-length" in hdrs:
+            length = int(hdrs["content-length"])
+            if length > FLEET_MAX_BODY:
+                raise ValueError("response too large")
+            body = await self._reader.readexactly(length)
+        elif status in (204, 304):
+            body = b""
+        else:
+            body = await self._reader.read(FLEET_MAX_BODY)
+            hdrs["connection"] = "close"
+        if hdrs.get("connection", "").lower() == "close":
+            self.close()
+        self.requests += 1
+        return status, body
+
+    async def _fetch(self, target, headers):
+        import asyncio
+        reused = self._writer is not None
+        try:
+            return await self._request(target, headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+            self.close()  # the peer closed the idle connection: reconnect once
+            return await self._request(target, headers)
+
+    async def poll(self, timeout=FLEET_TIMEOUT):
+        import asyncio
+        target = self.base + "/api/state"
+        headers = {}
+        if self.version:
+            target += "?since=" + quote(self.version)
+            headers["If-None-Match"] = '"{}"'.format(self.version)
+        start = time.monotonic()
+        try:
+            status, body = await asyncio.wait_for(self._fetch(target, headers), timeout)
+            if status == 200:
+                self.apply(json.loads(body.decode("utf-8")))
+            elif status != 304:
+                raise ValueError("HTTP {}".format(status))
+            with self._lock:
+                self.ok, self.error = True, None
+                self.last_ok = time.time()
+                self.latency_ms = round((time.monotonic() - start) * 1000, 1)
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            self.close()  # a half-read response leaves the connection unusable
+            with self._lock:
+                self.ok = False
+                self.error = "timeout after {}s".format(timeout) if isinstance(e, asyncio.TimeoutError) \
+                    else str(e) or type(e).__name__
+
+    def apply(self, d):
+        with self._lock:
+            if d.get("full"):
+                self.services = {}
+            for unit in d.get("removed", []):
+                self.services.pop(unit, None)
+            for svc in d.get("services", []):
+                self.services[svc["unit"]] = svc
+            if "config_info" in d:
+                self.config_info = d["config_info"] or {}
+            self.version = d.get("version")
+
+    def snapshot(self, interval):
+        """Caller holds the lock."""
+        age = None if self.last_ok is None else round(time.time() - self.last_ok, 1)
+        return {
+            "name": self.name, "url": self.url, "local": False, "addrs": self.addrs,
+            "ok": self.ok, "error": self.error, "age_seconds": age,
+            "stale": age is None or age > 3 * interval, "latency_ms": self.latency_ms,
+            "connects": self.connects, "requests": self.requests,
+            "services": [self.services[u] for u in sorted(self.services)],
+            "config_info": self.config_info,
+        }
+
+
+class FleetCollector:
+    """Aggregates peer dashboards for /api/fleet. Each peer is polled by its own task on one
+    asyncio loop (own thread), so a slow or dead peer only delays itself. Requests are answered
+    at once from the last results, stale entries flagged, while the tasks revalidate them."""
+
+    def __init__(self, path=FLEET_FILE, peers=FLEET_PEERS, interval=FLEET_INTERVAL, timeout=FLEET_TIMEOUT):
+        self.path = path
+        self.env_peers = [p for p in peers.split(",") if p.strip()]
+        self.interval = max(1.0, interval)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._peers = collections.OrderedDict()  # url -> FleetPeer
+        self._mtime = None
+        self._loaded = False
+        self._viewed = 0.0
+        self._thread = None
+
+    def load(self):
+        """Re-read the peer list when the file changes; keeps the connections of unchanged peers.
+        Called from request threads and the poll loop: the check and rebuild happen under the lock."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        with self._lock:
+            if self._loaded and mtime == self._mtime:
+                return list(self._peers.values())
+            self._loaded, self._mtime = True, mtime
+            text = "\n".join(self.env_peers)
+            if mtime is not None:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        text += "\n" + f.read()
+                except OSError:
+                    pass
+            peers = collections.OrderedDict()
+            for url, name, addrs in parse_fleet(text):
+                old = self._peers.get(url)
+                if old is not None and (old.name, old.addrs) == (name, addrs):
+                    peers[url] = old
+                else:
+                    peers[url] = FleetPeer(url, name, addrs, self._lock)
+            self._peers = peers
+        return list(peers.values())
+
+    async def _poll_peer(self, peer):
+        import asyncio
+        try:
+            while True:
+                if time.monotonic() - self._viewed > FLEET_IDLE:
+                    peer.close()  # nobody is looking: no polling, no idle connection held open
+                    await asyncio.sleep(1)
+                    continue
+                started = time.monotonic()
+                await peer.poll(self.timeout)
+                await asyncio.sleep(max(0.5, self.interval - (time.monotonic() - started)))
+        finally:
+            peer.close()  # cancelled: the peer was removed from (or changed in) the list
+
+    async def _loop(self):
+        import asyncio
+        tasks = {}  # url -> (FleetPeer, task)
+        while True:
+            peers = {p.url: p for p in self.load()}
+            for url, (peer, task) in list(tasks.items()):
+                if peers.get(url) is not peer:
+                    task.cancel()
+                    del tasks[url]
+            for url, peer in peers.items():
+                if url not in tasks:
+                    tasks[url] = (peer, asyncio.ensure_future(self._poll_peer(peer)))
+            await asyncio.sleep(self.interval)
+
+    def view(self):
+        """Mark the fleet as watched and make sure the poller runs."""
+        self._viewed = time.monotonic()
+        if self._thread is None and self.load():
+            import asyncio
+            with self._lock:  # two first requests must not start two poll loops
+                if self._thread is not None:
+                    return
+                self._thread = threading.Thread(target=lambda: asyncio.run(self._loop()), name="fleet", daemon=True)
+                self._thread.start()
+
+    def snapshot(self):
+        self.view()
+        local = STATUS_CACHE.get()
+        nodes = [{
+            "name": os.uname().nodename, "url": None, "local": True,
+            "addrs": [a.strip() for a in FLEET_ADDR.split(",") if a.strip()],
+            "ok": True, "error": None, "age_seconds": 0, "stale": False, "latency_ms": None,
+            "services": local.get("services", []), "config_info": local.get("config_info", {}),
+        }]
+        with self._lock:
+            nodes += [peer.snapshot(self.interval) for peer in self._peers.values()]
+        return {"generated": round(time.time(), 3), "interval": self.interval, "peers": len(nodes) - 1,
+                "nodes": nodes, "pairs": fleet_pairs(nodes)}
+
+
+def fleet_pairs(nodes):
+    """Match each client config (server.addr host:port) with the server config on the node that
+    owns that host and listens on that port, and list what the two sides disagree on.
+    Clients whose server is outside the fleet are left out."""
+    servers, fleet_addrs = {}, set()
+    for node in nodes:
+        status = {svc["name"]: svc["status"] for svc in node["services"]}
+        fleet_addrs.update(node["addrs"])
+        for name, cfg in node["config_info"].items():
+            if cfg.get("role") == "server" and cfg.get("listen_port"):
+                for addr in node["addrs"]:
+                    servers[(addr, cfg["listen_port"])] = (node, name, cfg, status.get(name))
+    pairs = []
+    for node in nodes:
+        status = {svc["name"]: svc["status"] for svc in node["services"]}
+        for name, cfg in sorted(node["config_info"].items()):
+            if cfg.get("role") != "client" or not cfg.get("server"):
+                continue
+            host, port = _host_port(cfg["server"])
+            if host not in fleet_addrs:
+                continue
+            client = {"node": node["name"], "name": name, "status": status.get(name)}
+            match = servers.get((host, port))
+            if match is None:
+                pairs.append({"client": client, "server": None,
+                              "issues": ["no server config listening on {}".format(cfg["server"])]})
+                continue
+            snode, sname, scfg, sstatus = match
+            issues = []
+            for side, n in (("client", node), ("server", snode)):
+                if not n["ok"]:
+                    issues.append("{} node unreachable: {}".format(side, n["error"]))
+                elif n["stale"]:
+                    issues.append("{} node data is stale".format(side))
+            if client["status"] and sstatus and client["status"] != sstatus:
+                issues.append("client is {}, server is {}".format(client["status"], sstatus))
+            for key in ("mode", "mtu"):
+                if cfg.get(key) and scfg.get(key) and cfg[key] != scfg[key]:
+                    issues.append("{} differs: client {}, server {}".format(key, cfg[key], scfg[key]))
+            pairs.append({"client": client, "server": {"node": snode["name"], "name": sname, "status": sstatus},
+                          "issues": issues})
+    return pairs
+
+
+FLEET = FleetCollector()
+
+
+def print_history(unit=None):
+    """CLI view (--history): uptime / MTBF / flaps per tunnel."""
+    report = HISTORY.report(unit)
+    if not report:
+        print("No history recorded yet ({}). The dashboard records state changes while it runs.".format(HISTORY.path))
+        return
+    fmt = lambda v, suffix="": "-" if v is None else "{}{}".format(v, suffix)
+    print("{:<26} {:<9} {:>9} {:>9} {:>9} {:>6} {:>6} {:>6} {:>11}".format(
+        "Service", "State", "Up 1h", "Up 24h", "Up 7d", "Fl 1h", "Fl 24h", "Fl 7d", "MTBF 7d"))
+    for name in sorted(report):
+        r, w = report[name], report[name]["windows"]
+        mtbf = w["7d"]["mtbf_seconds"]
+        print("{:<26} {:<9} {:>9} {:>9} {:>9} {:>6} {:>6} {:>6} {:>11}".format(
+            name[:26], r["state"],
+            fmt(None if w["1h"]["uptime_pct"] is None else round(w["1h"]["uptime_pct"], 2), "%"),
+            fmt(None if w["24h"]["uptime_pct"] is None else round(w["24h"]["uptime_pct"], 2), "%"),
+            fmt(None if w["7d"]["uptime_pct"] is None else round(w["7d"]["uptime_pct"], 2), "%"),
+            w["1h"]["flaps"], w["24h"]["flaps"], w["7d"]["flaps"],
+            "-" if mtbf is None else "{:.1f}h".format(mtbf / 3600.0)))
+    if unit:
+        print("")
+        for ev in report.get(unit, {}).get("recent", []):
+            print("  {}  {} -> {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ev["ts"])),
+                                         ev["prev"], ev["state"]))
+
+
+class RequestStats:
+    """Dashboard request counters and latency histograms for /metrics."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = {}  # (method, route, code) -> n
+        self._hist = {}    # route -> [per-bucket counts..., sum, count]
+        self._max = {}     # route -> slowest request (seconds)
+
+    def observe(self, method, route, code, seconds):
+        with self._lock:
+            key = (method, route, code)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            h = self._hist.get(route)
+            if h is None:
+                h = self._hist[route] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+            self._max[route] = max(self._max.get(route, 0.0), seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts), {k: list(v) for k, v in self._hist.items()}
+
+    def summary(self):
+        """Per-route count, average, max and estimated percentiles (ms) for /api/debug/perf."""
+        with self._lock:
+            hist = {k: list(v) for k, v in self._hist.items()}
+            maxima = dict(self._max)
+        out = {}
+        for route, h in sorted(hist.items()):
+            out[route] = dict({
+                "count": h[-1],
+                "avg_ms": round(h[-2] / h[-1] * 1000, 1) if h[-1] else 0,
+                "max_ms": round(maxima.get(route, 0.0) * 1000, 1),
+            }, **bucket_quantiles(self.buckets, h, maxima.get(route, 0.0)))
+        return out
+
+
+REQUEST_STATS = RequestStats()
+
+
+class RequestProfiler:
+    """Profiles every request handled during a time window, then merges the profiles into one
+    cProfile dump in PROFILE_DIR. Costs nothing while no window is open."""
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._until = 0.0
+        self._stats = None
+        self._requests = 0
+        self._skipped = 0
+        self.last = None
+
+    def start(self, seconds=PROFILE_SECONDS):
+        """Open a window of `seconds`; False if one is already open."""
+        seconds = min(max(1.0, float(seconds)), PROFILE_MAX_SECONDS)
+        with self._lock:
+            if self._until:
+                return False
+            self._until = time.monotonic() + seconds
+            self._stats, self._requests, self._skipped = None, 0, 0
+        timer = threading.Timer(seconds, self._finish, args=(seconds,))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def begin(self):
+        """Profiler for the request about to run, or None outside a window."""
+        if not self._until or time.monotonic() > self._until:
+            return None
+        import cProfile  # only once profiling was asked for
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler at a time: concurrent requests are skipped.
+            with self._lock:
+                self._skipped += 1
+            return None
+        return prof
+
+    def end(self, prof):
+        if prof is None:
+            return
+        prof.disable()
+        with self._lock:
+            if not self._until:
+                return  # window closed while this request ran
+            if self._stats is None:
+                import pstats
+                self._stats = pstats.Stats(prof)
+            else:
+                self._stats.add(prof)
+            self._requests += 1
+
+    def _finish(self, seconds):
+        with self._lock:
+            stats, requests, skipped = self._stats, self._requests, self._skipped
+            self._until, self._stats = 0.0, None
+        result = {"finished": round(time.time(), 3), "seconds": seconds, "requests": requests,
+                  "skipped": skipped, "path": None, "top": []}
+        if stats is not None:
+            path = os.path.join(self.directory, "dashboard-{}.prof".format(time.strftime("%Y%m%d-%H%M%S")))
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                stats.dump_stats(path)
+                result["path"] = path
+            except OSError as e:
+                result["error"] = str(e)
+            result["top"] = top_functions(stats)
+        self.last = result
+
+    def status(self):
+        until = self._until
+        return {"active": bool(until), "remaining": round(max(0.0, until - time.monotonic()), 1) if until else 0,
+                "last": self.last}
+
+
+def top_functions(stats, limit=20):
+    """Hottest functions of a pstats.Stats by cumulative time."""
+    rows = sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:limit]
+    return [{"function": "{}:{}({})".format(os.path.basename(fn), line, func), "calls": nc,
+             "own_ms": round(tt * 1000, 2), "cumulative_ms": round(ct * 1000, 2)}
+            for (fn, line, func), (cc, nc, tt, ct, callers) in rows]
+
+
+PROFILER = RequestProfiler()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_prometheus():
+    """Text exposition of the cached status snapshot, traffic rates and request stats.
+    Never forks: everything comes from data the background threads already collected."""
+    out = []
+
+    def metric(name, kind, help_text, samples):
+        out.append("# HELP {} {}".format(name, help_text))
+        out.append("# TYPE {} {}".format(name, kind))
+        for labels, value in samples:
+            lbl = ",".join('{}="{}"'.format(k, _label(v)) for k, v in labels)
+            out.append("{}{} {}".format(name, "{" + lbl + "}" if lbl else "", value))
+
+    snap = STATUS_CACHE.peek() or {"services": [], "configs": []}
+    services = snap["services"]
+    unit_labels = lambda s: (("unit", s["unit"]), ("name", s["name"]))
+    metric("paqet_tunnel_up", "gauge", "1 if the unit is active.",
+           [(unit_labels(s), 1 if s["status"] == "active" else 0) for s in services])
+    metric("paqet_tunnel_restarts_total", "counter", "Restarts of the unit by systemd (NRestarts).",
+           [(unit_labels(s), s.get("restarts") or 0) for s in services])
+    metric("paqet_tunnel_cpu_seconds_total", "counter", "CPU time used by the unit.",
+           [(unit_labels(s), s["cpu_seconds"]) for s in services if s.get("cpu_seconds") is not None])
+    metric("paqet_tunnel_memory_bytes", "gauge", "Current memory of the unit's cgroup.",
+           [(unit_labels(s), s["memory_bytes"]) for s in services if s.get("memory_bytes") is not None])
+    metric("paqet_tunnel_uptime_seconds", "gauge", "Seconds since the unit became active.",
+           [(unit_labels(s), s["uptime_seconds"]) for s in services if s.get("uptime_seconds") is not None])
+    metric("paqet_configs", "gauge", "Number of tunnel configs in the config directory.",
+           [((), len(snap["configs"]))])
+    sockets = SOCKETS.snapshot()
+    udp = sockets["system"].get("udp", {})
+    metric("paqet_udp_datagrams_total", "counter", "UDP datagrams (/proc/net/snmp), by direction.",
+           [((("direction", d),), udp[k]) for d, k in (("in", "InDatagrams"), ("out", "OutDatagrams")) if k in udp])
+    metric("paqet_udp_errors_total", "counter", "UDP errors (/proc/net/snmp): in, rcvbuf and sndbuf.",
+           [((("type", t),), udp[k]) for t, k in (("in", "InErrors"), ("rcvbuf", "RcvbufErrors"),
+                                                   ("sndbuf", "SndbufErrors")) if k in udp])
+    if "softnet_dropped" in sockets["system"]:
+        metric("paqet_softnet_dropped_total", "counter", "Packets dropped because the input backlog was full.",
+               [((), sockets["system"]["softnet_dropped"])])
+    metric("paqet_tunnel_socket_drops", "gauge", "Sum of the drop counters of the tunnel's UDP sockets.",
+           [((("name", name),), t["drops"]) for name, t in sorted(sockets["tunnels"].items())])
+    metric("paqet_tunnel_socket_rx_queue_bytes", "gauge", "Largest receive queue among the tunnel's UDP sockets.",
+           [((("name", name),), t["rx_queue_bytes"]) for name, t in sorted(sockets["tunnels"].items())])
+    metric("paqet_tunnel_buffer_undersized", "gauge", "1 if the tunnel's UDP sockets dropped datagrams or its receive queue passed half of rmem_default.",
+           [((("name", name),), int(t["undersized"])) for name, t in sorted(sockets["tunnels"].items())])
+    metric("paqet_tunnel_log_events_total", "counter", "Classified journal entries of the tunnel, by event type.",
+           [((("name", name), ("type", etype)), n) for name, counts in sorted(LOG_STATS.totals().items())
+            for etype, n in sorted(counts.items())])
+
+    traffic = METRICS.snapshot()["tunnels"]
+    rates = [(name, t["history"][-1]) for name, t in sorted(traffic.items()) if t["history"]]
+    for idx, name, help_text in ((1, "receive_bytes", "Inbound"), (2, "transmit_bytes", "Outbound"),
+                                 (3, "receive_packets", "Inbound"), (4, "transmit_packets", "Outbound")):
+        unit = "bytes" if "bytes" in name else "packets"
+        metric("paqet_tunnel_{}_per_second".format(name), "gauge",
+               "{} {} per second on the tunnel's ports (last sample).".format(help_text, unit),
+               [((("name", n),), last[idx]) for n, last in rates])
+
+    counts, hist = REQUEST_STATS.snapshot()
+    metric("paqet_dashboard_requests_total", "counter", "Dashboard HTTP requests.",
+           [((("method", m), ("path", r), ("code", c)), n) for (m, r, c), n in sorted(counts.items())])
+    out.append("# HELP paqet_dashboard_request_duration_seconds Dashboard request latency.")
+    out.append("# TYPE paqet_dashboard_request_duration_seconds histogram")
+    for route, h in sorted(hist.items()):
+        for bound, n in zip(REQUEST_STATS.buckets, h):
+            out.append('paqet_dashboard_request_duration_seconds_bucket{{path="{}",le="{}"}} {}'.format(route, bound, n))
+        out.append('paqet_dashboard_request_duration_seconds_bucket{{path="{}",le="+Inf"}} {}'.format(route, h[-1]))
+        out.append('paqet_dashboard_request_duration_seconds_sum{{path="{}"}} {}'.format(route, round(h[-2], 6)))
+        out.append('paqet_dashboard_request_duration_seconds_count{{path="{}"}} {}'.format(route, h[-1]))
+
+    commands = sorted(COMMAND_STATS.snapshot().items())
+    metric("paqet_dashboard_subprocess_total", "counter", "Processes forked by the dashboard, by command.",
+           [((("command", name),), st["hist"][-1]) for name, st in commands])
+    metric("paqet_dashboard_subprocess_failures_total", "counter", "Forked commands that failed or timed out.",
+           [((("command", name),), st["failed"]) for name, st in commands])
+    out.append("# HELP paqet_dashboard_subprocess_duration_seconds Wall time of forked commands.")
+    out.append("# TYPE paqet_dashboard_subprocess_duration_seconds histogram")
+    for name, st in commands:
+        h = st["hist"]
+        for bound, n in zip(COMMAND_STATS.buckets, h):
+            out.append('paqet_dashboard_subprocess_duration_seconds_bucket{{command="{}",le="{}"}} {}'.format(name, bound, n))
+        out.append('paqet_dashboard_subprocess_duration_seconds_bucket{{command="{}",le="+Inf"}} {}'.format(name, h[-1]))
+        out.append('paqet_dashboard_subprocess_duration_seconds_sum{{command="{}"}} {}'.format(name, round(h[-2], 6)))
+        out.append('paqet_dashboard_subprocess_duration_seconds_count{{command="{}"}} {}'.format(name, h[-1]))
+    return "\n".join(out) + "\n"
+
+
+def _parse_networks(spec):
+    import ipaddress
+    nets = []
+    for part in spec.split(","):
+        part = part.strip()
+        if part:
+            try:
+                nets.append(ipaddress.ip_network(part, strict=False))
+            except ValueError:
+                print("Ignoring invalid PAQET_METRICS_ALLOW entry: " + part, file=sys.stderr)
+    return nets
+
+
+METRICS_NETWORKS = None  # parsed from METRICS_ALLOW on the first scrape
+
+
+def metrics_allowed(client_ip, auth_header, query_token):
+    """Scrape access is independent of the browser session: token or allowed source network."""
+    global METRICS_NETWORKS
+    import hmac
+    import ipaddress
+    if METRICS_NETWORKS is None:
+        METRICS_NETWORKS = _parse_networks(METRICS_ALLOW)
+    if METRICS_TOKEN:
+        token = query_token or ""
+        if auth_header.startswith("Bearer "):
+            token = auth_header[len("Bearer "):].strip()
+        if token and hmac.compare_digest(token, METRICS_TOKEN):
+            return True
+    try:
+        ip = ipaddress.ip_address(client_ip)
+    except ValueError:
+        return False
+    if getattr(ip, "ipv4_mapped", None):
+        ip = ip.ipv4_mapped
+    return any(ip in net for net in METRICS_NETWORKS)
+
+
+def journal_entry(line):
+    """Compact dict from one `journalctl -o json` line, or None if it can't be parsed."""
+    try:
+        raw = json.loads(line)
+    except ValueError:
+        return None
+    msg = raw.get("MESSAGE", "")
+    if isinstance(msg, list):  # non-UTF-8 messages come as a byte array
+        msg = bytes(msg).decode("utf-8", "replace")
+    try:
+        ts = int(raw.get("__REALTIME_TIMESTAMP", "0")) / 1e6
+    except ValueError:
+        ts = 0
+    try:
+        priority = int(raw.get("PRIORITY", "6"))
+    except ValueError:
+        priority = 6
+    return {
+        "cursor": raw.get("__CURSOR", ""),
+        "ts": ts,
+        "priority": priority,
+        "ident": raw.get("SYSLOG_IDENTIFIER", ""),
+        "pid": raw.get("_PID", ""),
+        "message": msg,
+    }
+
+
+def query_logs(unit, lines=100, after=None, before=None, since=None, until=None,
+               priority=None, pattern=None, timeout=10):
+    """Page through a unit's journal by cursor, filtering on the server.
+
+    Without after/before returns the newest matching entries. after=<cursor> returns entries
+    newer than the cursor, before=<cursor> older ones. Scanning stops once `lines` entries match
+    or LOG_SCAN_LIMIT entries were read, so next_cursor/prev_cursor point at the last *scanned*
+    entry and the next page never re-reads entries that did not match."""
+    cmd = ["journalctl", "-u", unit, "-o", "json", "--no-pager"]
+    reverse = after is None
+    if after is not None:
+        cmd += ["--after-cursor", after]
+    elif before is not None:
+        cmd += ["--reverse", "--cursor", before]
+    else:
+        cmd += ["--reverse"]
+    if since:
+        cmd.append("--since=" + since)
+    if until:
+        cmd.append("--until=" + until)
+    if priority:
+        cmd += ["-p", priority]
+
+    entries, first, last, scanned = [], None, None, 0
+    started = time.monotonic()
+    deadline = started + timeout
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                errors="replace", env={**os.environ, "LANG": "C"})
+    except OSError:
+        COMMAND_STATS.observe("journalctl", time.monotonic() - started, failed=True)
+        return {"entries": [], "next_cursor": after, "prev_cursor": before, "scanned": 0, "truncated": False}
+    try:
+        for line in proc.stdout:
+            entry = journal_entry(line)
+            if entry is None:
+                continue
+            if before is not None and entry["cursor"] == before:
+                continue  # --cursor is inclusive
+            scanned += 1
+            if first is None:
+                first = entry["cursor"]
+            last = entry["cursor"]
+            if pattern is None or pattern.search(entry["message"]):
+                entries.append(entry)
+                if len(entries) >= lines:
+                    break
+            if scanned >= LOG_SCAN_LIMIT or time.monotonic() > deadline:
+                break
+        truncated = proc.poll() is None
+    finally:
+        proc.kill()
+        proc.wait()
+        COMMAND_STATS.observe("journalctl", time.monotonic() - started)
+
+    if reverse:
+        entries.reverse()
+        # Reading newest-first: the first scanned entry is the newest, the last the oldest.
+        newest, oldest = first, last
+    else:
+        newest, oldest = last, first
+    next_cursor = newest or after or before
+    prev_cursor = oldest or before or after
+    return {"entries": entries, "next_cursor": next_cursor, "prev_cursor": prev_cursor,
+            "scanned": scanned, "truncated": truncated}
+
+
+class LogSubscriber:
+    """Per-client queue of journal entries. When the client falls behind by more than
+    maxlen entries the oldest are dropped and counted, so a slow reader never stalls the follower."""
+
+    def __init__(self, maxlen=LOG_CLIENT_BACKLOG):
+        self.maxlen = maxlen
+        self.closed = False
+        self._cond = threading.Condition()
+        self._entries = collections.deque()
+        self._dropped = 0
+
+    def push(self, entry):
+        with self._cond:
+            if len(self._entries) >= self.maxlen:
+                self._entries.popleft()
+                self._dropped += 1
+            self._entries.append(entry)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def take(self, timeout):
+        """Wait up to timeout for entries; returns (entries, dropped_count)."""
+        with self._cond:
+            if not self._entries and not self.closed:
+                self._cond.wait(timeout)
+            entries = list(self._entries)
+            self._entries.clear()
+            dropped, self._dropped = self._dropped, 0
+        return entries, dropped
+
+
+class LogFollower:
+    """One long-lived `journalctl -f -o json` for a unit, fanned out to all its subscribers.
+    The last ring_size entries are kept so late joiners get recent history immediately."""
+
+    def __init__(self, unit, ring_size=LOG_RING_SIZE):
+        self.unit = unit
+        self.ring = collections.deque(maxlen=ring_size)
+        self.subscribers = set()
+        self.alive = True
+        self._lock = threading.Lock()
+        started = time.monotonic()
+        self._proc = subprocess.Popen(
+            ["journalctl", "-u", unit, "-f", "-o", "json", "-n", str(ring_size), "--no-pager"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, errors="replace",
+            env={**os.environ, "LANG": "C"}
+        )
+        # Long-lived: only the spawn itself is timed.
+        COMMAND_STATS.observe("journalctl -f", time.monotonic() - started)
+        threading.Thread(target=self._read, name="follow-" + unit, daemon=True).start()
+
+    def _read(self):
+        try:
+            for line in self._proc.stdout:
+                entry = journal_entry(line)
+                if entry is None:
+                    continue
+                with self._lock:
+                    self.ring.append(entry)
+                    subscribers = list(self.subscribers)
+                for sub in subscribers:
+                    sub.push(entry)
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            self.alive = False
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            sub.close()
+
+    def subscribe(self, sub):
+        """Register sub and return the ring buffer contents at that moment."""
+        with self._lock:
+            self.subscribers.add(sub)
+            return list(self.ring)
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self.subscribers.discard(sub)
+            return len(self.subscribers)
+
+    def stop(self):
+        try:
+            self._proc.terminate()
+            self._proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+        except OSError:
+            pass
+
+
+class LogStreamHub:
+    """Shares one LogFollower per unit between SSE clients, within the follower/client caps."""
+
+    def __init__(self, max_followers=MAX_LOG_FOLLOWERS, max_clients=MAX_LOG_STREAMS):
+        self.max_followers = max_followers
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._followers = {}
+        self._clients = 0
+
+    def subscribe(self, unit):
+        """Returns (follower, subscriber, backlog), or None if a cap is reached."""
+        with self._lock:
+            if self._clients >= self.max_clients:
+                return None
+            follower = self._followers.get(unit)
+            if follower is not None and not follower.alive:
+                follower.stop()
+                follower = None
+                del self._followers[unit]
+            if follower is None:
+                if len(self._followers) >= self.max_followers:
+                    return None
+                try:
+                    follower = LogFollower(unit)
+                except OSError:
+                    return None
+                self._followers[unit] = follower
+            sub = LogSubscriber()
+            backlog = follower.subscribe(sub)
+            self._clients += 1
+        return follower, sub, backlog
+
+    def unsubscribe(self, follower, sub):
+        with self._lock:
+            self._clients -= 1
+            if follower.unsubscribe(sub) == 0 and self._followers.get(follower.unit) is follower:
+                # Last viewer left: stop journalctl rather than follow a journal nobody reads.
+                del self._followers[follower.unit]
+                follower.stop()
+
+    def close(self):
+        """Disconnect every client and stop all followers (used on shutdown)."""
+        with self._lock:
+            followers = list(self._followers.values())
+            self._followers.clear()
+        for follower in followers:
+            with follower._lock:
+                subscribers = list(follower.subscribers)
+            for sub in subscribers:
+                sub.close()
+            follower.stop()
+
+
+LOG_HUB = LogStreamHub()
+
+LOG_EVENT_RE = re.compile("|".join("(?P<{}>{})".format(name, rx) for name, rx in LOG_EVENT_PATTERNS), re.I)
+_SIGNATURE_SUBS = (
+    (re.compile(r"\[[0-9a-fA-F:]+\](?::\d+)?|\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<addr>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{12,}\b"), "<hex>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<n>"),
+)
+
+
+def classify_entry(message, priority):
+    m = LOG_EVENT_RE.search(message)
+    if m:
+        return m.lastgroup
+    return "error" if priority <= 3 else "warning" if priority == 4 else "info"
+
+
+def log_signature(message):
+    """Message with addresses, ids and numbers masked, so repeats of one error group together."""
+    for rx, repl in _SIGNATURE_SUBS:
+        message = rx.sub(repl, message)
+    return message[:200]
+
+
+class TopSignatures:
+    """Space-Saving top-N: at most `capacity` signatures. A new one replaces the least counted and
+    inherits its count (kept as the error bound), so frequent signatures are never evicted."""
+
+    def __init__(self, capacity=LOG_SIGNATURES):
+        self.capacity = capacity
+        self.items = {}  # signature -> [count, error, last_ts, type, example]
+
+    def add(self, signature, ts, etype, example):
+        item = self.items.get(signature)
+        if item is None:
+            floor = 0
+            if len(self.items) >= self.capacity:
+                floor = self.items.pop(min(self.items, key=lambda k: self.items[k][0]))[0]
+            item = self.items[signature] = [floor, floor, ts, etype, example[:300]]
+        item[0] += 1
+        item[2] = max(item[2], ts)
+
+    def top(self, n):
+        rows = sorted(self.items.items(), key=lambda kv: kv[1][0], reverse=True)[:n]
+        return [{"signature": sig, "count": c, "error": e, "last_ts": round(ts, 3), "type": t, "example": ex}
+                for sig, (c, e, ts, t, ex) in rows]
+
+
+class TunnelLogStats:
+    """Event counts per minute (last hour), per hour (last day) and since tracking began."""
+
+    def __init__(self):
+        self.minutes = {}  # minute number -> {type: n}
+        self.hours = {}    # hour number -> {type: n}
+        self.total = {}
+        self.last_ts = 0.0
+        self.signatures = TopSignatures()
+
+    def add(self, ts, etype):
+        for table, key in ((self.minutes, int(ts // 60)), (self.hours, int(ts // 3600))):
+            bucket = table.setdefault(key, {})
+            bucket[etype] = bucket.get(etype, 0) + 1
+        self.total[etype] = self.total.get(etype, 0) + 1
+        self.last_ts = max(self.last_ts, ts)
+
+    def prune(self, now):
+        for table, size, keep in ((self.minutes, 60, 60), (self.hours, 3600, 24)):
+            oldest = int(now // size) - keep + 1
+            for key in [k for k in table if k < oldest]:
+                del table[key]
+
+    @staticmethod
+    def _sum(table):
+        out = {}
+        for bucket in table.values():
+            for etype, n in bucket.items():
+                out[etype] = out.get(etype, 0) + n
+        return out
+
+    def to_json(self):
+        return {"minutes": self.minutes, "hours": self.hours, "total": self.total, "last_ts": self.last_ts,
+                "signatures": self.signatures.items}
+
+    @classmethod
+    def from_json(cls, data):
+        st = cls()
+        st.minutes = {int(k): v for k, v in data.get("minutes", {}).items()}
+        st.hours = {int(k): v for k, v in data.get("hours", {}).items()}
+        st.total = data.get("total", {})
+        st.last_ts = data.get("last_ts", 0.0)
+        st.signatures.items = {k: list(v) for k, v in data.get("signatures", {}).items()}
+        return st
+
+
+class LogAnalytics:
+    """Reads only the journal entries added since the last run (from a saved __CURSOR), classifies
+    them and keeps rolling per-tunnel counters and top error signatures. Each run costs one
+    journalctl for all tunnels and work proportional to the new lines. The cursor and counters are
+    saved together in HISTORY_DIR, so a restart resumes without re-reading or double counting."""
+
+    def __init__(self, directory=HISTORY_DIR, interval=LOG_STATS_INTERVAL, batch=LOG_STATS_BATCH):
+        self.path = os.path.join(directory, "log-stats.json")
+        self.interval = interval
+        self.batch = max(100, batch)
+        self._lock = threading.Lock()
+        self._tunnels = {}  # tunnel name -> TunnelLogStats
+        self.cursor = None
+        self.lines_total = 0
+        self.last_run = None  # {"ts", "lines", "ms"}
+        self._saved = 0.0
+        self._dirty = False
+        self._thread = None
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            tunnels = {name: TunnelLogStats.from_json(st) for name, st in data.get("tunnels", {}).items()}
+        except (OSError, ValueError, AttributeError, TypeError):
+            return
+        with self._lock:
+            self._tunnels = tunnels
+            self.cursor = data.get("cursor")
+            self.lines_total = data.get("lines_total", 0)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps({"cursor": self.cursor, "lines_total": self.lines_total,
+                               "tunnels": {name: st.to_json() for name, st in self._tunnels.items()}})
+            self._dirty = False
+        tmp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+            self._saved = time.monotonic()
+        except OSError:
+            pass
+
+    def run_once(self):
+        """Consume new journal entries (up to the batch size); returns how many were read."""
+        cmd = ["journalctl", "-u", "paqet-*", "-o", "json", "--no-pager"]
+        cmd += ["--after-cursor", self.cursor] if self.cursor else ["-n", str(LOG_STATS_BOOTSTRAP)]
+        started = time.monotonic()
+        events, cursor, lines = [], None, 0
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                    errors="replace", env={**os.environ, "LANG": "C"})
+        except OSError:
+            COMMAND_STATS.observe("journalctl", time.monotonic() - started, failed=True)
+            return 0
+        try:
+            for line in proc.stdout:
+                try:
+                    raw = json.loads(line)
+                except ValueError:
+                    continue
+                lines += 1
+                cursor = raw.get("__CURSOR") or cursor
+                unit = raw.get("UNIT") or raw.get("_SYSTEMD_UNIT") or ""  # UNIT: systemd's own messages
+                if unit.startswith("paqet-") and unit.endswith(".service") and unit not in TOOL_UNITS:
+                    msg = raw.get("MESSAGE", "")
+                    if isinstance(msg, list):
+                        msg = bytes(msg).decode("utf-8", "replace")
+                    try:
+                        ts = int(raw.get("__REALTIME_TIMESTAMP", "0")) / 1e6
+                        priority = int(raw.get("PRIORITY", "6"))
+                    except ValueError:
+                        ts, priority = time.time(), 6
+                    events.append((unit[len("paqet-"):-len(".service")], ts, priority, msg))
+                if lines >= self.batch:
+                    break
+        finally:
+            proc.kill()
+            proc.wait()
+        COMMAND_STATS.observe("journalctl", time.monotonic() - started)
+        if not lines and self.cursor and proc.returncode not in (0, -signal.SIGKILL):
+            self.cursor = None  # cursor no longer in the journal (vacuumed): start over from the tail
+            return 0
+
+        now = time.time()
+        with self._lock:
+            for name, ts, priority, msg in events:
+                etype = classify_entry(msg, priority)
+                st = self._tunnels.get(name)
+                if st is None:
+                    st = self._tunnels[name] = TunnelLogStats()
+                st.add(ts, etype)
+                if etype in LOG_ERROR_TYPES or priority <= 4:
+                    st.signatures.add(log_signature(msg), ts, etype, msg)
+            for st in self._tunnels.values():
+                st.prune(now)
+            if cursor:
+                self.cursor = cursor
+                self._dirty = True
+            self.lines_total += lines
+            self.last_run = {"ts": round(now, 3), "lines": lines, "ms": round((time.monotonic() - started) * 1000, 1)}
+        return lines
+
+    def snapshot(self, tunnel=None, top=10):
+        now = time.time()
+        with self._lock:
+            tunnels, merged = {}, []
+            for name, st in sorted(self._tunnels.items()):
+                if tunnel and name != tunnel:
+                    continue
+                st.prune(now)
+                errors = st.signatures.top(top)
+                tunnels[name] = {"1h": st._sum(st.minutes), "24h": st._sum(st.hours), "total": dict(st.total),
+                                 "last_ts": round(st.last_ts, 3), "top_errors": errors}
+                merged += [dict(e, tunnel=name) for e in errors]
+            result = {"interval": self.interval, "last_run": self.last_run, "lines_total": self.lines_total,
+                      "types": [name for name, _ in LOG_EVENT_PATTERNS] + ["error", "warning", "info"]}
+        result["tunnels"] = tunnels
+        result["top_errors"] = sorted(merged, key=lambda e: e["count"], reverse=True)[:top]
+        return result
+
+    def totals(self):
+        with self._lock:
+            return {name: dict(st.total) for name, st in self._tunnels.items()}
+
+    def _run(self):
+        self.load()
+        while True:
+            try:
+                full = self.run_once() >= self.batch
+            except Exception:
+                full = False
+            if time.monotonic() - self._saved >= LOG_STATS_SAVE_INTERVAL:
+                self.save()
+            time.sleep(0.2 if full else self.interval)  # catch up quickly after a burst
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="log-stats", daemon=True)
+            self._thread.start()
+
+
+LOG_STATS = LogAnalytics()
+# Started by main(), or on demand (--idle-exit / socket activation) by the first request that
+# reads them, so a process started for one page view does not fork systemctl/iptables-save/journalctl.
+COLLECTORS = (STATUS_CACHE, METRICS, PROBER, LOG_STATS, SOCKETS)
+_COLLECTORS_LOCK = threading.Lock()
+
+
+def use_collectors(*collectors):
+    """Start `collectors` unless already running (each start() is a no-op the second time)."""
+    with _COLLECTORS_LOCK:
+        for collector in collectors:
+            collector.start()
 
 
 def valid_session(cookie_header):
@@ -90,36 +2689,235 @@ def valid_session(cookie_header):
     return False
 
 
+def sse_events(entries):
+    return "".join(
+        "id: {}\ndata: {}\n\n".format(e["cursor"], json.dumps(e, ensure_ascii=False)) for e in entries
+    ).encode("utf-8")
+
+
+# Encoded and gzipped HTML pages: str -> (raw bytes, gzip bytes, etag). Built on first use, so
+# startup (and a socket-activated first request for /api/...) does not pay for it.
+HTML_CACHE = {}
+
+
+def compress_html(html):
+    import gzip
+    raw = html.encode("utf-8")
+    return raw, gzip.compress(raw, 9), '"{}"'.format(hashlib.sha1(raw).hexdigest()[:16])
+
+
+def cached_html(html):
+    page = HTML_CACHE.get(html)
+    if page is None:
+        page = HTML_CACHE[html] = compress_html(html)
+    return page
+
+
+def persistent_secret(path):
+    """Random secret stored in `path` (created 0600 on first use); a fresh one if unwritable."""
+    try:
+        with open(path, encoding="ascii") as f:
+            secret = f.read().strip()
+        if len(secret) >= 32:
+            return secret
+    except OSError:
+        pass
+    secret = secrets.token_hex(16)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secret)
+    except OSError:
+        pass
+    return secret
+
+
 def make_session_cookie():
     return "{}={}; Path=/; HttpOnly; SameSite=Lax".format(COOKIE_NAME, SESSION_TOKEN)
 
 
 class DashboardHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
     def log_message(self, format, *args):
         pass
 
+    def send_response(self, code, message=None):
+        self._status = code
+        self._sized = code in (204, 304)
+        self._conn_header = False
+        BaseHTTPRequestHandler.send_response(self, code, message)
+
+    def send_header(self, keyword, value):
+        key = keyword.lower()
+        if key == "content-length":
+            self._sized = True
+        elif key == "connection":
+            self._conn_header = True
+        BaseHTTPRequestHandler.send_header(self, keyword, value)
+
+    def end_headers(self):
+        timing = current_timing()
+        if timing is not None:
+            self.send_header("Server-Timing", timing.header())
+        # Keep-alive only for fleet aggregators (X-Paqet-Fleet) and sized responses. Browsers get
+        # one request per connection, so idle sockets never hold one of the worker slots.
+        headers = getattr(self, "headers", None)
+        if not (getattr(self, "_sized", False) and headers is not None and headers.get("X-Paqet-Fleet")):
+            if not getattr(self, "_conn_header", False):
+                BaseHTTPRequestHandler.send_header(self, "Connection", "close")
+            self.close_connection = True
+        BaseHTTPRequestHandler.end_headers(self)
+
+    def parse_request(self):
+        # The clock starts once a request line has arrived, not while a kept-alive connection idles.
+        _TIMING.request.start = time.monotonic()
+        self._prof = PROFILER.begin()
+        return BaseHTTPRequestHandler.parse_request(self)
+
+    def handle_one_request(self):
+        self._status = None
+        self._prof = None
+        timing = _TIMING.request = RequestTiming()
+        try:
+            BaseHTTPRequestHandler.handle_one_request(self)
+        finally:
+            PROFILER.end(self._prof)
+            _TIMING.request = None
+        if self.command and self._status is not None:
+            path = urlparse(self.path).path.rstrip("/") or "/"
+            if path in KNOWN_ROUTES:
+                route = path
+            elif path.startswith("/api/jobs/"):
+                route = "/api/jobs/:id"
+            else:
+                route = "other"
+            seconds = time.monotonic() - timing.start
+            REQUEST_STATS.observe(self.command, route, self._status, seconds)
+            if ACCESS_LOG:
+                sys.stderr.write("{} {} {} {} {:.1f}ms forks={}\n".format(
+                    self.client_address[0], self.command, path, self._status, seconds * 1000, timing.forks))
+
     def send_redirect(self, location, status=302):
         self.send_response(status)
         self.send_header("Location", location)
         self.end_headers()
 
-    def send_json(self, data, status=200):
+    def send_json(self, data, status=200, headers=None):
+        start = time.monotonic()
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        timing = current_timing()
+        if timing is not None:
+            timing.json_seconds += time.monotonic() - start
         self.send_response(status)
         self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        self.wfile.write(body)
+
+    def debug_allowed(self, cookie):
+        """/api/debug/*: same access as /metrics, or a logged-in session."""
+        qs = parse_qs(urlparse(self.path).query)
+        return valid_session(cookie) or metrics_allowed(
+            self.client_address[0], self.headers.get("Authorization", ""), qs.get("token", [""])[0])
+
+    def accepts_gzip(self):
+        return "gzip" in self.headers.get("Accept-Encoding", "")
 
     def send_html(self, html, status=200):
+        raw, packed, etag = cached_html(html)
+        body = raw
+        if self.accepts_gzip():
+            # A different representation under Vary: Accept-Encoding, so a tag of its own
+            body, etag = packed, etag[:-1] + '-gz"'
+        if status == 200 and self.headers.get("If-None-Match", "") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
         self.send_response(status)
         self.send_header("Content-Type", "text/html; charset=utf-8")
+        if body is packed:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
         self.end_headers()
-        self.wfile.write(html.encode("utf-8"))
+        self.wfile.write(body)
+
+    def stream_logs(self, unit):
+        """Server-Sent Events: recent ring buffer first, then new journal entries as they arrive."""
+        stream = LOG_HUB.subscribe(unit)
+        if stream is None:
+            self.send_json({"error": "too many log streams, try again later"}, 503)
+            return
+        follower, sub, backlog = stream
+        self.server.release_worker(self.request)  # streams are bounded by LOG_HUB, not by the workers
+        self.close_connection = True  # no further keep-alive requests without a worker slot
+        last_id = self.headers.get("Last-Event-ID", "")
+        if last_id:
+            # Reconnecting client: only resend what it hasn't seen.
+            for i, entry in enumerate(backlog):
+                if entry["cursor"] == last_id:
+                    backlog = backlog[i + 1:]
+                    break
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("X-Accel-Buffering", "no")
+            self.end_headers()
+            self.wfile.write(sse_events(backlog))
+            while not sub.closed:
+                entries, dropped = sub.take(SSE_KEEPALIVE)
+                chunk = b""
+                if dropped:
+                    chunk += "event: dropped\ndata: {}\n\n".format(dropped).encode("utf-8")
+                if entries:
+                    chunk += sse_events(entries)
+                self.wfile.write(chunk or b": keepalive\n\n")
+        except (OSError, ValueError):
+            pass  # client disconnected or write timed out
+        finally:
+            LOG_HUB.unsubscribe(follower, sub)
 
     def do_GET(self):
         path = urlparse(self.path).path.rstrip("/") or "/"
         qs = parse_qs(urlparse(self.path).query)
         cookie = self.headers.get("Cookie", "")
 
+        if path == "/metrics":
+            if not metrics_allowed(self.client_address[0], self.headers.get("Authorization", ""),
+                                   qs.get("token", [""])[0]):
+                self.send_response(404)
+                self.end_headers()
+                return
+            use_collectors(*COLLECTORS)
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path == "/api/debug/perf":
+            if not self.debug_allowed(cookie):
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_json({
+                "pid": os.getpid(),
+                "threads": threading.active_count(),
+                "requests": REQUEST_STATS.summary(),
+                "commands": COMMAND_STATS.summary(),
+                "profile": PROFILER.status(),
+            })
+            return
         if path == "/":
             self.send_redirect("/login")
             return
@@ -133,15 +2931,103 @@ class DashboardHandler(BaseHTTPRequestHandler):
             self.send_html(DASHBOARD_HTML)
             return
         if path == "/api/status":
-            self.send_json({"services": get_services(), "configs": get_all_configs()})
+            use_collectors(STATUS_CACHE)
+            self.send_json(STATUS_CACHE.get())
+            return
+        if path == "/api/state":
+            # Combined status + configs, versioned: If-None-Match -> 304, since=<version> -> delta.
+            use_collectors(STATUS_CACHE)
+            STATUS_CACHE.get()
+            etag = STATE.etag()
+            if self.headers.get("If-None-Match", "") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            data = STATE.delta(qs.get("since", [""])[0])
+            self.send_json(data, headers={"ETag": '"{}"'.format(data["version"]), "Cache-Control": "no-cache"})
             return
         if path == "/api/logs":
-            unit = qs.get("service", ["paqet-default"])[0]
-            if not unit.endswith(".service"):
-                unit = "paqet-" + unit.replace("paqet-", "") + ".service"
-            lines = int(qs.get("lines", [100])[0])
-            logs = get_logs(unit, lines)
-            self.send_json({"service": unit, "logs": logs})
+            unit = unit_name(qs.get("service", ["paqet-default"])[0])
+            try:
+                lines = min(max(1, int(qs.get("lines", [100])[0])), MAX_LOG_LINES)
+            except ValueError:
+                self.send_json({"error": "invalid lines"}, 400)
+                return
+            if not any(k in qs for k in LOG_QUERY_PARAMS):
+                logs = get_logs(unit, lines)
+                self.send_json({"service": unit, "logs": logs})
+                return
+            param = lambda k: (qs.get(k, [""])[0].strip() or None)
+            priority = param("priority")
+            if priority and not PRIORITY_RE.match(priority):
+                self.send_json({"error": "invalid priority"}, 400)
+                return
+            pattern = None
+            if param("grep"):
+                try:
+                    if param("regex") in ("1", "true", "yes"):
+                        pattern = re.compile(param("grep"), re.IGNORECASE)
+                    else:
+                        pattern = re.compile(re.escape(param("grep")), re.IGNORECASE)
+                except re.error as e:
+                    self.send_json({"error": "invalid regex: {}".format(e)}, 400)
+                    return
+            result = query_logs(unit, lines, after=param("after"), before=param("before"),
+                                since=param("since"), until=param("until"),
+                                priority=priority, pattern=pattern)
+            result["service"] = unit
+            self.send_json(result)
+            return
+        if path == "/api/logs/stream":
+            self.stream_logs(unit_name(qs.get("service", ["paqet-default"])[0]))
+            return
+        if path == "/api/jobs" or path.startswith("/api/jobs/"):
+            # Same as POST /api/bulk: jobs name units and carry their errors
+            if not valid_session(cookie):
+                self.send_json({"error": "login required"}, 401)
+                return
+        if path == "/api/jobs":
+            self.send_json({"jobs": JOBS.list()})
+            return
+        if path.startswith("/api/jobs/"):
+            job = JOBS.get(path[len("/api/jobs/"):])
+            if job is None:
+                self.send_json({"error": "unknown job"}, 404)
+                return
+            self.send_json(job)
+            return
+        if path == "/api/metrics":
+            tunnel = qs.get("tunnel", [""])[0].strip() or None
+            use_collectors(METRICS)
+            self.send_json(METRICS.snapshot(tunnel))
+            return
+        if path == "/api/history":
+            unit = qs.get("service", [""])[0].strip()
+            self.send_json({"windows": [label for label, _ in HISTORY_WINDOWS],
+                            "services": HISTORY.report(unit_name(unit) if unit else None)})
+            return
+        if path == "/api/probes":
+            use_collectors(PROBER)
+            self.send_json(PROBER.snapshot())
+            return
+        if path == "/api/fleet":
+            self.send_json(FLEET.snapshot())
+            return
+        if path == "/api/udp-health":
+            service = qs.get("service", [""])[0]
+            use_collectors(STATUS_CACHE, SOCKETS)
+            self.send_json(SOCKETS.snapshot(service.replace("paqet-", "").replace(".service", "") or None))
+            return
+        if path == "/api/log-stats":
+            service = qs.get("service", [""])[0]
+            try:
+                top = min(max(1, int(qs.get("top", [10])[0])), LOG_SIGNATURES)
+            except ValueError:
+                self.send_json({"error": "invalid top"}, 400)
+                return
+            use_collectors(LOG_STATS)
+            self.send_json(LOG_STATS.snapshot(service.replace("paqet-", "").replace(".service", "") or None, top))
             return
         if path == "/api/config":
             name = qs.get("name", [""])[0].strip() or qs.get("config", [""])[0].strip()
@@ -184,16 +3070,174 @@ class DashboardHandler(BaseHTTPRequestHandler):
                 if not unit:
                     self.send_json({"ok": False, "error": "missing service"}, 400)
                     return
-                if not unit.endswith(".service"):
-                    unit = "paqet-" + unit.replace("paqet-", "") + ".service"
+                unit = unit_name(unit)
                 run_cmd(["systemctl", "restart", unit])
+                STATUS_CACHE.invalidate()
                 self.send_json({"ok": True, "service": unit})
             except Exception as e:
                 self.send_json({"ok": False, "error": str(e)}, 500)
             return
+        if path == "/api/bulk":
+            self.start_bulk_job(cookie)
+            return
+        if path == "/api/debug/profile":
+            if not self.debug_allowed(cookie):
+                self.send_response(404)
+                self.end_headers()
+                return
+            qs = parse_qs(urlparse(self.path).query)
+            try:
+                seconds = float(qs.get("seconds", [PROFILE_SECONDS])[0])
+            except ValueError:
+                self.send_json({"error": "seconds must be a number"}, 400)
+                return
+            if not PROFILER.start(seconds):
+                self.send_json({"error": "a profile is already running", "profile": PROFILER.status()}, 409)
+                return
+            self.send_json({"profiling": True, "profile": PROFILER.status(), "dir": PROFILER.directory}, 202)
+            return
         self.send_response(404)
         self.end_headers()
 
+    def start_bulk_job(self, cookie):
+        """POST {"action": "restart", "units": [...]} or {"action": ..., "role": "client", "name": "ir-*"};
+        replies 202 with a job id right away. Progress: GET /api/jobs/<id>."""
+        if not valid_session(cookie):
+            self.send_json({"error": "login required"}, 401)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data = json.loads(self.rfile.read(length).decode("utf-8") if length else "{}")
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            self.send_json({"error": "invalid JSON: {}".format(e)}, 400)
+            return
+        action = data.get("action", "")
+        if action not in BULK_ACTIONS:
+            self.send_json({"error": "action must be one of: " + ", ".join(BULK_ACTIONS)}, 400)
+            return
+        if data.get("units"):
+            if not isinstance(data["units"], list):
+                self.send_json({"error": "units must be a list"}, 400)
+                return
+            units = [unit_name(str(u)) for u in data["units"]]
+            bad = [u for u in units if not UNIT_RE.match(u)]
+            if bad:
+                self.send_json({"error": "invalid unit name(s): " + ", ".join(bad)}, 400)
+                return
+        elif data.get("role") or data.get("name"):
+            units = select_units(role=data.get("role") or None, pattern=data.get("name") or None)
+        else:
+            self.send_json({"error": "give units, or a role and/or name selector"}, 400)
+            return
+        units = list(collections.OrderedDict.fromkeys(units))
+        if not units:
+            self.send_json({"error": "no units matched"}, 404)
+            return
+        job = JOBS.submit(action, units)
+        self.send_json({"job": job.id, "action": action, "units": units, "status_url": "/api/jobs/" + job.id}, 202)
+
+
+class DashboardServer(ThreadingMixIn, HTTPServer):
+    """HTTPServer that runs each request on its own thread, at most max_workers at once.
+    A slow journalctl/systemctl call then only ties up one worker instead of the whole UI.
+    When all workers are busy a new connection gets a 503 at once, so the accept loop never waits;
+    log streams give their worker back (LOG_HUB caps them) and do not count against the bound."""
+    daemon_threads = False  # server_close() waits for in-flight requests (graceful shutdown)
+    allow_reuse_address = True
+
+    def __init__(self, addr, handler, max_workers=DEFAULT_WORKERS, request_timeout=DEFAULT_REQUEST_TIMEOUT,
+                 sock=None):
+        self.max_workers = max(1, max_workers)
+        self.request_timeout = request_timeout
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._holding = set()  # requests that hold a worker slot
+        self.active = 0  # connections being served (an open log stream counts as one)
+        self.last_active = time.monotonic()
+        self._active_lock = threading.Lock()
+        if sock is None:
+            HTTPServer.__init__(self, addr, handler)
+            return
+        # Socket activation: systemd already bound and listens on the socket.
+        HTTPServer.__init__(self, addr, handler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.address_family = sock.family
+        self.server_address = sock.getsockname()
+        self.server_name, self.server_port = str(self.server_address[0]), self.server_address[1]
+
+    def process_request(self, request, client_address):
+        # Runs on the accept thread: never wait here for a worker to free up.
+        if not self._slots.acquire(blocking=False):
+            self.reject(request)
+            return
+        with self._active_lock:
+            self.active += 1
+            self._holding.add(request)
+        try:
+            request.settimeout(self.request_timeout)
+            ThreadingMixIn.process_request(self, request, client_address)
+        except Exception:
+            self._done(request)
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            self._done(request)
+
+    def reject(self, request):
+        """503 without reading the request, then close (best effort, never blocks)."""
+        body = b'{"error": "server busy, try again"}'
+        try:
+            request.setblocking(False)
+            try:
+                request.recv(65536)  # drop what already arrived, so closing doesn't reset the 503
+            except OSError:
+                pass
+            request.send(b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                         b"Retry-After: 1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def release_worker(self, request):
+        """Hand the worker slot of a long-lived request (a log stream) back to the pool."""
+        with self._active_lock:
+            if request not in self._holding:
+                return
+            self._holding.discard(request)
+        self._slots.release()
+
+    def _done(self, request):
+        with self._active_lock:
+            self.last_active = time.monotonic()
+            self.active -= 1
+        self.release_worker(request)
+
+    def idle_for(self):
+        """Seconds since the last connection closed, or 0 while any is open."""
+        return 0.0 if self.active else time.monotonic() - self.last_active
+
+
+def systemd_listen_fds():
+    """Listening sockets passed by systemd socket activation (LISTEN_FDS), else []."""
+    try:
+        if int(os.environ.get("LISTEN_PID", "0")) != os.getpid():
+            return []
+        count = int(os.environ.get("LISTEN_FDS", "0"))
+    except ValueError:
+        return []
+    for var in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(var, None)  # not for our children (journalctl, systemctl)
+    socks = []
+    for fd in range(3, 3 + count):  # SD_LISTEN_FDS_START
+        os.set_inheritable(fd, False)
+        socks.append(socket.socket(fileno=fd))
+    return socks
+
 
 LOGIN_HTML = """<!DOCTYPE html>
 <html lang="en">
@@ -201,9 +3245,6 @@ LOGIN_HTML = """<!DOCTYPE html>
   <meta charset="utf-8">
   <meta name="viewport" content="width=device-width, initial-scale=1">
   <title>Sign in – Secure Portal</title>
-  <link rel="preconnect" href="https://fonts.googleapis.com">
-  <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-  <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
   <style>
     * { box-sizing: border-box; margin: 0; padding: 0; }
     body { font-family: 'Inter', system-ui, sans-serif; min-height: 100vh; background: linear-gradient(135deg, #0f172a 0%, #1e293b 50%, #0f172a 100%); color: #e2e8f0; display: flex; align-items: center; justify-content: center; padding: 20px; }
@@ -249,9 +3290,6 @@ DASHBOARD_HTML = """<!DOCTYPE html>
   <meta charset="utf-8">
   <meta name="viewport" content="width=device-width, initial-scale=1">
   <title>Dashboard – Secure Portal</title>
-  <link rel="preconnect" href="https://fonts.googleapis.com">
-  <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-  <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
   <style>
     * { box-sizing: border-box; margin: 0; padding: 0; }
     body { font-family: 'Inter', system-ui, sans-serif; background: #0f172a; color: #e2e8f0; min-height: 100vh; }
@@ -268,6 +3306,10 @@ DASHBOARD_HTML = """<!DOCTYPE html>
     .status.inactive { background: #ef4444; box-shadow: 0 0 8px #ef4444; }
     .row { display: flex; align-items: center; justify-content: space-between; padding: 12px 0; border-bottom: 1px solid #334155; }
     .row:last-child { border-bottom: none; }
+    .usage { color: #64748b; font-size: 0.75rem; margin-left: 8px; }
+    .spark { vertical-align: middle; margin-right: 12px; }
+    .spark polyline { fill: none; stroke: #3b82f6; stroke-width: 1.5; }
+    .spark polyline.tx { stroke: #22c55e; }
     .tabs { display: flex; gap: 8px; margin-bottom: 16px; }
     .tabs button { padding: 10px 18px; border: 1px solid #475569; background: #0f172a; color: #94a3b8; border-radius: 8px; cursor: pointer; font-size: 0.875rem; font-weight: 500; }
     .tabs button:hover { background: #1e293b; color: #e2e8f0; }
@@ -288,9 +3330,21 @@ DASHBOARD_HTML = """<!DOCTYPE html>
   <main class="main">
     <div class="card">
       <h2>Services</h2>
-      <div class="meta"><button class="act" onclick="refresh()">Refresh</button></div>
+      <div class="meta"><button class="act" onclick="refresh()">Refresh</button>
+        <span>Bulk:</span> <select id="bulkRole"><option value="">any role</option><option value="server">server</option><option value="client">client</option></select>
+        <input type="text" id="bulkName" placeholder="name pattern, e.g. ir-*" style="width:170px">
+        <select id="bulkAction"><option>restart</option><option>start</option><option>stop</option></select>
+        <button class="act" onclick="runBulk()">Run</button> <span id="bulkStatus"></span></div>
       <div id="serviceList">Loading…</div>
     </div>
+    <div class="card" id="fleetCard" style="display:none">
+      <h2>Fleet</h2>
+      <div id="fleetList">Loading…</div>
+    </div>
+    <div class="card">
+      <h2>Traffic</h2>
+      <div id="trafficList">Loading…</div>
+    </div>
     <div class="card">
       <h2>Logs &amp; Configuration</h2>
       <div class="tabs">
@@ -298,7 +3352,10 @@ DASHBOARD_HTML = """<!DOCTYPE html>
         <button onclick="showTab('config')">Configuration</button>
       </div>
       <div id="logsTab">
-        <div class="meta">Service: <select id="logService"></select> Lines: <input type="number" id="logLines" value="100" min="10" max="500" style="width:70px"> <button class="act" onclick="loadLogs()">Load logs</button></div>
+        <div class="meta">Service: <select id="logService"></select> Lines: <input type="number" id="logLines" value="100" min="10" max="5000" style="width:80px">
+          Priority: <select id="logPriority"><option value="">all</option><option value="warning">warning+</option><option value="err">error+</option></select>
+          <input type="text" id="logFilter" placeholder="Filter text" style="width:140px">
+          <button class="act" onclick="loadLogs()">Load logs</button> <button class="act" onclick="olderLogs()">Older</button> <button class="act" onclick="newerLogs()">Newer</button> <button class="act" id="followBtn" onclick="toggleFollow()">Follow</button></div>
         <pre id="logOutput">Select a service and click Load logs.</pre>
       </div>
       <div id="configTab" style="display:none">
@@ -310,23 +3367,154 @@ DASHBOARD_HTML = """<!DOCTYPE html>
   <footer class="footer">&copy; 2026 Secure Portal. All rights reserved.</footer>
 
   <script>
+    function fmtBytes(n) {
+      if (n == null) return '–';
+      var u = ['B', 'KB', 'MB', 'GB']; var i = 0;
+      while (n >= 1024 && i < u.length - 1) { n /= 1024; i++; }
+      return n.toFixed(i ? 1 : 0) + ' ' + u[i];
+    }
+    function fmtDuration(sec) {
+      if (sec == null) return '–';
+      var d = Math.floor(sec / 86400), h = Math.floor(sec % 86400 / 3600), m = Math.floor(sec % 3600 / 60);
+      return d ? d + 'd ' + h + 'h' : h ? h + 'h ' + m + 'm' : m + 'm';
+    }
+    function tunnelInfo(c) {
+      if (!c) return '';
+      var parts = [c.role || '?'];
+      if (c.mode) parts.push(c.mode);
+      if (c.mtu) parts.push('mtu ' + c.mtu);
+      if (c.conn) parts.push('conn ' + c.conn);
+      if (c.listen_port) parts.push('listen ' + c.listen_port);
+      if (c.server) parts.push('→ ' + c.server);
+      if (c.forward_tcp && c.forward_tcp.length) parts.push('tcp ' + c.forward_tcp.join(','));
+      if (c.forward_udp && c.forward_udp.length) parts.push('udp ' + c.forward_udp.join(','));
+      return '<br><span class="usage">' + parts.join(' · ') + '</span>';
+    }
+    function usage(s) {
+      return 'PID ' + (s.pid || '–') + ' · CPU ' + (s.cpu_seconds == null ? '–' : s.cpu_seconds.toFixed(1) + 's') +
+        ' · Mem ' + fmtBytes(s.memory_bytes) + ' · Up ' + fmtDuration(s.uptime_seconds) + ' · Restarts ' + (s.restarts || 0);
+    }
+    function fmtRate(bps) { return fmtBytes(bps) + '/s'; }
+    function sparkline(points, idx, cls, max) {
+      var w = 160, h = 28;
+      if (points.length < 2) return '';
+      var step = w / (points.length - 1);
+      return '<polyline class="' + cls + '" points="' + points.map(function(p, i) {
+        return (i * step).toFixed(1) + ',' + (h - 1 - (p[idx] / max) * (h - 2)).toFixed(1);
+      }).join(' ') + '"/>';
+    }
+    var probes = {};
+    function probeInfo(n) {
+      var t = (probes.tunnels || {})[n];
+      if (!t || !t.total.probes) return '';
+      var p = t.total;
+      return '<br><span class="usage">probe p50 ' + (p.p50_ms == null ? '–' : p.p50_ms + ' ms') + ' · p95 ' + (p.p95_ms == null ? '–' : p.p95_ms + ' ms') +
+        ' · fail ' + (p.failure_rate == null ? '–' : (p.failure_rate * 100).toFixed(1) + '%') + '</span>';
+    }
+    var logStats = {};
+    function logInfo(n) {
+      var t = (logStats.tunnels || {})[n];
+      if (!t) return '';
+      var skip = { info: 1, service_start: 1 };
+      var parts = Object.keys(t['1h']).filter(function(k) { return !skip[k]; }).sort(function(a, b) { return t['1h'][b] - t['1h'][a]; })
+        .map(function(k) { return t['1h'][k] + ' ' + k.replace('_', ' '); });
+      var top = t.top_errors[0];
+      return '<br><span class="usage">log 1h: ' + (parts.join(' · ') || 'no errors') + (top ? ' · top: ' + top.count + '× ' + top.signature.replace(/</g, '&lt;') : '') + '</span>';
+    }
+    var udpHealth = {};
+    function udpInfo(n) {
+      var t = (udpHealth.tunnels || {})[n];
+      if (!t || !(t.udp_sockets || t.packet_sockets)) return '';
+      var parts = [t.udp_sockets + ' udp / ' + t.packet_sockets + ' pcap socket(s)', 'drops ' + (t.drops_per_s === null ? '-' : t.drops_per_s) + '/s',
+        'rx queue ' + fmtBytes(t.rx_queue_bytes)];
+      if (t.packet_sockets) parts.push('pcap queue ' + fmtBytes(t.packet_rmem_bytes));
+      var warn = t.undersized ? '<br><span class="usage" style="color:#f59e0b">⚠ buffers undersized: ' + t.issues.join(' · ') + '</span>' : '';
+      return '<br><span class="usage">' + parts.join(' · ') + '</span>' + warn;
+    }
+    function udpSystem() {
+      var s = udpHealth.system;
+      if (!s || !s.sysctl) return '';
+      var c = s.sysctl, r = s.udp_rates || {};
+      var line = 'rmem_max ' + fmtBytes(c['net.core.rmem_max'] || 0) + ' · rmem_default ' + fmtBytes(c['net.core.rmem_default'] || 0) +
+        ' · netdev_max_backlog ' + c['net.core.netdev_max_backlog'] + ' · UDP rcvbuf errors ' + (r.RcvbufErrors === null || r.RcvbufErrors === undefined ? '-' : r.RcvbufErrors) + '/s';
+      return '<p class="usage">' + line + '</p>' + s.issues.map(function(i) { return '<p class="usage" style="color:#f59e0b">⚠ ' + i + '</p>'; }).join('');
+    }
+    function loadMetrics() {
+      fetch('/api/udp-health').then(function(r) { return r.json(); }).then(function(d) { udpHealth = d; }).catch(function() {});
+      fetch('/api/probes').then(function(r) { return r.json(); }).then(function(d) { probes = d; }).catch(function() {});
+      fetch('/api/log-stats?top=1').then(function(r) { return r.json(); }).then(function(d) { logStats = d; }).catch(function() {});
+      fetch('/api/metrics').then(function(r) { return r.json(); }).then(function(d) {
+        var names = Object.keys(d.tunnels || {}).sort();
+        document.getElementById('trafficList').innerHTML = udpSystem() + (names.length ? names.map(function(n) {
+          var t = d.tunnels[n], hist = t.history || [], last = hist[hist.length - 1] || [0, 0, 0, 0, 0];
+          var max = Math.max.apply(null, hist.map(function(p) { return Math.max(p[1], p[2]); }).concat([1]));
+          var ports = Object.keys(t.ports || {}).map(function(k) { var p = t.ports[k]; return k + ' ↓' + fmtRate(p[0]) + ' ↑' + fmtRate(p[1]); }).join(' · ');
+          return '<div class="row"><span>' + n + '<br><span class="usage">' + (ports || 'no NOTRACK rules found') + '</span>' + probeInfo(n) + logInfo(n) + udpInfo(n) + '</span>' +
+            '<span><svg class="spark" width="160" height="28">' + sparkline(hist, 1, 'rx', max) + sparkline(hist, 2, 'tx', max) + '</svg>' +
+            '↓ ' + fmtRate(last[1]) + ' ↑ ' + fmtRate(last[2]) + ' <span class="usage">' + Math.round(last[3] + last[4]) + ' pkt/s</span></span></div>';
+        }).join('') : '<p style="color:#94a3b8">No tunnels configured.</p>');
+      }).catch(function(e) { document.getElementById('trafficList').innerHTML = '<p style="color:#ef4444">Error: ' + e.message + '</p>'; });
+    }
+    var fleetEnabled = true;
+    function loadFleet() {
+      if (!fleetEnabled) return;
+      fetch('/api/fleet').then(function(r) { return r.json(); }).then(function(d) {
+        if (!d.peers) { fleetEnabled = false; return; }
+        document.getElementById('fleetCard').style.display = 'block';
+        var bad = d.pairs.filter(function(p) { return p.issues.length; });
+        var html = bad.map(function(p) {
+          return '<div class="row"><span><span class="status inactive"></span>' + p.client.node + '/' + p.client.name + ' → ' +
+            (p.server ? p.server.node + '/' + p.server.name : '?') + '<br><span class="usage">' + p.issues.join(' · ') + '</span></span></div>';
+        }).join('');
+        html += d.nodes.map(function(n) {
+          var up = n.services.filter(function(s) { return s.status === 'active'; }).length;
+          var info = n.ok ? (n.stale ? 'stale, ' + n.age_seconds + 's old' : (n.local ? 'this node' : n.latency_ms + ' ms')) : 'unreachable: ' + n.error;
+          var tunnels = n.services.map(function(s) { return s.name + (s.status === 'active' ? '' : ' (' + s.status + ')'); }).join(' · ');
+          return '<div class="row"><span><span class="status ' + (n.ok && !n.stale ? 'active' : 'inactive') + '"></span>' + n.name +
+            ' <span class="usage">' + info + '</span><br><span class="usage">' + (tunnels || 'no services') + '</span></span><span>' + up + '/' + n.services.length + ' up</span></div>';
+        }).join('');
+        document.getElementById('fleetList').innerHTML = html + '<p class="usage">' + d.pairs.length + ' pair(s), ' + bad.length + ' with issues</p>';
+      }).catch(function(e) { document.getElementById('fleetList').innerHTML = '<p style="color:#ef4444">Error: ' + e.message + '</p>'; });
+    }
+    var state = { version: null, services: {}, configInfo: {} };
+    function serviceRow(s) {
+      var cls = s.status === 'active' ? 'active' : 'inactive';
+      var u = s.unit.replace(/'/g, "\\'");
+      return '<div class="row" data-unit="' + s.unit + '"><span><span class="status ' + cls + '"></span>' + s.unit + ' &ndash; ' + s.status + ' <span class="usage">' + usage(s) + '</span>' + tunnelInfo(state.configInfo[s.name]) + '</span><button class="act" onclick="restartService(\\'' + u + '\\')">Restart</button></div>';
+    }
+    function fillSelect(id, values) {
+      var sel = document.getElementById(id), keep = sel.value;
+      sel.innerHTML = values.map(function(v) { return '<option value="' + v + '">' + v + '</option>'; }).join('') || '<option>—</option>';
+      if (values.indexOf(keep) >= 0) sel.value = keep;
+    }
+    function applyState(d) {
+      var units = Object.keys(state.services).sort().join(' ');
+      if (d.full) state.services = {};
+      (d.removed || []).forEach(function(u) { delete state.services[u]; });
+      d.services.forEach(function(s) { state.services[s.unit] = s; });
+      if (d.config_info) state.configInfo = d.config_info;
+      if (d.configs) fillSelect('configSelect', d.configs);
+      state.version = d.version;
+      var names = Object.keys(state.services).sort(), list = document.getElementById('serviceList');
+      if (d.config_info || names.join(' ') !== units) {
+        list.innerHTML = names.length ? names.map(function(u) { return serviceRow(state.services[u]); }).join('') : '<p style="color:#94a3b8">No services found.</p>';
+        fillSelect('logService', names);
+        return;
+      }
+      // Same set of units: only replace the rows that changed.
+      d.services.forEach(function(s) {
+        var row = list.querySelector('[data-unit="' + s.unit + '"]');
+        if (row) row.outerHTML = serviceRow(s);
+      });
+    }
     function refresh() {
-      fetch('/api/status').then(function(r) { return r.json(); }).then(function(d) {
-        var services = d.services || [];
-        var list = document.getElementById('serviceList');
-        list.innerHTML = services.length ? services.map(function(s) {
-          var cls = s.status === 'active' ? 'active' : 'inactive';
-          var u = s.unit.replace(/'/g, "\\'");
-          return '<div class="row"><span><span class="status ' + cls + '"></span>' + s.unit + ' &ndash; ' + s.status + '</span><button class="act" onclick="restartService(\'' + u + '\')">Restart</button></div>';
-        }).join('') : '<p style="color:#94a3b8">No services found.</p>';
-        var logSel = document.getElementById('logService');
-        logSel.innerHTML = services.map(function(s) { return '<option value="' + s.unit + '">' + s.unit + '</option>'; }).join('') || '<option>—</option>';
-        return fetch('/api/status');
-      }).then(function(r) { return r.json(); }).then(function(d) {
-        var cfg = document.getElementById('configSelect');
-        var names = d.configs || [];
-        cfg.innerHTML = names.map(function(n) { return '<option value="' + n + '">' + n + '</option>'; }).join('') || '<option>—</option>';
-      }).catch(function(e) { document.getElementById('serviceList').innerHTML = '<p style="color:#ef4444">Error: ' + e.message + '</p>'; });
+      var url = '/api/state' + (state.version ? '?since=' + encodeURIComponent(state.version) : '');
+      var headers = state.version ? { 'If-None-Match': '"' + state.version + '"' } : {};
+      return fetch(url, { headers: headers, cache: 'no-store' }).then(function(r) {
+        if (r.status === 304) return null;
+        return r.json();
+      }).then(function(d) { if (d) applyState(d); })
+        .catch(function(e) { document.getElementById('serviceList').innerHTML = '<p style="color:#ef4444">Error: ' + e.message + '</p>'; state.version = null; });
     }
     function showTab(tab) {
       document.querySelectorAll('.tabs button').forEach(function(b) { b.classList.remove('active'); });
@@ -334,12 +3522,80 @@ DASHBOARD_HTML = """<!DOCTYPE html>
       document.getElementById('logsTab').style.display = tab === 'logs' ? 'block' : 'none';
       document.getElementById('configTab').style.display = tab === 'config' ? 'block' : 'none';
     }
+    var logPage = { entries: [], prev: null, next: null };
+    function logQuery(extra) {
+      var q = '/api/logs?format=json&service=' + encodeURIComponent(document.getElementById('logService').value) +
+        '&lines=' + (parseInt(document.getElementById('logLines').value, 10) || 100);
+      var pri = document.getElementById('logPriority').value, grep = document.getElementById('logFilter').value;
+      if (pri) q += '&priority=' + pri;
+      if (grep) q += '&grep=' + encodeURIComponent(grep);
+      return fetch(q + (extra || '')).then(function(r) { return r.json(); });
+    }
+    function renderLogs() {
+      var out = document.getElementById('logOutput');
+      out.textContent = logPage.entries.length ? logPage.entries.map(fmtEntry).join('\\n') : '(no logs)';
+    }
+    function logError(e) { document.getElementById('logOutput').textContent = 'Error: ' + e.message; }
     function loadLogs() {
+      stopFollow();
+      logQuery('').then(function(d) {
+        if (d.error) throw new Error(d.error);
+        logPage = { entries: d.entries, prev: d.prev_cursor, next: d.next_cursor };
+        renderLogs();
+        var out = document.getElementById('logOutput'); out.scrollTop = out.scrollHeight;
+      }).catch(logError);
+    }
+    function olderLogs() {
+      if (!logPage.prev) return loadLogs();
+      logQuery('&before=' + encodeURIComponent(logPage.prev)).then(function(d) {
+        if (d.error) throw new Error(d.error);
+        logPage.entries = d.entries.concat(logPage.entries).slice(0, 20000);
+        logPage.prev = d.prev_cursor;
+        renderLogs();
+        document.getElementById('logOutput').scrollTop = 0;
+      }).catch(logError);
+    }
+    function newerLogs() {
+      if (!logPage.next) return loadLogs();
+      logQuery('&after=' + encodeURIComponent(logPage.next)).then(function(d) {
+        if (d.error) throw new Error(d.error);
+        logPage.entries = logPage.entries.concat(d.entries).slice(-20000);
+        logPage.next = d.next_cursor;
+        renderLogs();
+        var out = document.getElementById('logOutput'); out.scrollTop = out.scrollHeight;
+      }).catch(logError);
+    }
+    var logStream = null;
+    function fmtEntry(e) {
+      var d = new Date(e.ts * 1000);
+      return d.toISOString().replace('T', ' ').slice(0, 19) + ' ' + (e.ident || '') + (e.pid ? '[' + e.pid + ']' : '') + ': ' + e.message;
+    }
+    function stopFollow() {
+      if (logStream) { logStream.close(); logStream = null; }
+      document.getElementById('followBtn').textContent = 'Follow';
+    }
+    function toggleFollow() {
+      if (logStream) { stopFollow(); return; }
       var service = document.getElementById('logService').value;
-      var lines = document.getElementById('logLines').value || 100;
-      fetch('/api/logs?service=' + encodeURIComponent(service) + '&lines=' + lines).then(function(r) { return r.json(); }).then(function(d) {
-        document.getElementById('logOutput').textContent = d.logs || '(empty)';
-      }).catch(function(e) { document.getElementById('logOutput').textContent = 'Error: ' + e.message; });
+      var max = parseInt(document.getElementById('logLines').value, 10) || 100;
+      var out = document.getElementById('logOutput');
+      var lines = [], pending = false;
+      function render() {
+        pending = false;
+        if (lines.length > max) lines.splice(0, lines.length - max);
+        out.textContent = lines.join('\\n') || '(waiting for logs…)';
+        out.scrollTop = out.scrollHeight;
+      }
+      function push(line) {
+        lines.push(line);
+        if (!pending) { pending = true; setTimeout(render, 100); }
+      }
+      out.textContent = '(waiting for logs…)';
+      logStream = new EventSource('/api/logs/stream?service=' + encodeURIComponent(service));
+      logStream.onmessage = function(ev) { push(fmtEntry(JSON.parse(ev.data))); };
+      logStream.addEventListener('dropped', function(ev) { push('… ' + ev.data + ' entries skipped (connection too slow)'); });
+      logStream.onerror = function() { if (logStream && logStream.readyState === EventSource.CLOSED) { push('(stream closed)'); stopFollow(); } };
+      document.getElementById('followBtn').textContent = 'Stop';
     }
     function loadConfig() {
       var name = document.getElementById('configSelect').value;
@@ -348,12 +3604,43 @@ DASHBOARD_HTML = """<!DOCTYPE html>
         document.getElementById('configOutput').textContent = d.content || '(empty)';
       }).catch(function(e) { document.getElementById('configOutput').textContent = 'Error: ' + e.message; });
     }
+    function runBulk() {
+      var role = document.getElementById('bulkRole').value, name = document.getElementById('bulkName').value.trim();
+      var action = document.getElementById('bulkAction').value, status = document.getElementById('bulkStatus');
+      if (!confirm(action + ' all ' + (role || 'tunnel') + ' services' + (name ? ' matching ' + name : '') + '?')) return;
+      fetch('/api/bulk', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ action: action, role: role, name: name || '*' }) })
+        .then(function(r) { return r.json(); }).then(function(d) {
+          if (d.error) throw new Error(d.error);
+          function poll() {
+            fetch(d.status_url).then(function(r) { return r.json(); }).then(function(j) {
+              var failed = Object.keys(j.units).filter(function(u) { return j.units[u].state === 'failed'; });
+              status.textContent = j.action + ': ' + (j.ok + j.failed) + '/' + j.total + ' done' + (j.failed ? ', failed: ' + failed.join(', ') : '');
+              if (j.state === 'running') setTimeout(poll, 1000); else refresh();
+            }).catch(function(e) { status.textContent = 'Error: ' + e.message; });
+          }
+          status.textContent = action + ': 0/' + d.units.length + ' done';
+          poll();
+        }).catch(function(e) { status.textContent = 'Error: ' + e.message; });
+    }
     function restartService(unit) {
       fetch('/api/restart', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ service: unit }) })
         .then(function(r) { return r.json(); }).then(function(d) { if (d.ok) refresh(); else alert(d.error || 'Failed'); }).catch(function(e) { alert(e.message); });
     }
-    refresh();
-    setInterval(refresh, 10000);
+    var timers = [];
+    function startPolling() {
+      if (timers.length) return;
+      refresh();
+      loadMetrics();
+      loadFleet();
+      timers = [setInterval(refresh, 10000), setInterval(loadMetrics, 5000), setInterval(loadFleet, 10000)];
+    }
+    function stopPolling() {
+      timers.forEach(clearInterval);
+      timers = [];
+    }
+    // No polling while the tab is in the background; catch up as soon as it is visible again.
+    document.addEventListener('visibilitychange', function() { if (document.hidden) stopPolling(); else startPolling(); });
+    if (!document.hidden) startPolling();
   </script>
 </body>
 </html>
@@ -361,23 +3648,77 @@ DASHBOARD_HTML = """<!DOCTYPE html>
 
 
 def main():
+    global SESSION_TOKEN
     port = DEFAULT_PORT
     bind = DEFAULT_BIND
+    workers = DEFAULT_WORKERS
+    timeout = DEFAULT_REQUEST_TIMEOUT
+    idle_exit = IDLE_EXIT
     for i, arg in enumerate(sys.argv[1:]):
         if arg == "--port" and i + 2 < len(sys.argv):
             port = int(sys.argv[i + 2])
         elif arg == "--bind" and i + 2 < len(sys.argv):
             bind = sys.argv[i + 2]
+        elif arg == "--workers" and i + 2 < len(sys.argv):
+            workers = int(sys.argv[i + 2])
+        elif arg == "--timeout" and i + 2 < len(sys.argv):
+            timeout = float(sys.argv[i + 2])
+        elif arg == "--status-interval" and i + 2 < len(sys.argv):
+            STATUS_CACHE.interval = max(0.5, float(sys.argv[i + 2]))
+        elif arg == "--peers" and i + 2 < len(sys.argv):
+            FLEET.path = sys.argv[i + 2]
+        elif arg == "--idle-exit" and i + 2 < len(sys.argv):
+            idle_exit = float(sys.argv[i + 2])
+        elif arg == "--history":
+            # CLI report: python3 paqet-dashboard.py --history [service]
+            unit = sys.argv[i + 2] if i + 2 < len(sys.argv) else None
+            print_history(unit_name(unit) if unit else None)
+            return
+        elif arg == "--udp-health":
+            # CLI report: python3 paqet-dashboard.py --udp-health [seconds]
+            print_udp_health(float(sys.argv[i + 2]) if i + 2 < len(sys.argv) else 3.0)
+            return
 
     if os.geteuid() != 0:
         print("Warning: Run as root to read systemd and /etc/paqet", file=sys.stderr)
 
-    server = HTTPServer((bind, port), DashboardHandler)
-    print("Paqet Dashboard: http://{}:{}/login (Ctrl+C to stop)".format(bind, port))
+    if idle_exit > 0:
+        SESSION_TOKEN = hashlib.sha256((persistent_secret(SESSION_SECRET_FILE) + "ok").encode()).hexdigest()[:32]
+    # Listen first: under socket activation the connection that started us is already waiting.
+    inherited = systemd_listen_fds()
+    server = DashboardServer((bind, port), DashboardHandler, max_workers=workers, request_timeout=timeout,
+                             sock=inherited[0] if inherited else None)
+    STATUS_CACHE.listeners.append(HISTORY.observe)
+    STATUS_CACHE.listeners.append(STATE.observe)
+    on_demand = idle_exit > 0 or bool(inherited)
+    if not on_demand:
+        use_collectors(*COLLECTORS)
+
+    def stop(signum, frame):
+        # shutdown() blocks until serve_forever() returns, so call it off the main thread.
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def exit_when_idle():
+        while server.idle_for() < idle_exit:
+            time.sleep(max(1.0, min(idle_exit - server.idle_for(), 30.0)))
+        print("Idle for {:.0f}s, exiting".format(idle_exit), flush=True)
+        server.shutdown()
+
+    signal.signal(signal.SIGTERM, stop)
+    # SIGUSR2: profile requests for PROFILE_SECONDS without restarting (see /api/debug/perf).
+    signal.signal(signal.SIGUSR2, lambda signum, frame: PROFILER.start())
+    if idle_exit > 0:
+        threading.Thread(target=exit_when_idle, name="idle-exit", daemon=True).start()
+    if inherited:
+        print("Paqet Dashboard: socket-activated on {} (Ctrl+C to stop)".format(server.server_address[:2]))
+    else:
+        print("Paqet Dashboard: http://{}:{}/login (Ctrl+C to stop)".format(bind, port))
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\nStopped.")
+    LOG_HUB.close()
+    LOG_STATS.save()
     server.server_close()
 
 
@@ -2,15 +2,58 @@
 """
 Paqet - Decoy website on port 443
 Serves a fake corporate/portal page so DPI or scanners see a normal site.
-Python 3 stdlib only. Run as root: python3 paqet-decoy.py [--port 443] [--bind 0.0.0.0]
+Pages are encoded and gzipped once at startup and served over HTTP/1.1 keep-alive with
+Content-Length, ETag/304 and Accept-Encoding; --dir serves a folder of static decoy pages
+from memory instead of the built-in ones. Connections are handled on one asyncio loop with
+header/idle timeouts, a global connection cap and per-IP rate limiting.
+Under systemd socket activation (paqet-decoy.socket) the inherited listening socket is used instead
+of --port/--bind, and --idle-exit stops the process after that long without connections.
+Python 3 stdlib only. Run as root: python3 paqet-decoy.py [--port 443] [--bind 0.0.0.0] [--dir PATH]
+  [--stats-file PATH] [--idle-exit SECONDS] | --stats
 """
+import asyncio
+import collections
+import email.utils
+import gzip
+import hashlib
+import json
 import os
+import resource
+import signal
+import socket
 import sys
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import time
 from urllib.parse import urlparse
 
 DEFAULT_PORT = 443
 DEFAULT_BIND = "0.0.0.0"
+# Optional directory of static decoy pages (index.html, css, images...), loaded into memory at startup
+DEFAULT_DIR = os.environ.get("PAQET_DECOY_DIR", "")
+# Files larger than this, or beyond this total, are not cached (and not served)
+MAX_FILE_BYTES = 4 * 1024 * 1024
+MAX_CACHE_BYTES = int(os.environ.get("PAQET_DECOY_CACHE_MB", "64")) * 1024 * 1024
+# Idle keep-alive connections are closed after this many seconds
+KEEPALIVE_TIMEOUT = float(os.environ.get("PAQET_DECOY_KEEPALIVE", "15"))
+# A new connection must send a complete request head within this many seconds (slowloris)
+HEADER_TIMEOUT = float(os.environ.get("PAQET_DECOY_HEADER_TIMEOUT", "10"))
+WRITE_TIMEOUT = 30.0
+# Sockets beyond this many open connections are closed immediately
+MAX_CONNECTIONS = int(os.environ.get("PAQET_DECOY_MAX_CONNS", "4096"))
+# Per source IP: RATE tokens/s refill up to BURST; each new connection or request costs one.
+# RATE 0 disables. The table keeps the IP_TABLE_SIZE most recently seen IPs.
+RATE = float(os.environ.get("PAQET_DECOY_RATE", "20"))
+BURST = float(os.environ.get("PAQET_DECOY_BURST", "60"))
+IP_TABLE_SIZE = int(os.environ.get("PAQET_DECOY_IP_TABLE", "50000"))
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+# Connection/drop counters are written here every STATS_INTERVAL seconds (also printed on SIGUSR1)
+DEFAULT_STATS_FILE = os.environ.get("PAQET_DECOY_STATS", "/run/paqet-decoy.json")
+STATS_INTERVAL = 10.0
+# Exit after this many seconds without an open connection (0 = never); for socket activation,
+# where systemd keeps listening and starts the decoy again on the next connection.
+IDLE_EXIT = float(os.environ.get("PAQET_DECOY_IDLE_EXIT", "0"))
+CACHE_CONTROL = "public, max-age=300"
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
 
 FAKE_HTML = """<!DOCTYPE html>
 <html lang="en">
@@ -108,58 +151,439 @@ FAKE_LOGIN_HTML = """<!DOCTYPE html>
 """
 
 
-class DecoyHandler(BaseHTTPRequestHandler):
-    def log_message(self, format, *args):
-        pass
+class Page:
+    """A response body encoded once: raw bytes, gzip variant (if it helps), and per variant its
+    strong ETag (the gzip one ends in -gz, as the two representations differ) and header block."""
+    __slots__ = ("body", "gzip_body", "etag", "gzip_etag", "content_type", "header_bytes", "gzip_header_bytes")
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        self.etag = '"' + digest + '"'
+        self.gzip_etag = '"' + digest + '-gz"'
+        self.gzip_body = None
+        if content_type.startswith(COMPRESSIBLE) and len(body) > 256:
+            packed = gzip.compress(body, 9, mtime=0)
+            if len(packed) < len(body):
+                self.gzip_body = packed
+        vary = "Vary: Accept-Encoding\r\n" if self.gzip_body is not None else ""
+        head = "Content-Type: {}\r\nETag: {}\r\nCache-Control: {}\r\n" + vary
+        self.header_bytes = head.format(content_type, self.etag, CACHE_CONTROL).encode("latin-1")
+        self.gzip_header_bytes = (head.format(content_type, self.gzip_etag, CACHE_CONTROL)
+                                  + "Content-Encoding: gzip\r\n").encode("latin-1")
+
+    def variant(self, gzip_ok):
+        """(etag, header block, body) of the representation sent for this Accept-Encoding."""
+        if gzip_ok and self.gzip_body is not None:
+            return self.gzip_etag, self.gzip_header_bytes, self.gzip_body
+        return self.etag, self.header_bytes, self.body
+
+
+class PageCache:
+    """Path -> Page map built at startup; unknown paths get the fallback page like a catch-all site."""
+
+    def __init__(self):
+        self.pages = {}
+        self.fallback = None
+        self.not_found = None
+
+    def add(self, path, body, content_type):
+        page = Page(body, content_type)
+        self.pages[path] = page
+        return page
+
+    def load_builtin(self):
+        html = "text/html; charset=utf-8"
+        self.fallback = self.add("/", FAKE_HTML.encode("utf-8"), html)
+        self.pages["/index.html"] = self.fallback
+        self.add("/login", FAKE_LOGIN_HTML.encode("utf-8"), html)
+
+    def load_dir(self, root):
+        import mimetypes  # only needed for --dir
+        total = 0
+        root = os.path.abspath(root)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for name in sorted(filenames):
+                if name.startswith("."):
+                    continue
+                full = os.path.join(dirpath, name)
+                try:
+                    size = os.path.getsize(full)
+                    if size > MAX_FILE_BYTES or total + size > MAX_CACHE_BYTES:
+                        print("Skipping {} (cache limit)".format(full), file=sys.stderr)
+                        continue
+                    with open(full, "rb") as f:
+                        body = f.read()
+                except OSError as e:
+                    print("Skipping {}: {}".format(full, e), file=sys.stderr)
+                    continue
+                total += len(body)
+                ctype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if ctype.startswith("text/") or ctype in ("application/javascript", "application/json"):
+                    ctype += "; charset=utf-8"
+                rel = "/" + os.path.relpath(full, root).replace(os.sep, "/")
+                page = self.add(rel, body, ctype)
+                if name == "index.html":
+                    base = rel[:-len("index.html")]
+                    self.pages[base] = page
+                    if base != "/":
+                        self.pages[base.rstrip("/")] = page
+                elif name.endswith(".html"):
+                    self.pages.setdefault(rel[:-len(".html")], page)
+        self.fallback = self.pages.get("/") or self.fallback
+        self.not_found = self.pages.get("/404.html")
+        return total
+
+    def lookup(self, path):
+        """Returns (status, page) for a request path."""
+        page = self.pages.get(path)
+        if page is not None:
+            return 200, page
+        if self.not_found is not None:
+            return 404, self.not_found
+        return 200, self.fallback
+
+
+PAGES = PageCache()
+
 
-    def do_GET(self):
-        path = urlparse(self.path).path.rstrip("/") or "/"
-        if path == "/" or path == "/index.html" or path.startswith("/?"):
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(FAKE_HTML.encode("utf-8"))
-        elif path == "/login":
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(FAKE_LOGIN_HTML.encode("utf-8"))
+def etag_matches(header, etag):
+    """If-None-Match: "*" or one of the listed entity tags equal to `etag` (weak comparison:
+    a W/ prefix is ignored, the quoted tag must match exactly)."""
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag[:2] == "W/":
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def accepts_gzip(header):
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            q = params.strip()
+            return not (q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"))
+    return False
+
+
+def error_page(status, reason):
+    title = "{} {}".format(status, reason)
+    return ("<html>\r\n<head><title>{0}</title></head>\r\n<body>\r\n<center><h1>{0}</h1></center>\r\n"
+            "<hr><center>nginx</center>\r\n</body>\r\n</html>\r\n").format(title).encode("ascii")
+
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Not Allowed",
+           413: "Request Entity Too Large", 431: "Request Header Fields Too Large",
+           503: "Service Temporarily Unavailable"}
+ERROR_PAGES = {code: error_page(code, REASONS[code]) for code in (400, 405, 413, 431, 503)}
+
+
+class RateLimiter:
+    """Per-source-IP token buckets in a bounded LRU table (oldest IPs are forgotten first)."""
+
+    def __init__(self, rate=RATE, burst=BURST, max_entries=IP_TABLE_SIZE):
+        self.rate = rate
+        self.burst = burst
+        self.max_entries = max_entries
+        self.buckets = collections.OrderedDict()  # ip -> [tokens, last_refill]
+        self.evicted = 0
+
+    def allow(self, ip, now):
+        if self.rate <= 0:
+            return True
+        bucket = self.buckets.get(ip)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+            self.buckets[ip] = bucket
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+                self.evicted += 1
         else:
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(FAKE_HTML.encode("utf-8"))
+            self.buckets.move_to_end(ip)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1.0:
+            return False
+        bucket[0] -= 1.0
+        return True
+
+
+class DecoyServer:
+    """asyncio HTTP/1.1 engine: one coroutine per connection, no threads.
+
+    Every connection must deliver its first request head within HEADER_TIMEOUT and each
+    later one within KEEPALIVE_TIMEOUT; beyond MAX_CONNECTIONS new sockets are closed at once.
+    Each new connection and each further request costs the source IP one token.
+    """
+
+    def __init__(self):
+        self.limiter = RateLimiter()
+        self.active = 0
+        self.last_active = time.monotonic()
+        self.stats = collections.Counter()
+        self._date = (0, b"")
+
+    def http_date(self):
+        now = int(time.time())
+        if now != self._date[0]:
+            self._date = (now, email.utils.formatdate(now, usegmt=True).encode("ascii"))
+        return self._date[1]
+
+    def snapshot(self):
+        drops = {k[5:]: v for k, v in self.stats.items() if k.startswith("drop_")}
+        return {
+            "active": self.active,
+            "accepted": self.stats["accepted"],
+            "requests": self.stats["requests"],
+            "not_modified": self.stats["not_modified"],
+            "idle_closed": self.stats["idle_closed"],
+            "dropped": drops,
+            "dropped_total": sum(drops.values()),
+            "ip_table": len(self.limiter.buckets),
+            "ip_table_evicted": self.limiter.evicted,
+        }
+
+    def drop(self, reason):
+        self.stats["drop_" + reason] += 1
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        ip = peer[0] if peer else "?"
+        if self.active >= MAX_CONNECTIONS:
+            self.drop("connection_cap")
+            writer.transport.abort()
+            return
+        if not self.limiter.allow(ip, time.monotonic()):
+            self.drop("rate_limited")
+            writer.transport.abort()
+            return
+        self.active += 1
+        self.stats["accepted"] += 1
+        try:
+            first = True
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"),
+                                                  HEADER_TIMEOUT if first else KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    if first:
+                        self.drop("header_timeout")
+                    else:
+                        self.stats["idle_closed"] += 1
+                    break
+                except asyncio.LimitOverrunError:
+                    self.drop("header_too_large")
+                    await self.respond(writer, 431, None, head=False, keep_alive=False)
+                    break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if not first and not self.limiter.allow(ip, time.monotonic()):
+                    self.drop("rate_limited")
+                    await self.respond(writer, 503, None, head=False, keep_alive=False)
+                    break
+                first = False
+                if not await self.serve(reader, writer, head):
+                    break
+        except asyncio.TimeoutError:
+            self.drop("write_timeout")
+        except ConnectionError:
+            pass
+        finally:
+            self.active -= 1
+            self.last_active = time.monotonic()
+            writer.close()
+
+    async def serve(self, reader, writer, head):
+        """Handles one request; returns True to keep the connection open."""
+        self.stats["requests"] += 1
+        try:
+            lines = head[:-4].decode("latin-1").split("\r\n")
+            method, target, version = lines[0].split(" ")
+            if not version.startswith("HTTP/1."):
+                raise ValueError(version)
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except ValueError:
+            self.drop("bad_request")
+            await self.respond(writer, 400, None, head=False, keep_alive=False)
+            return False
+
+        conn = headers.get("connection", "").lower()
+        keep_alive = "close" not in conn and (version == "HTTP/1.1" or "keep-alive" in conn)
+        if "transfer-encoding" in headers:
+            keep_alive = False
+        length = headers.get("content-length", "0")
+        if not length.isdigit() or int(length) > MAX_BODY_BYTES:
+            self.drop("body_too_large")
+            await self.respond(writer, 413, None, head=False, keep_alive=False)
+            return False
+        if int(length):
+            try:
+                await asyncio.wait_for(reader.readexactly(int(length)), HEADER_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                self.drop("body_timeout")
+                return False
+
+        if method not in ("GET", "HEAD"):
+            await self.respond(writer, 405, None, head=False, keep_alive=keep_alive)
+            return keep_alive
+
+        status, page = PAGES.lookup(urlparse(target).path.rstrip("/") or "/")
+        gzip_ok = accepts_gzip(headers.get("accept-encoding"))
+        etag_match = headers.get("if-none-match", "")
+        if status == 200 and etag_match and etag_matches(etag_match, page.variant(gzip_ok)[0]):
+            self.stats["not_modified"] += 1
+            status = 304
+        await self.respond(writer, status, page, head=method == "HEAD", keep_alive=keep_alive, gzip_ok=gzip_ok)
+        return keep_alive
+
+    async def respond(self, writer, status, page, head, keep_alive, gzip_ok=False):
+        out = [b"HTTP/1.1 %d %s\r\nServer: nginx\r\nDate: %s\r\n" % (
+            status, REASONS[status].encode("ascii"), self.http_date())]
+        if page is None:
+            body = ERROR_PAGES[status]
+            out.append(b"Content-Type: text/html\r\nContent-Length: %d\r\n" % len(body))
+        elif status == 304:
+            body = b""
+            etag = page.variant(gzip_ok)[0]
+            out.append(b"ETag: %s\r\nCache-Control: %s\r\n" % (etag.encode("ascii"), CACHE_CONTROL.encode("ascii")))
+            if page.gzip_body is not None:
+                out.append(b"Vary: Accept-Encoding\r\n")
+        else:
+            _, header, body = page.variant(gzip_ok)
+            out.append(header)
+            out.append(b"Content-Length: %d\r\n" % len(body))
+        out.append(b"Connection: keep-alive\r\n\r\n" if keep_alive else b"Connection: close\r\n\r\n")
+        if not head:
+            out.append(body)
+        writer.write(b"".join(out))
+        await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+
+    def write_stats(self, path):
+        try:
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    async def run(self, bind, port, stats_file, sock=None, idle_exit=0.0):
+        if sock is not None:
+            server = await asyncio.start_server(self.handle, sock=sock, limit=MAX_HEADER_BYTES)
+            print("Decoy website: socket-activated on {} (Ctrl+C to stop)".format(sock.getsockname()[:2]), flush=True)
+        else:
+            server = await asyncio.start_server(self.handle, bind, port, backlog=1024, limit=MAX_HEADER_BYTES)
+            print("Decoy website: http://{}:{}/ (Ctrl+C to stop)".format(bind, port), flush=True)
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        loop.add_signal_handler(signal.SIGUSR1, lambda: print(json.dumps(self.snapshot()), flush=True))
+        tick = min(STATS_INTERVAL, idle_exit) if idle_exit > 0 else STATS_INTERVAL
+        async with server:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), tick)
+                except asyncio.TimeoutError:
+                    pass
+                if stats_file:
+                    self.write_stats(stats_file)
+                if idle_exit > 0 and not self.active and time.monotonic() - self.last_active >= idle_exit:
+                    print("Idle for {:.0f}s, exiting".format(idle_exit), flush=True)
+                    break
+        print("\nStopped. " + json.dumps(self.snapshot()))
+
+
+def raise_fd_limit():
+    """Thousands of sockets need more than the usual 1024 descriptors."""
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY and (hard == resource.RLIM_INFINITY or soft < hard):
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def systemd_listen_fds():
+    """Listening sockets passed by systemd socket activation (LISTEN_FDS), else []."""
+    try:
+        if int(os.environ.get("LISTEN_PID", "0")) != os.getpid():
+            return []
+        count = int(os.environ.get("LISTEN_FDS", "0"))
+    except ValueError:
+        return []
+    for var in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(var, None)
+    socks = []
+    for fd in range(3, 3 + count):  # SD_LISTEN_FDS_START
+        os.set_inheritable(fd, False)
+        socks.append(socket.socket(fileno=fd))
+    return socks
 
 
 def main():
     port = DEFAULT_PORT
     bind = DEFAULT_BIND
+    static_dir = DEFAULT_DIR
+    stats_file = DEFAULT_STATS_FILE
+    show_stats = False
+    idle_exit = IDLE_EXIT
     for i, arg in enumerate(sys.argv[1:]):
         if arg == "--port" and i + 2 < len(sys.argv):
             port = int(sys.argv[i + 2])
         elif arg == "--bind" and i + 2 < len(sys.argv):
             bind = sys.argv[i + 2]
+        elif arg == "--dir" and i + 2 < len(sys.argv):
+            static_dir = sys.argv[i + 2]
+        elif arg == "--stats-file" and i + 2 < len(sys.argv):
+            stats_file = sys.argv[i + 2]
+        elif arg == "--idle-exit" and i + 2 < len(sys.argv):
+            idle_exit = float(sys.argv[i + 2])
+        elif arg == "--stats":
+            show_stats = True
+
+    if show_stats:
+        try:
+            with open(stats_file) as f:
+                print(json.dumps(json.load(f), indent=2))
+        except (OSError, ValueError) as e:
+            print("No decoy stats ({}): {}".format(stats_file, e), file=sys.stderr)
+            sys.exit(1)
+        return
 
-    if port < 1024 and os.geteuid() != 0:
+    inherited = systemd_listen_fds()
+    if not inherited and port < 1024 and os.geteuid() != 0:
         print("Run as root to bind to port {}".format(port), file=sys.stderr)
         sys.exit(1)
 
+    PAGES.load_builtin()
+    if static_dir:
+        if not os.path.isdir(static_dir):
+            print("Decoy directory not found: {}".format(static_dir), file=sys.stderr)
+            sys.exit(1)
+        loaded = PAGES.load_dir(static_dir)
+        print("Serving {} ({} KB cached)".format(static_dir, loaded // 1024))
+
+    raise_fd_limit()
     try:
-        server = HTTPServer((bind, port), DecoyHandler)
+        asyncio.run(DecoyServer().run(bind, port, stats_file, inherited[0] if inherited else None, idle_exit))
     except OSError as e:
         if "Address already in use" in str(e) or e.errno == 98:
             print("Port {} is already in use. Stop the other service or use another port.".format(port), file=sys.stderr)
         else:
             print("Error: {}".format(e), file=sys.stderr)
         sys.exit(1)
-
-    print("Decoy website: http://{}:{}/ (Ctrl+C to stop)".format(bind, port))
-    try:
-        server.serve_forever()
     except KeyboardInterrupt:
         print("\nStopped.")
-    finally:
-        server.server_close()
 
 
 if __name__ == "__main__":
@@ -35,7 +35,13 @@ INSTALL_DIR="/opt/paqet"
 GITHUB_REPO="hanselime/paqet"
 DASHBOARD_URL="https://raw.githubusercontent.com/ahmadmute/Paqet-Tunnel-Manage_2/main/paqet-dashboard.py"
 DECOY_URL="https://raw.githubusercontent.com/ahmadmute/Paqet-Tunnel-Manage_2/main/paqet-decoy.py"
+SUPERVISOR_URL="https://raw.githubusercontent.com/ahmadmute/Paqet-Tunnel-Manage_2/main/paqet-supervisor.py"
+SUPERVISOR_LIST="$CONFIG_DIR/supervisor.list"
+PROVISION_URL="https://raw.githubusercontent.com/ahmadmute/Paqet-Tunnel-Manage_2/main/paqet-provision.py"
+# On-demand (socket-activated) dashboard/decoy exit after this many idle seconds
+IDLE_EXIT_SECONDS=600
 SERVICE_NAME="paqet"
+BULK_PARALLEL=8
 
 # Banner
 show_banner() {
@@ -833,6 +839,87 @@ view_cronjob() {
     fi
 }
 
+# Check if a service is watched by the health supervisor
+is_supervised() {
+    local service_name="$1"
+    [ -f "$SUPERVISOR_LIST" ] && grep -qxF -- "$service_name" "$SUPERVISOR_LIST"
+}
+
+# Install/refresh paqet-supervisor.service (restarts tunnels only when unhealthy)
+install_supervisor_service() {
+    if ! command -v python3 &> /dev/null; then
+        print_error "python3 is required. Install: apt install python3"
+        return 1
+    fi
+    
+    local supervisor
+    if ! supervisor=$(find_paqet_script "paqet-supervisor.py" "$SUPERVISOR_URL"); then
+        return 1
+    fi
+    mkdir -p "$INSTALL_DIR"
+    if [ "$supervisor" != "$INSTALL_DIR/paqet-supervisor.py" ]; then
+        cp "$supervisor" "$INSTALL_DIR/paqet-supervisor.py" || return 1
+    fi
+    
+    local python_path
+    python_path=$(command -v python3 2>/dev/null || echo "/usr/bin/python3")
+    cat > "$SERVICE_DIR/paqet-supervisor.service" << EOF
+[Unit]
+Description=Paqet Health Supervisor
+After=network.target
+
+[Service]
+Type=simple
+ExecStart=$python_path $INSTALL_DIR/paqet-supervisor.py --units-file $SUPERVISOR_LIST
+Restart=always
+RestartSec=5
+WorkingDirectory=$INSTALL_DIR
+
+[Install]
+WantedBy=multi-user.target
+EOF
+    
+    systemctl daemon-reload
+    systemctl enable paqet-supervisor.service --now >/dev/null 2>&1
+    if systemctl is-active --quiet paqet-supervisor.service; then
+        return 0
+    fi
+    print_error "Failed to start. Check: systemctl status paqet-supervisor"
+    return 1
+}
+
+# Let the health supervisor restart this service instead of a fixed cron interval
+add_to_supervisor() {
+    local service_name="$1"
+    
+    mkdir -p "$CONFIG_DIR"
+    if ! is_supervised "$service_name"; then
+        echo "$service_name" >> "$SUPERVISOR_LIST"
+    fi
+    remove_cronjob "$service_name" >/dev/null
+    
+    if ! systemctl is-active --quiet paqet-supervisor.service; then
+        install_supervisor_service || return 1
+    fi
+    print_success "Health supervisor enabled for $service_name (cron restart removed)"
+    echo -e "  ${DIM}Restarts only on failure or repeated errors, with backoff. Log: journalctl -u paqet-supervisor${NC}"
+}
+
+# Stop supervising a service (the supervisor re-reads the list when it changes)
+remove_from_supervisor() {
+    local service_name="$1"
+    
+    if is_supervised "$service_name"; then
+        # Fixed-string match: unit names may contain regex characters such as "."
+        grep -vxF -- "$service_name" "$SUPERVISOR_LIST" > "$SUPERVISOR_LIST.tmp"
+        mv -f "$SUPERVISOR_LIST.tmp" "$SUPERVISOR_LIST"
+        print_success "Health supervisor disabled for $service_name"
+        return 0
+    fi
+    print_info "$service_name is not supervised"
+    return 1
+}
+
 # Cronjob menu for service
 manage_cronjob() {
     local service_name="$1"
@@ -845,6 +932,9 @@ manage_cronjob() {
         
         echo -e "${CYAN}Current cronjob:${NC}"
         view_cronjob "$service_name"
+        if is_supervised "$service_name"; then
+            echo -e "${GREEN}Health supervisor: enabled${NC}"
+        fi
         echo ""
         
         echo -e "${CYAN}Add/Change Cronjob:${NC}"
@@ -856,37 +946,48 @@ manage_cronjob() {
         echo -e "  6. 12 hours"
         echo -e "  7. 1 day"
         echo -e "  8. Remove cronjob"
-        echo -e "  9. Back to service menu"
+        echo ""
+        echo -e "${CYAN}Or restart only when unhealthy:${NC}"
+        echo -e "  9. Health supervisor (failure / error bursts, with backoff)"
+        echo -e "  10. Disable health supervisor"
+        echo -e "  11. Back to service menu"
         echo ""
         
-        read -p "Choose option [1-9]: " cron_choice
+        read -p "Choose option [1-11]: " cron_choice
         
         case $cron_choice in
             1)
+                remove_from_supervisor "$service_name" >/dev/null
                 add_auto_restart_cronjob "$service_name" "1min"
                 read -p "Press Enter to continue..."
                 ;;
             2)
+                remove_from_supervisor "$service_name" >/dev/null
                 add_auto_restart_cronjob "$service_name" "5min"
                 read -p "Press Enter to continue..."
                 ;;
             3)
+                remove_from_supervisor "$service_name" >/dev/null
                 add_auto_restart_cronjob "$service_name" "15min"
                 read -p "Press Enter to continue..."
                 ;;
             4)
+                remove_from_supervisor "$service_name" >/dev/null
                 add_auto_restart_cronjob "$service_name" "30min"
                 read -p "Press Enter to continue..."
                 ;;
             5)
+                remove_from_supervisor "$service_name" >/dev/null
                 add_auto_restart_cronjob "$service_name" "1hour"
                 read -p "Press Enter to continue..."
                 ;;
             6)
+                remove_from_supervisor "$service_name" >/dev/null
                 add_auto_restart_cronjob "$service_name" "12hour"
                 read -p "Press Enter to continue..."
                 ;;
             7)
+                remove_from_supervisor "$service_name" >/dev/null
                 add_auto_restart_cronjob "$service_name" "1day"
                 read -p "Press Enter to continue..."
                 ;;
@@ -895,6 +996,14 @@ manage_cronjob() {
                 read -p "Press Enter to continue..."
                 ;;
             9)
+                add_to_supervisor "$service_name"
+                read -p "Press Enter to continue..."
+                ;;
+            10)
+                remove_from_supervisor "$service_name"
+                read -p "Press Enter to continue..."
+                ;;
+            11)
                 return
                 ;;
             *)
@@ -1378,6 +1487,61 @@ EOF
     done
 }
 
+# Collect state and resource usage for the given units with a single systemctl call.
+# Fills SVC_STATE, SVC_PID, SVC_CPU, SVC_MEM and SVC_RESTARTS (keyed by unit name).
+declare -A SVC_STATE SVC_PID SVC_CPU SVC_MEM SVC_RESTARTS
+collect_service_stats() {
+    SVC_STATE=(); SVC_PID=(); SVC_CPU=(); SVC_MEM=(); SVC_RESTARTS=()
+    [ $# -eq 0 ] && return 0
+    
+    local key value id="" state="" pid="" cpu="" mem="" restarts=""
+    while IFS='=' read -r key value; do
+        case "$key" in
+            Id)            id="$value" ;;
+            ActiveState)   state="$value" ;;
+            MainPID)       pid="$value" ;;
+            CPUUsageNSec)  cpu="$value" ;;
+            MemoryCurrent) mem="$value" ;;
+            NRestarts)     restarts="$value" ;;
+            "")
+                if [ -n "$id" ]; then
+                    SVC_STATE[$id]="${state:-unknown}"
+                    SVC_PID[$id]="$pid"
+                    SVC_CPU[$id]="$cpu"
+                    SVC_MEM[$id]="$mem"
+                    SVC_RESTARTS[$id]="${restarts:-0}"
+                fi
+                id=""; state=""; pid=""; cpu=""; mem=""; restarts=""
+                ;;
+        esac
+    done < <(systemctl show --no-pager \
+                --property=Id,ActiveState,MainPID,CPUUsageNSec,MemoryCurrent,NRestarts \
+                "$@" 2>/dev/null; echo)
+}
+
+# Format a systemd counter for display ("-" when unset: empty, [not set] or UINT64_MAX)
+format_cpu_nsec() {
+    local ns="$1"
+    if ! [[ "$ns" =~ ^[0-9]{1,19}$ ]]; then
+        echo "-"
+        return
+    fi
+    echo "$((ns / 1000000000)).$(( (ns / 100000000) % 10 ))s"
+}
+
+format_mem_bytes() {
+    local bytes="$1"
+    if ! [[ "$bytes" =~ ^[0-9]{1,19}$ ]]; then
+        echo "-"
+    elif [ "$bytes" -ge 1073741824 ]; then
+        echo "$((bytes / 1073741824)).$(( (bytes * 10 / 1073741824) % 10 ))G"
+    elif [ "$bytes" -ge 1048576 ]; then
+        echo "$((bytes / 1048576)).$(( (bytes * 10 / 1048576) % 10 ))M"
+    else
+        echo "$((bytes / 1024))K"
+    fi
+}
+
 # List services
 list_services() {
     show_banner
@@ -1391,30 +1555,49 @@ list_services() {
     if [[ ${#services[@]} -eq 0 ]]; then
         print_info "No Paqet services found"
     else
-        echo -e "${CYAN}┌──────────────────────────────────────────────────────────────┐${NC}"
-        echo -e "${CYAN}│ Service Name          │     Status     │   Type    │ Auto Restart │${NC}"
-        echo -e "${CYAN}├──────────────────────────────────────────────────────────────┤${NC}"
+        collect_service_stats "${services[@]}"
+        local cron_table
+        cron_table=$(crontab -l 2>/dev/null || true)
+        local supervised=()
+        [ -f "$SUPERVISOR_LIST" ] && mapfile -t supervised < "$SUPERVISOR_LIST"
+        
+        # Roles of all configs in one awk pass instead of a grep per service
+        local -A config_roles=()
+        local cfg_name cfg_role
+        while read -r cfg_name cfg_role; do
+            config_roles[$cfg_name]="$cfg_role"
+        done < <(awk -F': *' '/^role:/ { n = FILENAME; sub(/.*\//, "", n); sub(/\.yaml$/, "", n); gsub(/"/, "", $2); print n, $2 }' \
+                     "$CONFIG_DIR"/*.yaml 2>/dev/null)
+        
+        echo -e "${CYAN}┌───────────────────────┬──────────────┬───────────┬──────────┬──────────┬──────────┬──────────────┐${NC}"
+        echo -e "${CYAN}│ Service Name          │     Status   │   Type    │   CPU    │  Memory  │ Restarts │ Auto Restart │${NC}"
+        echo -e "${CYAN}├───────────────────────┼──────────────┼───────────┼──────────┼──────────┼──────────┼──────────────┤${NC}"
         
         for service in "${services[@]}"; do
             local service_name="${service%.service}"
             local display_name="${service_name#paqet-}"
             
-            local status=$(systemctl is-active "$service" 2>/dev/null || echo "unknown")
+            local status="${SVC_STATE[$service]:-unknown}"
             local type="unknown"
             if [ "$display_name" = "dashboard" ]; then
                 type="web"
             elif [ "$display_name" = "decoy" ]; then
                 type="decoy"
             else
-                local config_file="$CONFIG_DIR/$display_name.yaml"
-                if [ -f "$config_file" ]; then
-                    type=$(grep "^role:" "$config_file" 2>/dev/null | awk '{print $2}' | tr -d '"' || echo "unknown")
-                fi
+                type="${config_roles[$display_name]:-unknown}"
             fi
             
             local cron_info="No"
-            if crontab -l 2>/dev/null | grep -q "systemctl restart $service_name"; then
+            if [[ "$cron_table" == *"systemctl restart $service_name"* ]]; then
                 cron_info="Yes"
+            elif [[ " ${supervised[*]} " == *" $service_name "* ]]; then
+                cron_info="Health"
+            fi
+            
+            local cpu="-" mem="-"
+            if [ "$status" = "active" ]; then
+                cpu=$(format_cpu_nsec "${SVC_CPU[$service]}")
+                mem=$(format_mem_bytes "${SVC_MEM[$service]}")
             fi
             
             local status_text="$status"
@@ -1427,11 +1610,11 @@ list_services() {
                 *)        status_color="${WHITE}"; status_text="$status" ;;
             esac
 
-            printf "${CYAN}│ ${WHITE}%-21s ${CYAN}│ ${status_color}%-12s${NC} ${CYAN}│ ${WHITE}%-9s ${CYAN}│ ${WHITE}%-11s ${CYAN}│${NC}\n" \
-                   "$display_name" "$status_text" "$type" "$cron_info"
+            printf "${CYAN}│ ${WHITE}%-21s ${CYAN}│ ${status_color}%-12s${NC} ${CYAN}│ ${WHITE}%-9s ${CYAN}│ ${WHITE}%-8s ${CYAN}│ ${WHITE}%-8s ${CYAN}│ ${WHITE}%-8s ${CYAN}│ ${WHITE}%-12s ${CYAN}│${NC}\n" \
+                   "$display_name" "$status_text" "$type" "$cpu" "$mem" "${SVC_RESTARTS[$service]:-0}" "$cron_info"
         done
         
-        echo -e "${CYAN}└──────────────────────────────────────────────────────────────┘${NC}"
+        echo -e "${CYAN}└───────────────────────┴──────────────┴───────────┴──────────┴──────────┴──────────┴──────────────┘${NC}"
     fi
     
     echo ""
@@ -1457,11 +1640,11 @@ manage_service() {
         fi
         
         # Display services
+        collect_service_stats "${services[@]}"
         for i in "${!services[@]}"; do
             local service_name="${services[$i]%.service}"
             local display_name="${service_name#paqet-}"
-            local status
-            status=$(systemctl is-active "${services[$i]}" 2>/dev/null || echo "unknown")
+            local status="${SVC_STATE[${services[$i]}]:-unknown}"
             
             case "$status" in
                 active)
@@ -1575,9 +1758,11 @@ manage_service() {
                 8)
                     read -p "Delete this service? (y/N): " confirm
                     if [[ "$confirm" =~ ^[Yy]$ ]]; then
-                        # Remove cronjob first
+                        # Remove cronjob / supervision first
                         remove_cronjob "$service_name"
+                        remove_from_supervisor "$service_name" >/dev/null
                         
+                        remove_socket_unit "$service_name"
                         systemctl stop "$selected_service" 2>/dev/null || true
                         systemctl disable "$selected_service" 2>/dev/null || true
                         rm -f "$SERVICE_DIR/$selected_service" 2>/dev/null || true
@@ -1769,6 +1954,34 @@ install_mirror_selector() {
     read -p "Press Enter to return to menu..."
 }
 
+# Measure UDP/socket buffer health (drops per tunnel, buffer sysctls) instead of tuning blind
+check_udp_health() {
+    show_banner
+    echo -e "${YELLOW}UDP / socket buffer check${NC}"
+    echo ""
+    
+    if ! command -v python3 &> /dev/null; then
+        print_error "python3 is required. Install: apt install python3"
+        read -p "Press Enter to continue..."
+        return 1
+    fi
+    
+    local dashboard
+    if ! dashboard=$(find_paqet_script "paqet-dashboard.py" "$DASHBOARD_URL"); then
+        read -p "Press Enter to continue..."
+        return 1
+    fi
+    
+    print_step "Measuring for 5 seconds (run it while the tunnels carry traffic)..."
+    echo ""
+    PAQET_CONFIG_DIR="$CONFIG_DIR" python3 "$dashboard" --udp-health 5
+    echo ""
+    echo -e "  ${DIM}Drops or UNDERSIZED: raise net.core.rmem_max / rmem_default (and netdev_max_backlog for${NC}"
+    echo -e "  ${DIM}backlog drops) with sysctl -w, run this check again, then persist in /etc/sysctl.d/.${NC}"
+    echo ""
+    read -p "Press Enter to continue..."
+}
+
 # Server Optimization Menu
 optimize_server() {
     while true; do
@@ -1779,10 +1992,11 @@ optimize_server() {
         echo -e "${CYAN}1.${NC} BBR - TCP Congestion Control Optimizer"
         echo -e "${CYAN}2.${NC} DNS Finder - Find the best DNS servers for Iran"
         echo -e "${CYAN}3.${NC} Mirror Selector - Find the fastest apt repository mirror"
-        echo -e "${CYAN}4.${NC} Back to Main Menu"
+        echo -e "${CYAN}4.${NC} UDP buffer check - Measure socket drops per tunnel"
+        echo -e "${CYAN}5.${NC} Back to Main Menu"
         echo ""
         
-        read -p "Select option [1-4]: " choice
+        read -p "Select option [1-5]: " choice
         
         case $choice in
             1)
@@ -1795,6 +2009,9 @@ optimize_server() {
                 install_mirror_selector
                 ;;
             4)
+                check_udp_health
+                ;;
+            5)
                 return
                 ;;
             *)
@@ -1823,6 +2040,7 @@ uninstall_paqet() {
                           grep -E '^paqet-.*\.service' | awk '{print $1}' || true)
     
     for service in "${services[@]}"; do
+        remove_socket_unit "${service%.service}"
         systemctl stop "$service" 2>/dev/null || true
         systemctl disable "$service" 2>/dev/null || true
         rm -f "$SERVICE_DIR/$service" 2>/dev/null || true
@@ -1988,10 +2206,56 @@ run_decoy_website() {
     read -p "Press Enter to continue..."
 }
 
-# Install Web Dashboard as systemd service (always on)
+# Socket unit for on-demand start: systemd listens on the port and starts <name>.service
+# on the first connection (the service exits again when idle)
+write_socket_unit() {
+    local name="$1"
+    local port="$2"
+    local description="$3"
+    cat > "$SERVICE_DIR/$name.socket" << EOF
+[Unit]
+Description=$description (socket, port $port)
+
+[Socket]
+ListenStream=0.0.0.0:$port
+Backlog=1024
+
+[Install]
+WantedBy=sockets.target
+EOF
+}
+
+# Switch <name> to socket activation: the always-on service must release the port first
+enable_socket_unit() {
+    local name="$1"
+    systemctl daemon-reload
+    systemctl disable --now "$name.service" 2>/dev/null || true
+    systemctl enable --now "$name.socket"
+}
+
+# Drop the socket unit of <name>, if any (back to always on)
+remove_socket_unit() {
+    local name="$1"
+    [ -f "$SERVICE_DIR/$name.socket" ] || return 0
+    systemctl disable --now "$name.socket" 2>/dev/null || true
+    rm -f "$SERVICE_DIR/$name.socket"
+}
+
+# Ask whether <what> should start on demand; sets on_demand=1 if so
+ask_on_demand() {
+    local what="$1"
+    echo ""
+    echo -e "  ${DIM}On demand: systemd listens on the port and starts the $what on the first connection;${NC}"
+    echo -e "  ${DIM}it exits after $((IDLE_EXIT_SECONDS / 60)) idle minutes, so no Python process stays resident.${NC}"
+    read -p "Start on demand instead of always on? (y/N): " answer
+    on_demand=0
+    [[ "$answer" =~ ^[Yy]$ ]] && on_demand=1
+}
+
+# Install Web Dashboard as systemd service (always on or on demand)
 install_dashboard_service() {
     show_banner
-    echo -e "${YELLOW}  ▸ Web Dashboard as service (always on)${NC}"
+    echo -e "${YELLOW}  ▸ Web Dashboard as service (always on / on demand)${NC}"
     echo -e "  ${DIM}─────────────────────────────────────────────────────────────${NC}"
     echo ""
     
@@ -2034,18 +2298,32 @@ install_dashboard_service() {
         port="8880"
     fi
     
+    local on_demand
+    ask_on_demand "dashboard"
+    
+    # On demand: a clean idle exit must not be restarted, only crashes
+    local mode="always on" unit="paqet-dashboard.service" idle_arg="" restart="always" requires=""
+    if [ "$on_demand" = "1" ]; then
+        mode="on demand"
+        unit="paqet-dashboard.socket"
+        idle_arg=" --idle-exit $IDLE_EXIT_SECONDS"
+        restart="on-failure"
+        requires="Requires=paqet-dashboard.socket"
+    fi
+    
     local python_path
     python_path=$(command -v python3 2>/dev/null || echo "/usr/bin/python3")
     cat > "$SERVICE_DIR/paqet-dashboard.service" << EOF
 [Unit]
-Description=Paqet Web Dashboard (always on)
+Description=Paqet Web Dashboard ($mode)
 After=network.target
+$requires
 
 [Service]
 Type=simple
-ExecStart=$python_path $INSTALL_DIR/paqet-dashboard.py --port $port --bind 0.0.0.0
+ExecStart=$python_path $INSTALL_DIR/paqet-dashboard.py --port $port --bind 0.0.0.0$idle_arg
 Environment=PAQET_CONFIG_DIR=$CONFIG_DIR
-Restart=always
+Restart=$restart
 RestartSec=5
 WorkingDirectory=$INSTALL_DIR
 
@@ -2053,26 +2331,34 @@ WorkingDirectory=$INSTALL_DIR
 WantedBy=multi-user.target
 EOF
     
-    systemctl daemon-reload
-    systemctl enable paqet-dashboard.service --now
-    if systemctl is-active --quiet paqet-dashboard.service; then
-        print_success "Web Dashboard is now always on"
+    if [ "$on_demand" = "1" ]; then
+        write_socket_unit paqet-dashboard "$port" "Paqet Web Dashboard"
+        enable_socket_unit paqet-dashboard
+    else
+        remove_socket_unit paqet-dashboard
+        systemctl daemon-reload
+        systemctl enable paqet-dashboard.service
+        # restart: a running instance may still have the old port or the on-demand settings
+        systemctl restart paqet-dashboard.service
+    fi
+    if systemctl is-active --quiet "$unit"; then
+        print_success "Web Dashboard is now $mode"
         echo ""
         echo -e "  ${CYAN}URL:${NC} http://$(get_public_ip 2>/dev/null || echo 'YOUR_SERVER_IP'):$port/login"
         echo -e "  ${DIM}Login:${NC} any user, password: ${GREEN}paqet${NC} or ${GREEN}admin${NC}"
         echo ""
         echo -e "  ${YELLOW}To stop/restart:${NC} Menu → Option 5 (Manage Service) → paqet-dashboard"
     else
-        print_error "Failed to start. Check: systemctl status paqet-dashboard"
+        print_error "Failed to start. Check: systemctl status $unit"
     fi
     echo ""
     read -p "Press Enter to continue..."
 }
 
-# Install Decoy website as systemd service (always on)
+# Install Decoy website as systemd service (always on or on demand)
 install_decoy_service() {
     show_banner
-    echo -e "${YELLOW}  ▸ Decoy website as service (always on)${NC}"
+    echo -e "${YELLOW}  ▸ Decoy website as service (always on / on demand)${NC}"
     echo -e "  ${DIM}─────────────────────────────────────────────────────────────${NC}"
     echo ""
     
@@ -2118,35 +2404,291 @@ install_decoy_service() {
         return 1
     fi
     
+    local dir_arg=""
+    read -p "Static decoy pages directory (Enter = built-in portal pages): " decoy_dir
+    decoy_dir=$(echo "$decoy_dir" | tr -d ' \t')
+    if [ -n "$decoy_dir" ]; then
+        if [ -d "$decoy_dir" ]; then
+            dir_arg=" --dir $(cd "$decoy_dir" && pwd)"
+        else
+            print_warning "Directory not found: $decoy_dir (using built-in pages)"
+        fi
+    fi
+    
+    local on_demand
+    ask_on_demand "decoy"
+    
+    local mode="always on" unit="paqet-decoy.service" idle_arg="" restart="always" requires=""
+    if [ "$on_demand" = "1" ]; then
+        mode="on demand"
+        unit="paqet-decoy.socket"
+        idle_arg=" --idle-exit $IDLE_EXIT_SECONDS"
+        restart="on-failure"
+        requires="Requires=paqet-decoy.socket"
+    fi
+    
     local python_path
     python_path=$(command -v python3 2>/dev/null || echo "/usr/bin/python3")
     cat > "$SERVICE_DIR/paqet-decoy.service" << EOF
 [Unit]
-Description=Paqet Decoy Website (port $port)
+Description=Paqet Decoy Website (port $port, $mode)
 After=network.target
+$requires
 
 [Service]
 Type=simple
-ExecStart=$python_path $INSTALL_DIR/paqet-decoy.py --port $port --bind 0.0.0.0
-Restart=always
+ExecStart=$python_path $INSTALL_DIR/paqet-decoy.py --port $port --bind 0.0.0.0$dir_arg$idle_arg
+Restart=$restart
 RestartSec=5
+LimitNOFILE=65535
 WorkingDirectory=$INSTALL_DIR
 
 [Install]
 WantedBy=multi-user.target
 EOF
     
-    systemctl daemon-reload
-    systemctl enable paqet-decoy.service --now
-    if systemctl is-active --quiet paqet-decoy.service; then
-        print_success "Decoy website is now always on"
+    if [ "$on_demand" = "1" ]; then
+        write_socket_unit paqet-decoy "$port" "Paqet Decoy Website"
+        enable_socket_unit paqet-decoy
+    else
+        remove_socket_unit paqet-decoy
+        systemctl daemon-reload
+        systemctl enable paqet-decoy.service
+        # restart: a running instance may still have the old port or the on-demand settings
+        systemctl restart paqet-decoy.service
+    fi
+    if systemctl is-active --quiet "$unit"; then
+        print_success "Decoy website is now $mode"
         echo ""
         echo -e "  ${CYAN}URL:${NC} http://$(get_public_ip 2>/dev/null || echo 'YOUR_SERVER_IP'):$port"
         echo -e "  ${YELLOW}To stop/restart:${NC} Menu → Option 5 (Manage Service) → paqet-decoy"
     else
-        print_error "Failed to start. Check: systemctl status paqet-decoy"
+        print_error "Failed to start. Check: systemctl status $unit"
+    fi
+    echo ""
+    read -p "Press Enter to continue..."
+}
+
+# Locate one of the bundled Python tools (next to this script or in $INSTALL_DIR),
+# downloading it to /tmp if missing. Prints the path; returns 1 if unavailable.
+find_paqet_script() {
+    local script="$1"
+    local url="$2"
+    local script_dir
+    script_dir=$(cd "$(dirname "${BASH_SOURCE[0]:-.}")" 2>/dev/null && pwd)
+    for d in "$script_dir" "$INSTALL_DIR" "/opt/paqet" "."; do
+        if [ -f "${d}/${script}" ]; then
+            echo "${d}/${script}"
+            return 0
+        fi
+    done
+    print_step "${script} not found locally. Downloading to /tmp..." >&2
+    if curl -fsSL "$url" -o "/tmp/${script}" 2>/dev/null; then
+        echo "/tmp/${script}"
+        return 0
+    fi
+    print_error "Could not download ${script}. Place it in: $INSTALL_DIR or same dir as this script." >&2
+    return 1
+}
+
+# Tunnel history: uptime %, MTBF and flaps (recorded by the web dashboard)
+show_tunnel_history() {
+    show_banner
+    echo -e "${YELLOW}  ▸ Tunnel history (uptime / flaps)${NC}"
+    echo -e "  ${DIM}─────────────────────────────────────────────────────────────${NC}"
+    echo ""
+    
+    if ! command -v python3 &> /dev/null; then
+        print_error "python3 is required. Install: apt install python3"
+        read -p "Press Enter to continue..."
+        return 1
+    fi
+    
+    local dashboard
+    if ! dashboard=$(find_paqet_script "paqet-dashboard.py" "$DASHBOARD_URL"); then
+        read -p "Press Enter to continue..."
+        return 1
+    fi
+    
+    echo -e "  ${DIM}State changes are recorded while the Web Dashboard runs (Option 12 keeps it always on).${NC}"
+    echo ""
+    python3 "$dashboard" --history
+    echo ""
+    read -p "Service name for recent transitions (Enter to skip): " hist_service
+    hist_service=$(echo "$hist_service" | tr -cd '[:alnum:]-_.')
+    if [ -n "$hist_service" ]; then
+        echo ""
+        python3 "$dashboard" --history "$hist_service"
+        echo ""
+        read -p "Press Enter to continue..."
+    fi
+}
+
+# Start/stop/restart many tunnels at once, selected by role and/or name pattern
+bulk_service_action() {
+    show_banner
+    echo -e "${YELLOW}  ▸ Bulk start / stop / restart${NC}"
+    echo -e "  ${DIM}─────────────────────────────────────────────────────────────${NC}"
+    echo ""
+    
+    # Tunnel name + role for every config, in one awk pass
+    local -A tunnel_roles=()
+    local cfg_name cfg_role
+    while read -r cfg_name cfg_role; do
+        tunnel_roles[$cfg_name]="$cfg_role"
+    done < <(awk -F': *' '/^role:/ { n = FILENAME; sub(/.*\//, "", n); sub(/\.yaml$/, "", n); gsub(/"/, "", $2); print n, $2 }' \
+                 "$CONFIG_DIR"/*.yaml 2>/dev/null)
+    
+    if [[ ${#tunnel_roles[@]} -eq 0 ]]; then
+        print_info "No tunnel configs found in $CONFIG_DIR"
+        read -p "Press Enter to continue..."
+        return
+    fi
+    
+    read -p "Role [all/server/client] (default all): " bulk_role
+    bulk_role=$(echo "${bulk_role:-all}" | tr -d ' \t' | tr '[:upper:]' '[:lower:]')
+    read -p "Name pattern, e.g. ir-* (Enter = all): " bulk_pattern
+    bulk_pattern=$(echo "${bulk_pattern:-*}" | tr -d ' \t')
+    read -p "Action [restart/start/stop] (default restart): " bulk_action
+    bulk_action=$(echo "${bulk_action:-restart}" | tr -d ' \t' | tr '[:upper:]' '[:lower:]')
+    case "$bulk_action" in
+        restart|start|stop) ;;
+        *)
+            print_error "Invalid action: $bulk_action"
+            read -p "Press Enter to continue..."
+            return 1
+            ;;
+    esac
+    
+    local units=() name
+    for name in $(printf '%s\n' "${!tunnel_roles[@]}" | sort); do
+        [ "$bulk_role" != "all" ] && [ "${tunnel_roles[$name]}" != "$bulk_role" ] && continue
+        # unquoted on purpose: glob match
+        [[ "$name" == $bulk_pattern ]] || continue
+        [ -f "$SERVICE_DIR/paqet-${name}.service" ] || continue
+        units+=("paqet-${name}.service")
+    done
+    
+    if [[ ${#units[@]} -eq 0 ]]; then
+        print_info "No tunnel services match"
+        read -p "Press Enter to continue..."
+        return
+    fi
+    
+    echo ""
+    echo -e "${CYAN}${#units[@]} service(s):${NC} ${units[*]}"
+    read -p "$bulk_action all of them? (y/N): " confirm
+    [[ "$confirm" =~ ^[Yy]$ ]] || return
+    
+    # Run in parallel, at most $BULK_PARALLEL systemctl calls at a time; one result file per unit
+    local result_dir
+    result_dir=$(mktemp -d)
+    local unit
+    for unit in "${units[@]}"; do
+        while [ "$(jobs -rp | wc -l)" -ge "$BULK_PARALLEL" ]; do
+            wait -n
+        done
+        (
+            if out=$(systemctl "$bulk_action" "$unit" 2>&1); then
+                echo "ok" > "$result_dir/$unit"
+            else
+                echo "failed: $out" > "$result_dir/$unit"
+            fi
+        ) &
+    done
+    wait
+    
+    echo ""
+    local ok=0 failed=0 result
+    for unit in "${units[@]}"; do
+        result=$(head -n 3 "$result_dir/$unit" 2>/dev/null)
+        if [ "$result" = "ok" ]; then
+            ok=$((ok + 1))
+            echo -e "  ${GREEN}✓${NC} $unit"
+        else
+            failed=$((failed + 1))
+            echo -e "  ${RED}✗${NC} $unit ${DIM}${result:-no result}${NC}"
+        fi
+    done
+    rm -rf "$result_dir"
+    echo ""
+    if [ "$failed" -eq 0 ]; then
+        print_success "$bulk_action: $ok/${#units[@]} succeeded"
+    else
+        print_warning "$bulk_action: $ok succeeded, $failed failed"
+    fi
+    read -p "Press Enter to continue..."
+}
+
+# Create many tunnels at once from a JSON file (validated as a whole, one daemon-reload)
+provision_from_file() {
+    show_banner
+    echo -e "${YELLOW}  ▸ Bulk provision from file${NC}"
+    echo -e "  ${DIM}─────────────────────────────────────────────────────────────${NC}"
+    echo ""
+    
+    if ! command -v python3 &> /dev/null; then
+        print_error "python3 is required. Install: apt install python3"
+        read -p "Press Enter to continue..."
+        return 1
+    fi
+    
+    local provision
+    if ! provision=$(find_paqet_script "paqet-provision.py" "$PROVISION_URL"); then
+        read -p "Press Enter to continue..."
+        return 1
+    fi
+    
+    echo -e "  ${DIM}One JSON file describes all tunnels. Example (save it, edit, then give its path):${NC}"
+    echo ""
+    python3 "$provision" --example
+    echo ""
+    read -p "Tunnels file (Enter to cancel): " spec_file
+    if [ -z "$spec_file" ]; then
+        return
+    fi
+    if [ ! -f "$spec_file" ]; then
+        print_error "File not found: $spec_file"
+        read -p "Press Enter to continue..."
+        return 1
+    fi
+    
+    local extra_args=()
+    read -p "Overwrite existing configs with the same name? (y/N): " overwrite
+    [[ "$overwrite" =~ ^[Yy]$ ]] && extra_args+=("--force")
+    
+    echo ""
+    print_step "Validating $spec_file..."
+    if ! python3 "$provision" "$spec_file" --dry-run "${extra_args[@]}"; then
+        read -p "Press Enter to continue..."
+        return 1
     fi
+    
     echo ""
+    read -p "Create these tunnels now? (y/N): " confirm
+    [[ "$confirm" =~ ^[Yy]$ ]] || return
+    
+    # Install Paqet if not installed
+    if [ ! -f "$BIN_DIR/paqet" ]; then
+        if ! install_paqet; then
+            print_error "Failed to install Paqet"
+            read -p "Press Enter to continue..."
+            return 1
+        fi
+    fi
+    
+    read -p "Let the health supervisor restart them when unhealthy? (Y/n): " supervise
+    [[ "$supervise" =~ ^[Nn]$ ]] || extra_args+=("--supervise")
+    
+    echo ""
+    if python3 "$provision" "$spec_file" "${extra_args[@]}"; then
+        if [[ " ${extra_args[*]} " == *" --supervise "* ]] && ! systemctl is-active --quiet paqet-supervisor.service; then
+            install_supervisor_service
+        fi
+        print_success "Provisioning finished"
+    else
+        print_error "Provisioning reported errors (see above)"
+    fi
     read -p "Press Enter to continue..."
 }
 
@@ -2178,14 +2720,17 @@ main_menu() {
         echo -e "  ${CYAN}9.${NC} Anti-DPI / Stealth tips"
         echo -e "  ${CYAN}10.${NC} Web Dashboard (status, logs, config)"
         echo -e "  ${CYAN}11.${NC} Decoy website (port 443 – fake site for DPI)"
-        echo -e "  ${CYAN}12.${NC} Web Dashboard as service (always on)"
-        echo -e "  ${CYAN}13.${NC} Decoy website as service (always on)"
-        echo -e "  ${CYAN}14.${NC} Exit"
+        echo -e "  ${CYAN}12.${NC} Web Dashboard as service (always on / on demand)"
+        echo -e "  ${CYAN}13.${NC} Decoy website as service (always on / on demand)"
+        echo -e "  ${CYAN}14.${NC} Tunnel history (uptime / flaps)"
+        echo -e "  ${CYAN}15.${NC} Bulk start / stop / restart"
+        echo -e "  ${CYAN}16.${NC} Bulk provision tunnels from file"
+        echo -e "  ${CYAN}17.${NC} Exit"
         echo ""
         echo -e "  ${DIM}─────────────────────────────────────────────────────────────${NC}"
         echo ""
         
-        read -p "  Select option [0-14]: " choice
+        read -p "  Select option [0-17]: " choice
         
         case $choice in
             0)
@@ -2231,6 +2776,15 @@ main_menu() {
                 install_decoy_service
                 ;;
             14)
+                show_tunnel_history
+                ;;
+            15)
+                bulk_service_action
+                ;;
+            16)
+                provision_from_file
+                ;;
+            17)
                 echo -e "${GREEN}Goodbye!${NC}"
                 exit 0
                 ;;
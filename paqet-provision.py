@@ -0,0 +1,623 @@
+#!/usr/bin/env python3
+"""
+Paqet - Bulk tunnel provisioning
+Creates many server/client tunnels from one declarative JSON file in a single pass: the listening
+sockets and existing configs are read once into a port index, every tunnel is validated against it
+and against the other tunnels in the file, then all configs and systemd units are rendered, written
+atomically, and systemd is reloaded once. Nothing is written if any tunnel is invalid.
+Python 3 stdlib only. Run as root: python3 paqet-provision.py tunnels.json [--dry-run] [--force]
+  [--no-start] [--no-iptables] [--supervise]
+Example input: python3 paqet-provision.py --example
+"""
+import ipaddress
+import json
+import os
+import re
+import secrets
+import string
+import subprocess
+import sys
+import time
+
+CONFIG_DIR = os.environ.get("PAQET_CONFIG_DIR", "/etc/paqet")
+SERVICE_DIR = os.environ.get("PAQET_SERVICE_DIR", "/etc/systemd/system")
+BIN_DIR = os.environ.get("PAQET_BIN_DIR", "/usr/local/bin")
+SUPERVISOR_LIST = os.path.join(CONFIG_DIR, "supervisor.list")
+NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+BLOCK_RE = re.compile(r"^[a-z0-9-]+$")
+KEY_RE = re.compile(r'^\s+key:\s*"([^"]*)"', re.M)
+HOST_RE = re.compile(r"^(?=.{1,253}$)[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?)*$")
+IFACE_RE = re.compile(r"^[A-Za-z0-9_.:@-]{1,15}$")
+MAC_RE = re.compile(r"^[0-9A-Fa-f]{2}(?::[0-9A-Fa-f]{2}){5}$")
+KCP_MODES = ("normal", "fast", "fast2", "fast3", "manual")
+# Same defaults as the interactive menus (configure_server / get_kcp_mode_config).
+DEFAULTS = {"mode": "fast", "block": "aes", "mtu": 1350, "conn": 1}
+MANUAL_DEFAULTS = {"nodelay": 1, "wdelay": "false", "acknodelay": "true", "interval": 20, "resend": 1,
+                   "nocongestion": 1, "mtu": 1200, "rcvwnd": 2048, "sndwnd": 2048}
+MANUAL_KEYS = ("nodelay", "wdelay", "acknodelay", "interval", "resend", "nocongestion", "mtu", "rcvwnd", "sndwnd")
+FIELDS = {"name", "role", "port", "server", "key", "interface", "local_ip", "router_mac", "mode", "block",
+          "conn", "forward_tcp", "forward_udp"} | set(MANUAL_KEYS)
+
+EXAMPLE = {
+    "defaults": {"mode": "fast", "block": "aes", "mtu": 1350, "conn": 1},
+    "tunnels": [
+        {"name": "kh-1", "role": "server", "port": 8888},
+        {"name": "kh-2", "role": "server", "port": 8889, "key": "YourSharedSecretKey0123456789abc", "mode": "fast2"},
+        {"name": "ir-1", "role": "client", "server": "203.0.113.7:8888", "key": "YourSharedSecretKey0123456789abc",
+         "forward_tcp": [9090, 9091], "forward_udp": [1194]},
+    ],
+}
+
+
+def run_cmd(cmd, timeout=30, stdin=None):
+    try:
+        r = subprocess.run(cmd, input=stdin, capture_output=True, text=True, timeout=timeout,
+                           env={**os.environ, "LANG": "C"})
+        return r.stdout or "", r.stderr or "", r.returncode
+    except Exception as e:
+        return "", str(e), -1
+
+
+def generate_secret_key():
+    alphabet = string.ascii_letters + string.digits
+    return "".join(secrets.choice(alphabet) for _ in range(32))
+
+
+def listening_ports():
+    """(proto, port) of every listening TCP socket and bound UDP socket, from /proc/net."""
+    ports = set()
+    for proto, files in (("tcp", ("tcp", "tcp6")), ("udp", ("udp", "udp6"))):
+        for name in files:
+            try:
+                with open("/proc/net/" + name, encoding="ascii", errors="replace") as f:
+                    next(f, None)
+                    for line in f:
+                        fields = line.split()
+                        if len(fields) < 4:
+                            continue
+                        if proto == "tcp" and fields[3] != "0A":  # 0A = LISTEN
+                            continue
+                        port = int(fields[1].rsplit(":", 1)[1], 16)
+                        if port:
+                            ports.add((proto, port))
+            except (OSError, ValueError, IndexError):
+                continue
+    return ports
+
+
+def config_ports(text):
+    """(proto, port) claimed by a paqet config: the server listen port and every forward."""
+    ports, section, forward = [], None, None
+    for raw in text.splitlines():
+        line = raw.split("#", 1)[0].rstrip()
+        if not line.strip():
+            continue
+        if not raw.startswith((" ", "-")):
+            section = line.split(":", 1)[0].strip()
+            forward = None
+            continue
+        stripped = line.strip()
+        key, _, value = stripped.lstrip("- ").partition(":")
+        value = value.strip().strip('"')
+        if section == "listen" and key == "addr":
+            port = value.rsplit(":", 1)[-1]
+            if port.isdigit():
+                ports.append(("tcp", int(port)))
+        elif section == "forward":
+            if stripped.startswith("- "):
+                forward = None
+            if key == "listen" and value.rsplit(":", 1)[-1].isdigit():
+                forward = ["tcp", int(value.rsplit(":", 1)[-1])]
+                ports.append(forward)
+            elif key == "protocol" and forward is not None:
+                forward[0] = value
+    return [tuple(p) for p in ports]
+
+
+class PortIndex:
+    """Every port already taken on this box, built once: sockets from /proc/net plus the ports of
+    existing paqet configs (a stopped tunnel still owns its ports). Tunnels being replaced do not
+    conflict with their own old ports."""
+
+    def __init__(self, config_dir=CONFIG_DIR, replacing=()):
+        self.sockets = listening_ports()
+        self.configs = {}  # (proto, port) -> config name
+        self.exempt = set()
+        self.claims = {}   # (proto, port) -> tunnel name from the input file
+        try:
+            names = sorted(f[:-5] for f in os.listdir(config_dir) if f.endswith(".yaml"))
+        except OSError:
+            names = []
+        for name in names:
+            try:
+                with open(os.path.join(config_dir, name + ".yaml"), encoding="utf-8", errors="replace") as f:
+                    ports = config_ports(f.read())
+            except OSError:
+                continue
+            for key in ports:
+                if name in replacing:
+                    self.exempt.add(key)
+                else:
+                    self.configs.setdefault(key, name)
+
+    def claim(self, proto, port, owner):
+        """None if (proto, port) is free for `owner`, otherwise why it is not."""
+        key = (proto, port)
+        other = self.claims.get(key)
+        if other is not None and other != owner:
+            return "{}/{} is also used by {} in this file".format(proto, port, other)
+        if key in self.configs:
+            return "{}/{} is used by existing config {}".format(proto, port, self.configs[key])
+        if key in self.sockets and key not in self.exempt:
+            return "{}/{} is already in use on this host".format(proto, port)
+        self.claims[key] = owner
+        return None
+
+
+class Network:
+    """Interface / local IP / gateway MAC detection, done once and shared by all tunnels."""
+
+    def __init__(self):
+        self._default = None
+        self._addrs = {}
+
+    def default(self):
+        if self._default is None:
+            out, _, _ = run_cmd(["ip", "-4", "route", "show", "default"])
+            m = re.search(r"via (\S+) dev (\S+)", out)
+            gateway, interface = (m.group(1), m.group(2)) if m else (None, None)
+            mac = None
+            if gateway:
+                out, _, _ = run_cmd(["ip", "neigh", "show", gateway])
+                m = re.search(r"lladdr ([0-9a-fA-F:]{17})", out)
+                mac = m.group(1) if m else None
+            self._default = {"interface": interface, "router_mac": mac}
+        return self._default
+
+    def local_ip(self, interface):
+        if interface not in self._addrs:
+            out, _, _ = run_cmd(["ip", "-4", "-o", "addr", "show", "dev", interface])
+            m = re.search(r"inet (\d+\.\d+\.\d+\.\d+)/", out)
+            self._addrs[interface] = m.group(1) if m else None
+        return self._addrs[interface]
+
+
+def existing_key(config_dir, name):
+    try:
+        with open(os.path.join(config_dir, name + ".yaml"), encoding="utf-8", errors="replace") as f:
+            m = KEY_RE.search(f.read())
+    except OSError:
+        return None
+    return m.group(1) if m else None
+
+
+def _port(value):
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        return None
+    return port if 1 <= port <= 65535 else None
+
+
+def _int(value, low, high):
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return None
+    return n if low <= n <= high else None
+
+
+def _ip(value):
+    try:
+        ipaddress.ip_address(str(value))
+    except ValueError:
+        return False
+    return True
+
+
+def validate(spec, index, network, force=False, config_dir=CONFIG_DIR):
+    """Resolve defaults and check every tunnel. Returns (tunnels, errors); tunnels are only
+    usable when errors is empty."""
+    errors, tunnels, seen = [], [], set()
+    if not isinstance(spec, dict) or not isinstance(spec.get("tunnels"), list):
+        return [], ['top level must be an object with a "tunnels" list']
+    spec_defaults = spec.get("defaults") or {}
+    if not isinstance(spec_defaults, dict):
+        return [], ['"defaults" must be an object']
+    unknown = sorted(set(spec_defaults) - FIELDS)
+    if unknown:
+        errors.append("defaults: unknown field(s): " + ", ".join(unknown))
+    defaults = dict(DEFAULTS, **spec_defaults)
+    for i, raw in enumerate(spec["tunnels"]):
+        if not isinstance(raw, dict):
+            errors.append("tunnel #{}: must be an object".format(i + 1))
+            continue
+        t = dict(defaults, **raw)
+        name = str(t.get("name", ""))
+        label = name or "tunnel #{}".format(i + 1)
+        fail = lambda msg: errors.append("{}: {}".format(label, msg))
+        unknown = sorted(set(raw) - FIELDS)
+        if unknown:
+            fail("unknown field(s): " + ", ".join(unknown))
+        if not NAME_RE.match(name):
+            fail("name must be letters, digits, - or _")
+            continue
+        if name in seen:
+            fail("duplicate name")
+            continue
+        seen.add(name)
+        t["replaces"] = os.path.exists(os.path.join(config_dir, name + ".yaml"))
+        if t["replaces"] and not force:
+            fail("config {}.yaml exists (use --force to overwrite)".format(name))
+        role = t.get("role")
+        if role not in ("server", "client"):
+            fail('role must be "server" or "client"')
+            continue
+
+        mode = t.get("mode")
+        if mode not in KCP_MODES:
+            fail("mode must be one of: " + ", ".join(KCP_MODES))
+        if not BLOCK_RE.match(str(t.get("block", ""))):
+            fail("invalid block cipher: {}".format(t.get("block")))
+        t["conn"] = _int(t.get("conn"), 1, 32)
+        if t["conn"] is None:
+            fail("conn must be 1-32")
+        if mode == "manual":
+            for key in MANUAL_KEYS:
+                if key not in raw and key not in spec_defaults:
+                    t[key] = MANUAL_DEFAULTS[key]
+            for key in ("wdelay", "acknodelay"):
+                t[key] = str(t[key]).lower()
+                if t[key] not in ("true", "false"):
+                    fail("{} must be true or false".format(key))
+            for key in ("nodelay", "interval", "resend", "nocongestion", "rcvwnd", "sndwnd"):
+                if _int(t[key], 0, 1 << 20) is None:
+                    fail("{} must be a non-negative integer".format(key))
+        t["mtu"] = _int(t.get("mtu"), 100, 65535)
+        if t["mtu"] is None:
+            fail("mtu must be an integer")
+
+        if not t.get("interface"):
+            t["interface"] = network.default()["interface"]
+        if not t.get("interface"):
+            fail("no interface given and no default route found")
+            continue
+        if not IFACE_RE.match(str(t["interface"])):
+            fail("invalid interface name: {}".format(t["interface"]))
+            continue
+        if not t.get("local_ip"):
+            t["local_ip"] = network.local_ip(t["interface"])
+        if not t.get("local_ip"):
+            fail("no local_ip given and none found on {}".format(t["interface"]))
+        elif not _ip(t["local_ip"]):
+            fail("local_ip must be an IP address: {}".format(t["local_ip"]))
+        if not t.get("router_mac"):
+            t["router_mac"] = network.default()["router_mac"]
+        if not t.get("router_mac"):
+            fail("no router_mac given and the gateway MAC could not be found")
+        elif not MAC_RE.match(str(t["router_mac"])):
+            fail("router_mac must look like aa:bb:cc:dd:ee:ff: {}".format(t["router_mac"]))
+
+        if role == "server":
+            t["port"] = _port(t.get("port"))
+            if t["port"] is None:
+                fail("port must be 1-65535")
+            else:
+                conflict = index.claim("tcp", t["port"], name)
+                if conflict:
+                    fail(conflict)
+            if not t.get("key") and t["replaces"]:
+                t["key"] = existing_key(config_dir, name)  # keep the key its clients already use
+            if not t.get("key"):
+                t["key"] = generate_secret_key()
+                t["generated_key"] = True
+            t["forward_tcp"], t["forward_udp"] = [], []
+        else:
+            host, _, port = str(t.get("server", "")).rpartition(":")
+            if host.startswith("[") and host.endswith("]"):
+                host = host[1:-1]
+            if not (_ip(host) or HOST_RE.match(host)) or _port(port) is None:
+                fail('server must be "IP:PORT" or "HOST:PORT"')
+            if not t.get("key"):
+                fail("key is required for a client (the server's secret key)")
+            for proto in ("tcp", "udp"):
+                ports = t.get("forward_" + proto) or []
+                if not isinstance(ports, list):
+                    ports = [p for p in str(ports).split(",") if p.strip()]
+                clean = []
+                for p in ports:
+                    port = _port(p)
+                    if port is None:
+                        fail("invalid {} forward port: {}".format(proto, p))
+                    elif port not in clean:
+                        clean.append(port)
+                        conflict = index.claim(proto, port, name)
+                        if conflict:
+                            fail(conflict)
+                t["forward_" + proto] = clean
+            if not t["forward_tcp"] and not t["forward_udp"]:
+                fail("a client needs forward_tcp and/or forward_udp ports")
+        if t.get("key") and (not str(t["key"]).strip() or any(c in str(t["key"]) for c in '"\\\n')):
+            fail("key must not be blank or contain quotes, backslashes or newlines")
+        tunnels.append(t)
+    return tunnels, errors
+
+
+def render_kcp(t):
+    if t["mode"] == "manual":
+        lines = ['    mode: "manual"'] + ["    {}: {}".format(k, t[k]) for k in MANUAL_KEYS] + \
+                ['    block: "{}"'.format(t["block"])]
+    else:
+        lines = ['    mode: "{}"'.format(t["mode"]), '    block: "{}"'.format(t["block"]),
+                 "    mtu: {}".format(t["mtu"])]
+    return "\n".join(lines) + "\n"
+
+
+def render_config(t):
+    """Same YAML the interactive configure_server / configure_client write."""
+    if t["role"] == "server":
+        return """# Paqet Server Configuration
+role: "server"
+
+log:
+  level: "info"
+
+listen:
+  addr: ":{port}"
+
+network:
+  interface: "{interface}"
+  ipv4:
+    addr: "{local_ip}:{port}"
+    router_mac: "{router_mac}"
+  tcp:
+    local_flag: ["PA"]
+
+transport:
+  protocol: "kcp"
+  conn: {conn}
+  kcp:
+    key: "{key}"
+{kcp}
+""".format_map(dict(t, kcp=render_kcp(t)))
+    forwards = "".join('\n  - listen: "0.0.0.0:{0}"\n    target: "127.0.0.1:{0}"\n    protocol: "{1}"'.format(port, proto)
+                       for proto in ("tcp", "udp") for port in t["forward_" + proto])
+    return """# Paqet Client Configuration
+role: "client"
+
+log:
+  level: "info"
+
+forward:{forwards}
+
+network:
+  interface: "{interface}"
+  ipv4:
+    addr: "{local_ip}:0"
+    router_mac: "{router_mac}"
+  tcp:
+    local_flag: ["PA"]
+    remote_flag: ["PA"]
+
+server:
+  addr: "{server}"
+
+transport:
+  protocol: "kcp"
+  conn: {conn}
+  kcp:
+    key: "{key}"
+{kcp}
+""".format_map(dict(t, forwards=forwards, kcp=render_kcp(t)))
+
+
+def render_unit(name):
+    """Same unit create_systemd_service writes."""
+    return """[Unit]
+Description=Paqet Tunnel ({name})
+After=network.target
+StartLimitIntervalSec=0
+
+[Service]
+Type=simple
+ExecStart={bin_dir}/paqet run -c {config_dir}/{name}.yaml
+Restart=always
+RestartSec=5
+LimitNOFILE=65535
+
+[Install]
+WantedBy=multi-user.target
+""".format(name=name, bin_dir=BIN_DIR, config_dir=CONFIG_DIR)
+
+
+def write_all(files):
+    """Stage every file as a temp file next to its target, then rename them all into place, so a
+    failure part-way leaves the old files untouched. files: [(path, text, mode)]."""
+    staged = []
+    try:
+        for path, text, mode in files:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = os.path.join(os.path.dirname(path), ".{}.tmp{}".format(os.path.basename(path), os.getpid()))
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+            staged.append((tmp, path))
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, mode)
+    except OSError:
+        for tmp, _ in staged:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+        raise
+    for tmp, path in staged:
+        os.replace(tmp, path)
+    for d in {os.path.dirname(path) for _, path in staged}:
+        try:
+            fd = os.open(d, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+
+def iptables_rules(tunnels):
+    """(table, rule) pairs configure_iptables would add for every tunnel port."""
+    rules = []
+    for t in tunnels:
+        ports = [("tcp", t["port"])] if t["role"] == "server" else \
+            [("tcp", p) for p in t["forward_tcp"]] + [("udp", p) for p in t["forward_udp"]]
+        for proto, port in ports:
+            rules.append(("raw", "-A PREROUTING -p {} --dport {} -j NOTRACK".format(proto, port)))
+            rules.append(("raw", "-A OUTPUT -p {} --sport {} -j NOTRACK".format(proto, port)))
+            if proto == "tcp":
+                rules.append(("mangle", "-A OUTPUT -p tcp --sport {} --tcp-flags RST RST -j DROP".format(port)))
+    return rules
+
+
+def _norm_rule(rule):
+    tokens = rule.split()
+    out, i = [], 0
+    while i < len(tokens):
+        if tokens[i] == "-m" and i + 1 < len(tokens) and tokens[i + 1] in ("tcp", "udp"):
+            i += 2  # iptables-save adds the implicit "-m tcp"/"-m udp" match
+            continue
+        out.append(tokens[i])
+        i += 1
+    return " ".join(out)
+
+
+def apply_iptables(tunnels):
+    """Add only the missing rules, all tables in one iptables-restore --noflush call."""
+    out, err, code = run_cmd(["iptables-save"])
+    if code != 0:
+        return "iptables-save failed: " + (err.strip() or "exit code {}".format(code))
+    present, table = set(), None
+    for line in out.splitlines():
+        if line.startswith("["):
+            line = line.split("] ", 1)[-1]  # "[packets:bytes] -A ..." (iptables-save -c)
+        if line.startswith("*"):
+            table = line[1:].strip()
+        elif line.startswith("-A "):
+            present.add((table, _norm_rule(line)))
+    missing = [(tbl, rule) for tbl, rule in iptables_rules(tunnels) if (tbl, _norm_rule(rule)) not in present]
+    missing = list(dict.fromkeys(missing))
+    if not missing:
+        return None
+    script = []
+    for tbl in ("raw", "mangle"):
+        rules = [rule for t, rule in missing if t == tbl]
+        if rules:
+            script += ["*" + tbl] + rules + ["COMMIT"]
+    _, err, code = run_cmd(["iptables-restore", "--noflush"], stdin="\n".join(script) + "\n")
+    if code != 0:
+        return "iptables-restore failed: " + (err.strip() or "exit code {}".format(code))
+    return None
+
+
+def add_to_supervisor(names):
+    try:
+        with open(SUPERVISOR_LIST, encoding="utf-8") as f:
+            listed = {line.strip() for line in f}
+    except OSError:
+        listed = set()
+    new = ["paqet-" + n for n in names if "paqet-" + n not in listed]
+    if new:
+        with open(SUPERVISOR_LIST, "a", encoding="utf-8") as f:
+            f.write("\n".join(new) + "\n")
+    return new
+
+
+def print_summary(tunnels):
+    print("{:<24} {:<7} {:<30} {}".format("Tunnel", "Role", "Ports", "Server / key"))
+    for t in tunnels:
+        if t["role"] == "server":
+            ports = "listen {}".format(t["port"])
+            extra = "key " + t["key"] + (" (generated)" if t.get("generated_key") else "")
+        else:
+            ports = ",".join("tcp/{}".format(p) for p in t["forward_tcp"])
+            ports += ("," if ports and t["forward_udp"] else "") + ",".join("udp/{}".format(p) for p in t["forward_udp"])
+            extra = "-> " + t["server"]
+        print("{:<24} {:<7} {:<30} {}".format(t["name"], t["role"], ports, extra))
+
+
+def main():
+    args = sys.argv[1:]
+    if "--example" in args:
+        print(json.dumps(EXAMPLE, indent=2))
+        return 0
+    files = [a for a in args if not a.startswith("--")]
+    if len(files) != 1:
+        print(__doc__.strip(), file=sys.stderr)
+        return 2
+    dry_run = "--dry-run" in args
+    started = time.monotonic()
+    try:
+        with open(files[0], encoding="utf-8") as f:
+            spec = json.load(f)
+    except (OSError, ValueError) as e:
+        print("Cannot read {}: {}".format(files[0], e), file=sys.stderr)
+        return 1
+
+    names = {str(t.get("name")) for t in spec.get("tunnels", []) if isinstance(t, dict)} \
+        if isinstance(spec, dict) else set()
+    index = PortIndex(CONFIG_DIR, replacing=names)
+    tunnels, errors = validate(spec, index, Network(), force="--force" in args)
+    if errors:
+        print("{} problem(s), nothing written:".format(len(errors)), file=sys.stderr)
+        for e in errors:
+            print("  " + e, file=sys.stderr)
+        return 1
+    if not tunnels:
+        print("No tunnels in {}".format(files[0]))
+        return 0
+
+    files_out = []
+    for t in tunnels:
+        files_out.append((os.path.join(CONFIG_DIR, t["name"] + ".yaml"), render_config(t), 0o600))
+        files_out.append((os.path.join(SERVICE_DIR, "paqet-{}.service".format(t["name"])), render_unit(t["name"]), 0o644))
+    units = ["paqet-{}.service".format(t["name"]) for t in tunnels]
+    print_summary(tunnels)
+    print("")
+    if dry_run:
+        print("Dry run: {} tunnel(s) valid; would write {} files, reload systemd once and enable/restart {} unit(s).".format(
+            len(tunnels), len(files_out), len(units)))
+        return 0
+
+    try:
+        write_all(files_out)
+    except OSError as e:
+        print("Write failed, nothing changed: {}".format(e), file=sys.stderr)
+        return 1
+    print("Wrote {} configs and {} units".format(len(tunnels), len(tunnels)))
+    status = 0
+    if "--no-iptables" not in args:
+        err = apply_iptables(tunnels)
+        if err:
+            print("Warning: " + err, file=sys.stderr)
+    _, err, code = run_cmd(["systemctl", "daemon-reload"])
+    if code != 0:
+        print("systemctl daemon-reload failed: " + err.strip(), file=sys.stderr)
+        return 1
+    if "--no-start" not in args:
+        for action in (["enable"], ["restart"]):
+            _, err, code = run_cmd(["systemctl"] + action + units, timeout=120)
+            if code != 0:
+                print("systemctl {} failed: {}".format(action[0], err.strip()), file=sys.stderr)
+                status = 1
+    if "--supervise" in args:
+        try:
+            added = add_to_supervisor([t["name"] for t in tunnels])
+            print("Health supervisor: {} tunnel(s) added to {}".format(len(added), SUPERVISOR_LIST))
+        except OSError as e:
+            print("Could not update {}: {}".format(SUPERVISOR_LIST, e), file=sys.stderr)
+    print("Done: {} tunnel(s) in {:.1f}s".format(len(tunnels), time.monotonic() - started))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
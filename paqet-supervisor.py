@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Paqet - Health supervisor
+Restarts paqet tunnels only when they are unhealthy (unit failed, or a burst of error lines in
+its journal), with exponential backoff and a per-tunnel restart budget. Replaces fixed-interval
+cron restarts; one asyncio loop watches every tunnel listed in the units file.
+Python 3 stdlib only. Run as root: python3 paqet-supervisor.py [--units-file /etc/paqet/supervisor.list]
+  [--interval 10]
+"""
+import asyncio
+import collections
+import json
+import os
+import re
+import signal
+import sys
+import time
+
+CONFIG_DIR = os.environ.get("PAQET_CONFIG_DIR", "/etc/paqet")
+# One unit per line (paqet-NAME or paqet-NAME.service); "#" starts a comment. Re-read when it changes.
+DEFAULT_UNITS_FILE = os.path.join(CONFIG_DIR, "supervisor.list")
+DEFAULT_INTERVAL = float(os.environ.get("PAQET_SUP_INTERVAL", "10"))
+# Journal lines matching any of these count as errors; ERROR_THRESHOLD of them within
+# ERROR_WINDOW seconds marks the tunnel unhealthy.
+ERROR_PATTERNS = os.environ.get(
+    "PAQET_SUP_PATTERNS",
+    r"\b(fatal|panic)\b|handshake.*(fail|timeout)|i/o timeout|connection refused|"
+    r"no route to host|broken pipe|failed to (dial|connect|read|write)"
+)
+ERROR_THRESHOLD = int(os.environ.get("PAQET_SUP_ERRORS", "20"))
+ERROR_WINDOW = float(os.environ.get("PAQET_SUP_ERROR_WINDOW", "60"))
+# Backoff between restarts of the same tunnel doubles from BACKOFF_BASE up to BACKOFF_MAX and
+# resets after BACKOFF_RESET seconds without a restart.
+BACKOFF_BASE = float(os.environ.get("PAQET_SUP_BACKOFF", "30"))
+BACKOFF_MAX = float(os.environ.get("PAQET_SUP_BACKOFF_MAX", "1800"))
+BACKOFF_RESET = 600.0
+# At most RESTART_BUDGET restarts per tunnel in any BUDGET_WINDOW seconds.
+RESTART_BUDGET = int(os.environ.get("PAQET_SUP_BUDGET", "6"))
+BUDGET_WINDOW = 3600.0
+# Errors logged right after a restart (reconnect noise) are ignored for this long.
+RESTART_GRACE = 30.0
+RESTART_TIMEOUT = 30.0
+# journalctl -o json lines carry the whole MESSAGE; asyncio's default line limit is only 64 KiB.
+JOURNAL_LINE_LIMIT = 1024 * 1024
+
+
+def log(msg):
+    print(time.strftime("%Y-%m-%d %H:%M:%S ") + msg, flush=True)
+
+
+def unit_name(value):
+    if value.endswith(".service"):
+        return value
+    return "paqet-" + value.replace("paqet-", "") + ".service"
+
+
+def read_units(path):
+    units = []
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    units.append(unit_name(line))
+    except OSError:
+        pass
+    return sorted(set(units))
+
+
+def parse_systemctl_show(out):
+    blocks, cur = [], {}
+    for line in out.splitlines():
+        if not line.strip():
+            if cur:
+                blocks.append(cur)
+                cur = {}
+            continue
+        key, _, value = line.partition("=")
+        cur[key] = value
+    if cur:
+        blocks.append(cur)
+    return blocks
+
+
+class TunnelHealth:
+    def __init__(self, unit):
+        self.unit = unit
+        self.state = "unknown"
+        self.errors = collections.deque()    # timestamps of matching journal lines in ERROR_WINDOW
+        self.restarts = collections.deque()  # timestamps of our restarts in BUDGET_WINDOW
+        self.backoff = BACKOFF_BASE
+        self.next_allowed = 0.0
+        self.grace_until = 0.0
+        self.budget_warned = False
+
+    def add_error(self, now):
+        if now < self.grace_until:
+            return
+        self.errors.append(now)
+        while self.errors and self.errors[0] < now - ERROR_WINDOW:
+            self.errors.popleft()
+
+    def unhealthy_reason(self, now):
+        while self.errors and self.errors[0] < now - ERROR_WINDOW:
+            self.errors.popleft()
+        if self.state == "failed":
+            return "unit failed"
+        if len(self.errors) >= ERROR_THRESHOLD:
+            return "{} error lines in {:.0f}s".format(len(self.errors), ERROR_WINDOW)
+        return None
+
+    def may_restart(self, now):
+        while self.restarts and self.restarts[0] < now - BUDGET_WINDOW:
+            self.restarts.popleft()
+        if self.restarts and now - self.restarts[-1] > BACKOFF_RESET:
+            self.backoff = BACKOFF_BASE
+        if now < self.next_allowed:
+            return False
+        if len(self.restarts) >= RESTART_BUDGET:
+            if not self.budget_warned:
+                log("{}: restart budget exhausted ({} in {:.0f}s), leaving it alone".format(
+                    self.unit, RESTART_BUDGET, BUDGET_WINDOW))
+                self.budget_warned = True
+            return False
+        self.budget_warned = False
+        return True
+
+    def restarted(self, now):
+        self.restarts.append(now)
+        self.next_allowed = now + self.backoff
+        self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+        self.grace_until = now + RESTART_GRACE
+        self.errors.clear()
+
+
+class Supervisor:
+    def __init__(self, units_file=DEFAULT_UNITS_FILE, interval=DEFAULT_INTERVAL):
+        self.units_file = units_file
+        self.interval = max(1.0, interval)
+        self.pattern = re.compile(ERROR_PATTERNS, re.IGNORECASE)
+        self.tunnels = {}
+        self._units_mtime = None
+        self._journal = None
+        self._journal_task = None
+        self._stopping = None
+
+    def reload_units(self):
+        """Re-read the units file if it changed; returns True if the unit set changed."""
+        try:
+            mtime = os.stat(self.units_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._units_mtime:
+            return False
+        self._units_mtime = mtime
+        units = read_units(self.units_file)
+        if units == sorted(self.tunnels):
+            return False
+        self.tunnels = {u: self.tunnels.get(u) or TunnelHealth(u) for u in units}
+        log("supervising {} tunnel(s): {}".format(len(units), ", ".join(units) or "-"))
+        return True
+
+    async def poll_states(self):
+        """One `systemctl show` for every supervised unit."""
+        if not self.tunnels:
+            return
+        proc = await asyncio.create_subprocess_exec(
+            "systemctl", "show", "--no-pager", "--property=Id,ActiveState", *sorted(self.tunnels),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+            env={**os.environ, "LANG": "C"})
+        out, _ = await proc.communicate()
+        for props in parse_systemctl_show(out.decode("utf-8", "replace")):
+            t = self.tunnels.get(props.get("Id", ""))
+            if t is not None:
+                t.state = props.get("ActiveState", "unknown")
+
+    async def follow_journal(self, units):
+        """One `journalctl -f` for all supervised units; counts error lines per unit."""
+        args = ["journalctl", "-f", "-n", "0", "-o", "json", "--no-pager"]
+        for u in units:
+            args += ["-u", u]
+        self._journal = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+            env={**os.environ, "LANG": "C"}, limit=JOURNAL_LINE_LIMIT)
+        while True:
+            try:
+                line = await self._journal.stdout.readline()
+            except ValueError:
+                continue  # longer than JOURNAL_LINE_LIMIT: readline discarded it, keep following
+            if not line:
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            t = self.tunnels.get(entry.get("_SYSTEMD_UNIT", ""))
+            msg = entry.get("MESSAGE", "")
+            if isinstance(msg, list):
+                msg = bytes(msg).decode("utf-8", "replace")
+            if t is not None and self.pattern.search(msg):
+                t.add_error(time.monotonic())
+
+    async def restart_journal(self):
+        await self.stop_journal()
+        if self.tunnels:
+            self._journal_task = asyncio.ensure_future(self.follow_journal(sorted(self.tunnels)))
+
+    async def stop_journal(self):
+        if self._journal is not None and self._journal.returncode is None:
+            self._journal.terminate()
+            await self._journal.wait()
+        if self._journal_task is not None:
+            self._journal_task.cancel()
+            try:
+                await self._journal_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._journal = self._journal_task = None
+
+    async def restart(self, t, reason):
+        log("{}: unhealthy ({}), restarting; next restart allowed in {:.0f}s".format(t.unit, reason, t.backoff))
+        t.restarted(time.monotonic())
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "systemctl", "restart", t.unit,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+            _, err = await asyncio.wait_for(proc.communicate(), RESTART_TIMEOUT)
+            if proc.returncode != 0:
+                log("{}: systemctl restart failed: {}".format(t.unit, err.decode("utf-8", "replace").strip()))
+        except (OSError, asyncio.TimeoutError) as e:
+            log("{}: systemctl restart failed: {}".format(t.unit, e))
+
+    async def check(self):
+        if self.reload_units() or (self.tunnels and (self._journal_task is None or self._journal_task.done())):
+            await self.restart_journal()
+        await self.poll_states()
+        now = time.monotonic()
+        actions = []
+        for t in self.tunnels.values():
+            reason = t.unhealthy_reason(now)
+            if reason and t.may_restart(now):
+                actions.append(self.restart(t, reason))
+        if actions:
+            await asyncio.gather(*actions)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stopping.set)
+        log("paqet supervisor started (units file: {})".format(self.units_file))
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await self.check()
+                except Exception as e:
+                    log("check failed: {}".format(e))
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.stop_journal()
+            log("paqet supervisor stopped")
+
+
+def main():
+    units_file = DEFAULT_UNITS_FILE
+    interval = DEFAULT_INTERVAL
+    for i, arg in enumerate(sys.argv[1:]):
+        if arg == "--units-file" and i + 2 < len(sys.argv):
+            units_file = sys.argv[i + 2]
+        elif arg == "--interval" and i + 2 < len(sys.argv):
+            interval = float(sys.argv[i + 2])
+
+    if os.geteuid() != 0:
+        print("Warning: Run as root to restart systemd units", file=sys.stderr)
+
+    asyncio.run(Supervisor(units_file, interval).run())
+
+
+if __name__ == "__main__":
+    main()
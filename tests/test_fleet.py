@@ -0,0 +1,193 @@
+"""Fleet aggregation (/api/fleet) against real dashboard processes on localhost.
+
+Each peer is a paqet-dashboard.py process on an ephemeral port with its own config dir and a stub
+systemctl that reports the units in $STUB_UNITS, so every node has different services.
+Run: python3 -m unittest discover tests  (or pytest)
+"""
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DASHBOARD = os.path.join(ROOT, "paqet-dashboard.py")
+
+STUB_SYSTEMCTL = """#!/bin/sh
+# systemctl show: one block per "name:state" in $STUB_UNITS; everything else succeeds silently
+[ "$1" = show ] || exit 0
+first=1
+for u in $STUB_UNITS; do
+    [ $first = 1 ] || echo
+    first=0
+    echo "Id=paqet-${u%%:*}.service"
+    echo "LoadState=loaded"
+    echo "ActiveState=${u#*:}"
+    echo "SubState=running"
+    echo "MainPID=0"
+    echo "NRestarts=0"
+done
+"""
+
+SERVER_YAML = """role: "server"
+listen:
+  addr: ":9999"
+transport:
+  kcp:
+    mode: "fast"
+"""
+
+CLIENT_YAML = """role: "client"
+server:
+  addr: "10.0.0.1:9999"
+transport:
+  kcp:
+    mode: "fast3"
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_json(port, path):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("GET", path)
+        return json.loads(conn.getresponse().read().decode("utf-8"))
+    finally:
+        conn.close()
+
+
+class FleetTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix="paqet-fleet-")
+        stub_bin = os.path.join(cls.tmp, "bin")
+        os.makedirs(stub_bin)
+        for tool, text in (("systemctl", STUB_SYSTEMCTL), ("journalctl", "#!/bin/sh\n"), ("iptables-save", "#!/bin/sh\n")):
+            path = os.path.join(stub_bin, tool)
+            with open(path, "w") as f:
+                f.write(text)
+            os.chmod(path, 0o755)
+        cls.env = dict(os.environ, PATH=stub_bin + os.pathsep + os.environ.get("PATH", ""),
+                       PAQET_PROBE_INTERVAL="0", PAQET_SOCKET_INTERVAL="0", PAQET_LOG_STATS_INTERVAL="0",
+                       PAQET_FLEET_INTERVAL="1", PAQET_FLEET_TIMEOUT="1")
+        cls.procs = {}
+        cls.ports = {}
+        cls.start("alpha", "srv:active", {"srv.yaml": SERVER_YAML})
+        cls.start("beta", "cli:active extra:failed", {"cli.yaml": CLIENT_YAML})
+        cls.start("gamma", "solo:active", {})
+        cls.fleet_file = os.path.join(cls.tmp, "fleet.list")
+        cls.write_fleet("http://127.0.0.1:{} gamma\n".format(cls.ports["gamma"]))
+        peers = ",".join(["http://127.0.0.1:{} alpha 10.0.0.1".format(cls.ports["alpha"]),
+                          "http://127.0.0.1:{} beta 10.0.0.2".format(cls.ports["beta"])])
+        cls.start("hub", "", {}, PAQET_FLEET_PEERS=peers, PAQET_FLEET_FILE=cls.fleet_file)
+
+    @classmethod
+    def start(cls, name, units, configs, **env):
+        config_dir = os.path.join(cls.tmp, name, "etc")
+        os.makedirs(config_dir)
+        for filename, text in configs.items():
+            with open(os.path.join(config_dir, filename), "w") as f:
+                f.write(text)
+        port = free_port()
+        proc_env = dict(cls.env, STUB_UNITS=units, PAQET_CONFIG_DIR=config_dir,
+                        PAQET_HISTORY_DIR=os.path.join(cls.tmp, name, "lib"), **env)
+        cls.procs[name] = subprocess.Popen(
+            [sys.executable, DASHBOARD, "--port", str(port), "--bind", "127.0.0.1", "--status-interval", "0.5"],
+            env=proc_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        cls.ports[name] = port
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                get_json(port, "/api/status")
+                return
+            except (OSError, ValueError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    @classmethod
+    def write_fleet(cls, text):
+        with open(cls.fleet_file, "w") as f:
+            f.write(text)
+
+    @classmethod
+    def tearDownClass(cls):
+        for proc in reversed(list(cls.procs.values())):  # hub first: it holds connections to the peers
+            if proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                    proc.wait()
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def fleet_until(self, check, timeout=15):
+        """Poll the hub's /api/fleet until check(view) holds; returns that view."""
+        deadline = time.monotonic() + timeout
+        while True:
+            view = get_json(self.ports["hub"], "/api/fleet")
+            if check(view) or time.monotonic() > deadline:
+                return view
+            time.sleep(0.2)
+
+    @staticmethod
+    def nodes(view):
+        return {n["name"]: n for n in view["nodes"] if not n["local"]}
+
+    def test_1_merged_view(self):
+        view = self.fleet_until(lambda v: all(n["ok"] for n in v["nodes"]) and len(v["nodes"]) == 4)
+        self.assertEqual(view["peers"], 3)
+        nodes = self.nodes(view)
+        self.assertEqual(set(nodes), {"alpha", "beta", "gamma"})
+        for node in nodes.values():
+            self.assertTrue(node["ok"], node["error"])
+            self.assertFalse(node["stale"])
+        self.assertEqual([s["unit"] for s in nodes["alpha"]["services"]], ["paqet-srv.service"])
+        beta = {s["unit"]: s["state"] for s in nodes["beta"]["services"]}
+        self.assertEqual(beta, {"paqet-cli.service": "active", "paqet-extra.service": "failed"})
+        self.assertEqual(nodes["alpha"]["config_info"]["srv"]["role"], "server")
+        local = [n for n in view["nodes"] if n["local"]]
+        self.assertEqual(len(local), 1)
+        self.assertEqual(local[0]["services"], [])
+
+        # beta's client points at alpha's server (10.0.0.1:9999) with another KCP mode
+        self.assertEqual(len(view["pairs"]), 1)
+        pair = view["pairs"][0]
+        self.assertEqual(pair["client"], {"node": "beta", "name": "cli", "status": "active"})
+        self.assertEqual(pair["server"], {"node": "alpha", "name": "srv", "status": "active"})
+        self.assertEqual(pair["issues"], ["mode differs: client fast3, server fast"])
+
+    def test_2_peer_down(self):
+        self.fleet_until(lambda v: self.nodes(v).get("gamma", {}).get("ok"))
+        self.procs["gamma"].kill()  # a crashed peer: connections reset, port closed
+        self.procs["gamma"].wait(5)
+        view = self.fleet_until(lambda v: not self.nodes(v)["gamma"]["ok"])
+        nodes = self.nodes(view)
+        self.assertFalse(nodes["gamma"]["ok"])
+        self.assertTrue(nodes["gamma"]["error"])
+        # the last services it reported are kept, the others are unaffected
+        self.assertEqual([s["unit"] for s in nodes["gamma"]["services"]], ["paqet-solo.service"])
+        self.assertTrue(nodes["alpha"]["ok"])
+        self.assertTrue(nodes["beta"]["ok"])
+
+    def test_3_peer_removed(self):
+        self.write_fleet("")
+        view = self.fleet_until(lambda v: "gamma" not in self.nodes(v))
+        self.assertEqual(set(self.nodes(view)), {"alpha", "beta"})
+        self.assertEqual(view["peers"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
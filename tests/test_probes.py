@@ -0,0 +1,212 @@
+"""Forward prober (probe_tcp, probe_udp, Prober, LatencyHistogram) against local echo servers.
+Run: python3 -m unittest discover tests  (or pytest)
+"""
+import asyncio
+import importlib.util
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix="paqet-probes-")
+os.environ["PAQET_CONFIG_DIR"] = TMP
+os.environ["PAQET_HISTORY_DIR"] = TMP
+_spec = importlib.util.spec_from_file_location("paqet_dashboard", os.path.join(ROOT, "paqet-dashboard.py"))
+dashboard = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(dashboard)
+
+
+def tearDownModule():
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+def serve(sock, handle):
+    threading.Thread(target=handle, args=(sock,), daemon=True).start()
+    return sock.getsockname()[1]
+
+
+def tcp_server(on_accept):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+
+    def loop(s):
+        while True:
+            try:
+                conn, _ = s.accept()
+            except OSError:
+                return
+            threading.Thread(target=on_accept, args=(conn,), daemon=True).start()
+    return sock, serve(sock, loop)
+
+
+def echo_tcp(conn):
+    with conn:
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                return
+            conn.sendall(data)
+
+
+def udp_server(reply):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+
+    def loop(s):
+        while True:
+            try:
+                data, addr = s.recvfrom(2048)
+            except OSError:
+                return
+            if reply:
+                s.sendto(data, addr)
+    return sock, serve(sock, loop)
+
+
+def closed_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_buckets_and_percentiles(self):
+        h = dashboard.LatencyHistogram(bounds=(1, 2, 5, 10))
+        for ms in (0.5, 1, 1.5, 2, 3, 4, 6, 7, 8, 20):
+            h.add(ms)
+        # bucket i counts values <= bounds[i]; the last one is everything above
+        self.assertEqual(h.counts, [2, 2, 2, 3, 1])
+        self.assertEqual(h.percentile(0.50), 5)
+        self.assertEqual(h.percentile(0.90), 10)
+        self.assertEqual(h.percentile(0.99), 10)  # overflow reported as the top bound
+        self.assertEqual(h.percentile(0.10), 1)
+
+    def test_summary_counts_failures_apart_from_no_reply(self):
+        h = dashboard.LatencyHistogram(bounds=(1, 2))
+        self.assertIsNone(h.summary()["p50_ms"])
+        h.add(0.5)
+        h.failures += 1
+        h.no_reply += 2
+        s = h.summary()
+        self.assertEqual((s["probes"], s["ok"], s["failures"], s["no_reply"]), (4, 1, 1, 2))
+        self.assertEqual(s["failure_rate"], 0.5)
+
+    def test_merged(self):
+        a, b = dashboard.LatencyHistogram(bounds=(1, 2)), dashboard.LatencyHistogram(bounds=(1, 2))
+        a.add(0.5)
+        b.add(1.5)
+        b.add(3)
+        b.failures = 1
+        m = a.merged(b)
+        self.assertEqual((m.counts, m.ok, m.failures), ([1, 1, 1], 3, 1))
+        self.assertEqual(a.counts, [1, 0, 0])
+
+
+class ProbeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.socks = []
+
+    def tearDown(self):
+        for s in self.socks:
+            s.close()
+
+    def keep(self, pair):
+        self.socks.append(pair[0])
+        return pair[1]
+
+    def test_tcp_echo(self):
+        port = self.keep(tcp_server(echo_tcp))
+        ms, err = asyncio.run(dashboard.probe_tcp("127.0.0.1", port, timeout=2, hold=0.05))
+        self.assertIsNone(err)
+        self.assertGreaterEqual(ms, 0)
+        self.assertLess(ms, 1000)
+
+    def test_tcp_closed_by_tunnel(self):
+        port = self.keep(tcp_server(lambda conn: conn.close()))
+        ms, err = asyncio.run(dashboard.probe_tcp("127.0.0.1", port, timeout=2, hold=1))
+        self.assertEqual(err, "closed by tunnel")
+        self.assertIsNotNone(ms)
+
+    def test_tcp_refused(self):
+        ms, err = asyncio.run(dashboard.probe_tcp("127.0.0.1", closed_port(), timeout=2))
+        self.assertIsNone(ms)
+        self.assertTrue(err)
+        self.assertNotEqual(err, "connect timeout")
+
+    def test_tcp_connect_timeout(self):
+        # A listener that never accepts: once its accept queue is full, further SYNs are dropped.
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(0)
+        self.socks.append(sock)
+        for _ in range(4):
+            filler = socket.socket()
+            filler.setblocking(False)
+            try:
+                filler.connect(sock.getsockname())
+            except BlockingIOError:
+                pass
+            self.socks.append(filler)
+        ms, err = asyncio.run(dashboard.probe_tcp("127.0.0.1", sock.getsockname()[1], timeout=0.3))
+        self.assertEqual((ms, err), (None, "connect timeout"))
+
+    def test_udp_echo(self):
+        port = self.keep(udp_server(reply=True))
+        ms, err = asyncio.run(dashboard.probe_udp("127.0.0.1", port, timeout=2))
+        self.assertIsNone(err)
+        self.assertLess(ms, 1000)
+
+    def test_udp_no_reply(self):
+        port = self.keep(udp_server(reply=False))
+        self.assertEqual(asyncio.run(dashboard.probe_udp("127.0.0.1", port, timeout=0.2)), (None, "no reply"))
+
+    def test_udp_refused(self):
+        ms, err = asyncio.run(dashboard.probe_udp("127.0.0.1", closed_port(socket.SOCK_DGRAM), timeout=1))
+        self.assertEqual((ms, err), (None, "Connection refused"))  # ICMP port unreachable
+
+
+class ProberTest(unittest.TestCase):
+
+    def test_round_records_histograms_per_forward(self):
+        socks = [tcp_server(echo_tcp), udp_server(reply=True), udp_server(reply=False)]
+        try:
+            tcp, udp, mute = (p for _, p in socks)
+            refused = closed_port()
+            configs = {
+                "c1": {"role": "client", "forward_tcp": [tcp, refused], "forward_udp": [udp, mute]},
+                "s1": {"role": "server", "forward_tcp": [tcp]},
+            }
+            targets = dashboard.probe_targets(configs)
+            self.assertEqual(len(targets), 4)  # server configs are not probed
+            prober = dashboard.Prober(interval=0, concurrency=4, timeout=0.3)
+            for _ in range(3):
+                asyncio.run(prober.run_round(targets))
+            snap = prober.snapshot()
+        finally:
+            for s, _ in socks:
+                s.close()
+        forwards = snap["tunnels"]["c1"]["forwards"]
+        self.assertEqual(set(forwards), {"tcp/{}".format(tcp), "tcp/{}".format(refused),
+                                         "udp/{}".format(udp), "udp/{}".format(mute)})
+        ok = forwards["tcp/{}".format(tcp)]
+        self.assertEqual((ok["probes"], ok["ok"], ok["failures"]), (3, 3, 0))
+        self.assertIsNotNone(ok["p50_ms"])
+        self.assertLessEqual(ok["p50_ms"], ok["p99_ms"])
+        self.assertIsNone(ok["last"]["error"])
+        bad = forwards["tcp/{}".format(refused)]
+        self.assertEqual((bad["ok"], bad["failures"], bad["failure_rate"], bad["p50_ms"]), (0, 3, 1.0, None))
+        self.assertTrue(bad["last"]["error"])
+        self.assertEqual(forwards["udp/{}".format(udp)]["ok"], 3)
+        self.assertEqual(forwards["udp/{}".format(mute)]["no_reply"], 3)
+        total = snap["tunnels"]["c1"]["total"]
+        self.assertEqual((total["ok"], total["failures"], total["no_reply"]), (6, 3, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()